@@ -1,63 +1,221 @@
 import aiosqlite
 import json
+import time
+from collections import Counter
+
+from utils.executor import executor
 
 DB_PATH = "bot.db"
 
+# Сколько секунд соединение ждёт снятия блокировки записи другим процессом (busy_timeout)
+DB_TIMEOUT = 30.0
+
+# JSON длиннее этого числа символов разбирается в пуле потоков, а не в цикле событий
+JSON_OFFLOAD_SIZE = 64 * 1024
+
+# Счётчики обращений к базе: "reads" и "writes" (для бенчмарков и метрик)
+db_stats = Counter()
+
+# Кэш списка разрешённых пользователей (сбрасывается при изменении списка)
+_allowed_users: list[int] | None = None
+_allowed_users_loaded_at = 0.0
+
+async def _loads(text: str):
+    if len(text) > JSON_OFFLOAD_SIZE:
+        return await executor.run_io(json.loads, text)
+    return json.loads(text)
+
+def connect() -> aiosqlite.Connection:
+    """Открывает соединение с базой бота."""
+    return aiosqlite.connect(DB_PATH, timeout=DB_TIMEOUT)
+
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
+        # WAL: читатели не ждут писателя, несколько процессов (шардов) работают с одной базой
+        await db.execute("PRAGMA journal_mode=WAL")
         await db.execute("""
             CREATE TABLE IF NOT EXISTS configs (
                 user_id INTEGER PRIMARY KEY,
-                config TEXT NOT NULL
+                config TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
             )
         """)
+        # Миграция старых баз без колонки версии
+        async with db.execute("PRAGMA table_info(configs)") as cursor:
+            columns = [row[1] async for row in cursor]
+        if "version" not in columns:
+            await db.execute("ALTER TABLE configs ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
         await db.execute("""
             CREATE TABLE IF NOT EXISTS allowed_users (
                 user_id INTEGER PRIMARY KEY
             )
         """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_updated_at ON fsm (updated_at)")
+        # Покупки по токенам пула: транзакции дополнительных ботов не видны в транзакциях основного
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS spend_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                token INTEGER NOT NULL,
+                gift_id TEXT NOT NULL,
+                amount INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_spend_ledger_user ON spend_ledger (user_id, token)")
         await db.commit()
 
-async def save_config(config: dict, user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR REPLACE INTO configs (user_id, config) VALUES (?, ?)",
-            (user_id, json.dumps(config))
-        )
+async def save_config(config: dict | str, user_id: int, expected_version: int | None = None) -> int | None:
+    """
+    Сохраняет конфиг (словарь или уже сериализованный JSON) и возвращает его новую версию.
+    С expected_version запись условная (compare-and-set): конфиг сохраняется, только если его версия
+    в базе всё ещё равна expected_version (0 — конфиг ещё не сохранялся), иначе возвращается None.
+    """
+    db_stats["writes"] += 1
+    data = config if isinstance(config, str) else json.dumps(config)
+    async with connect() as db:
+        if expected_version is None:
+            query = """
+                INSERT INTO configs (user_id, config, version) VALUES (?, ?, 1)
+                ON CONFLICT(user_id) DO UPDATE SET config = excluded.config, version = configs.version + 1
+                RETURNING version
+            """
+            params = (user_id, data)
+        elif expected_version == 0:
+            query = "INSERT INTO configs (user_id, config, version) VALUES (?, ?, 1) ON CONFLICT(user_id) DO NOTHING RETURNING version"
+            params = (user_id, data)
+        else:
+            query = "UPDATE configs SET config = ?, version = version + 1 WHERE user_id = ? AND version = ? RETURNING version"
+            params = (data, user_id, expected_version)
+        async with db.execute(query, params) as cursor:
+            row = await cursor.fetchone()
         await db.commit()
+        return row[0] if row else None
 
 async def load_config(user_id: int) -> dict:
+    config, _ = await load_config_versioned(user_id)
+    return config
+
+async def load_config_versioned(user_id: int) -> tuple[dict, int]:
+    """Загружает конфиг вместе с его версией (0 — конфиг ещё не сохранялся)."""
+    config, version, _ = await load_config_record(user_id)
+    return config, version
+
+async def load_config_record(user_id: int) -> tuple[dict, int, str | None]:
+    """
+    Загружает конфиг, его версию и исходный JSON из базы.
+    Для ещё не сохранённого конфига возвращается конфиг по умолчанию, версия 0 и None вместо JSON.
+    """
     from services.config import DEFAULT_CONFIG  # Ленивый импорт
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT config FROM configs WHERE user_id = ?", (user_id,)) as cursor:
+    db_stats["reads"] += 1
+    async with connect() as db:
+        async with db.execute("SELECT config, version FROM configs WHERE user_id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
             if row:
-                return json.loads(row[0])
-            return DEFAULT_CONFIG(user_id)
+                return await _loads(row[0]), row[1], row[0]
+            return DEFAULT_CONFIG(user_id), 0, None
 
 async def ensure_config(user_id: int):
     from services.config import DEFAULT_CONFIG  # Ленивый импорт
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         async with db.execute("SELECT user_id FROM configs WHERE user_id = ?", (user_id,)) as cursor:
             if not await cursor.fetchone():
-                await save_config(DEFAULT_CONFIG(user_id), user_id)
+                # Условная запись: если конфиг тем временем создал другой процесс, он не затирается
+                await save_config(DEFAULT_CONFIG(user_id), user_id, expected_version=0)
 
 async def get_all_user_ids():
-    async with aiosqlite.connect(DB_PATH) as db:
+    db_stats["reads"] += 1
+    async with connect() as db:
         async with db.execute("SELECT user_id FROM configs") as cursor:
             return [row[0] async for row in cursor]
 
 async def add_allowed_user(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    global _allowed_users
+    db_stats["writes"] += 1
+    async with connect() as db:
         await db.execute("INSERT OR IGNORE INTO allowed_users (user_id) VALUES (?)", (user_id,))
         await db.commit()
+    _allowed_users = None
 
-async def get_allowed_users():
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT user_id FROM allowed_users") as cursor:
-            return [row[0] async for row in cursor]
+async def get_allowed_users(max_age: float | None = None):
+    """
+    Список разрешённых пользователей из кэша. max_age — через сколько секунд перечитывать список
+    из базы: нужно шардам, где список меняет другой процесс и сброс кэша сюда не доходит.
+    """
+    global _allowed_users, _allowed_users_loaded_at
+    expired = max_age is not None and time.monotonic() - _allowed_users_loaded_at > max_age
+    if _allowed_users is None or expired:
+        db_stats["reads"] += 1
+        async with connect() as db:
+            async with db.execute("SELECT user_id FROM allowed_users") as cursor:
+                _allowed_users = [row[0] async for row in cursor]
+        _allowed_users_loaded_at = time.monotonic()
+    return list(_allowed_users)
 
 async def remove_allowed_user(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    global _allowed_users
+    db_stats["writes"] += 1
+    async with connect() as db:
         await db.execute("DELETE FROM allowed_users WHERE user_id = ?", (user_id,))
-        await db.commit()
\ No newline at end of file
+        await db.commit()
+    _allowed_users = None
+
+async def record_spend(user_id: int, token: int, gift_id: str, amount: int):
+    """Записывает покупку подарка в журнал трат: token — номер токена пула (0 — основной бот)."""
+    db_stats["writes"] += 1
+    async with connect() as db:
+        await db.execute(
+            "INSERT INTO spend_ledger (user_id, token, gift_id, amount, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, token, gift_id, amount, time.time())
+        )
+        await db.commit()
+
+async def get_pool_spent(user_id: int) -> int:
+    """Сумма покупок пользователя через дополнительные токены пула (кроме основного бота)."""
+    db_stats["reads"] += 1
+    async with connect() as db:
+        async with db.execute("SELECT COALESCE(SUM(amount), 0) FROM spend_ledger WHERE user_id = ? AND token > 0", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+            return row[0]
+
+async def load_fsm(key: str) -> tuple[str | None, dict, float] | None:
+    """Загружает состояние FSM, данные и время последнего изменения (None — записи нет)."""
+    db_stats["reads"] += 1
+    async with connect() as db:
+        async with db.execute("SELECT state, data, updated_at FROM fsm WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return row[0], await _loads(row[1]), row[2]
+            return None
+
+async def save_fsm(key: str, state: str | None, data: dict, updated_at: float):
+    """Сохраняет запись FSM; пустое состояние без данных удаляется."""
+    db_stats["writes"] += 1
+    async with connect() as db:
+        if state is None and not data:
+            await db.execute("DELETE FROM fsm WHERE key = ?", (key,))
+        else:
+            await db.execute(
+                """
+                INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                """,
+                (key, state, json.dumps(data, ensure_ascii=False), updated_at)
+            )
+        await db.commit()
+
+async def delete_expired_fsm(before: float) -> int:
+    """Удаляет записи FSM, не изменявшиеся с момента before. Возвращает число удалённых записей."""
+    db_stats["writes"] += 1
+    async with connect() as db:
+        cursor = await db.execute("DELETE FROM fsm WHERE updated_at < ?", (before,))
+        await db.commit()
+        return cursor.rowcount
@@ -1,5 +1,4 @@
 # --- Стандартные библиотеки ---
-import asyncio
 import logging
 
 # --- Сторонние библиотеки ---
@@ -10,16 +9,21 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest
 
 # --- Внутренние модули ---
-from services.config import get_target_display_local
+from services.config import get_target_display_local, CATALOG_PAGE_SIZE
 from services.menu import update_menu
-from services.gifts import get_filtered_gifts
-from services.buy import buy_gift
+from services.gifts import get_catalog_snapshot
+from services.buy import buy_gifts_bulk
 from services.balance import refresh_balance
+from services.chats import resolve_chat
+from utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
 wizard_router = Router()
 
+# Отрисованные страницы каталога: версия каталога -> список клавиатур (общие для всех пользователей)
+_catalog_pages = LRUCache(maxsize=4)
+
 class CatalogFSM(StatesGroup):
     """
     Состояния для FSM каталога подарков.
@@ -29,40 +33,72 @@ class CatalogFSM(StatesGroup):
     waiting_recipient = State()
     waiting_confirm = State()
 
-def gifts_catalog_keyboard(gifts: list[dict]) -> InlineKeyboardMarkup:
+def gifts_catalog_keyboard(gifts: list[dict], version: str, page: int = 0) -> InlineKeyboardMarkup:
     """
-    Формирует клавиатуру для каталога подарков.
-    Каждый подарок — отдельная кнопка, плюс кнопка возврата в меню.
+    Возвращает клавиатуру страницы каталога подарков.
+    Страницы отрисовываются один раз для каждой версии каталога и общие для всех пользователей.
 
     Args:
         gifts: Список словарей с данными о подарках.
+        version: Версия каталога.
+        page: Номер страницы (начинается с 0).
 
     Returns:
-        InlineKeyboardMarkup: Клавиатура с кнопками подарков.
-    """
-    keyboard = []
-    for gift in gifts:
-        if gift['supply'] is None:
-            btn = InlineKeyboardButton(
-                text=f"{gift['emoji']} — ★{gift['price']:,}",
-                callback_data=f"catalog_gift_{gift['id']}"
-            )
-        else:
-            btn = InlineKeyboardButton(
-                text=f"{gift['left']:,} из {gift['supply']:,} — ★{gift['price']:,}",
-                callback_data=f"catalog_gift_{gift['id']}"
-            )
-        keyboard.append([btn])
+        InlineKeyboardMarkup: Клавиатура страницы с кнопками подарков.
+    """
+    pages = _catalog_pages.get(version)
+    if pages is None:
+        pages = render_catalog_pages(gifts)
+        _catalog_pages.set(version, pages)
+    return pages[max(0, min(page, len(pages) - 1))]
 
-    # Кнопка для возврата в главное меню
-    keyboard.append([
-        InlineKeyboardButton(
-            text="☰ Вернуться в меню",
-            callback_data="catalog_main_menu"
-        )
-    ])
+def render_catalog_pages(gifts: list[dict]) -> list[InlineKeyboardMarkup]:
+    """
+    Формирует клавиатуры всех страниц каталога.
+    На каждой странице — до CATALOG_PAGE_SIZE подарков, кнопки перелистывания и кнопка возврата в меню.
 
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    Args:
+        gifts: Список словарей с данными о подарках.
+
+    Returns:
+        list[InlineKeyboardMarkup]: Клавиатуры страниц каталога.
+    """
+    total_pages = max(1, (len(gifts) + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE)
+    pages = []
+    for page in range(total_pages):
+        keyboard = []
+        for gift in gifts[page * CATALOG_PAGE_SIZE:(page + 1) * CATALOG_PAGE_SIZE]:
+            if gift['supply'] is None:
+                btn = InlineKeyboardButton(
+                    text=f"{gift['emoji']} — ★{gift['price']:,}",
+                    callback_data=f"catalog_gift_{gift['id']}"
+                )
+            else:
+                btn = InlineKeyboardButton(
+                    text=f"{gift['left']:,} из {gift['supply']:,} — ★{gift['price']:,}",
+                    callback_data=f"catalog_gift_{gift['id']}"
+                )
+            keyboard.append([btn])
+
+        # Перелистывание страниц
+        if total_pages > 1:
+            nav = []
+            if page > 0:
+                nav.append(InlineKeyboardButton(text="◀️", callback_data=f"catalog_page_{page - 1}"))
+            nav.append(InlineKeyboardButton(text=f"{page + 1}/{total_pages}", callback_data="catalog_noop"))
+            if page < total_pages - 1:
+                nav.append(InlineKeyboardButton(text="▶️", callback_data=f"catalog_page_{page + 1}"))
+            keyboard.append(nav)
+
+        # Кнопка для возврата в главное меню
+        keyboard.append([
+            InlineKeyboardButton(
+                text="☰ Вернуться в меню",
+                callback_data="catalog_main_menu"
+            )
+        ])
+        pages.append(InlineKeyboardMarkup(inline_keyboard=keyboard))
+    return pages
 
 @wizard_router.callback_query(F.data == "catalog")
 async def catalog(call: CallbackQuery, state: FSMContext) -> None:
@@ -74,29 +110,59 @@ async def catalog(call: CallbackQuery, state: FSMContext) -> None:
         state: Контекст FSM.
     """
     user_id = call.from_user.id
-    logger.info(f"Открытие каталога для user_id={user_id}")
-    gifts = await get_filtered_gifts(
-        bot=call.bot,
-        min_price=0,
-        max_price=1000000,
-        min_supply=0,
-        max_supply=100000000,
-        unlimited=True
-    )
+    logger.info("Открытие каталога для user_id=%s", user_id)
+    snapshot = await get_catalog_snapshot(call.bot)
 
-    # Сохраняем текущий каталог в FSM — нужен для последующих шагов
-    await state.update_data(gifts_catalog=gifts)
-
-    gifts_limited = [g for g in gifts if g['supply'] is not None]
-    gifts_unlimited = [g for g in gifts if g['supply'] is None]
+    # В FSM храним только версию снимка — сам каталог общий для всех пользователей
+    await state.update_data(catalog_version=snapshot.version)
 
     await call.message.answer(
-        f"🧸 Обычных подарков: <b>{len(gifts_unlimited)}</b>\n"
-        f"👜 Уникальных подарков: <b>{len(gifts_limited)}</b>\n",
-        reply_markup=gifts_catalog_keyboard(gifts)
+        f"🧸 Обычных подарков: <b>{snapshot.unlimited_count}</b>\n"
+        f"👜 Уникальных подарков: <b>{snapshot.limited_count}</b>\n",
+        reply_markup=gifts_catalog_keyboard(snapshot.gifts, snapshot.version)
     )
     await call.answer()
 
+@wizard_router.callback_query(F.data.startswith("catalog_page_"))
+async def on_catalog_page(call: CallbackQuery, state: FSMContext) -> None:
+    """
+    Перелистывание страниц каталога подарков.
+    Если каталог успел обновиться, показывается страница актуального снимка.
+
+    Args:
+        call: Callback-запрос.
+        state: Контекст FSM.
+    """
+    user_id = call.from_user.id
+    page = int(call.data.split("_")[-1])
+    data = await state.get_data()
+    if "catalog_version" not in data:
+        logger.warning("Каталог устарел для user_id=%s", user_id)
+        await call.answer("🚫 Каталог устарел. Откройте заново.", show_alert=True)
+        await safe_edit_text(call.message, "🚫 Каталог устарел. Откройте заново.", reply_markup=None)
+        return
+    snapshot = await get_catalog_snapshot(call.bot)
+    if snapshot.version != data["catalog_version"]:
+        await state.update_data(catalog_version=snapshot.version)
+    try:
+        await call.message.edit_reply_markup(
+            reply_markup=gifts_catalog_keyboard(snapshot.gifts, snapshot.version, page)
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await call.answer()
+
+@wizard_router.callback_query(F.data == "catalog_noop")
+async def on_catalog_noop(call: CallbackQuery) -> None:
+    """
+    Нажатие на номер страницы каталога — ничего не делает.
+
+    Args:
+        call: Callback-запрос.
+    """
+    await call.answer()
+
 @wizard_router.callback_query(F.data == "catalog_main_menu")
 async def start_callback(call: CallbackQuery, state: FSMContext) -> None:
     """
@@ -108,7 +174,7 @@ async def start_callback(call: CallbackQuery, state: FSMContext) -> None:
         state: Контекст FSM.
     """
     user_id = call.from_user.id
-    logger.info(f"Возврат в главное меню для user_id={user_id}")
+    logger.info("Возврат в главное меню для user_id=%s", user_id)
     await state.clear()
     await call.answer()
     await safe_edit_text(call.message, "🚫 Каталог закрыт.", reply_markup=None)
@@ -132,22 +198,25 @@ async def on_gift_selected(call: CallbackQuery, state: FSMContext) -> None:
     user_id = call.from_user.id
     gift_id = call.data.split("_")[-1]
     data = await state.get_data()
-    gifts = data.get("gifts_catalog", [])
-    if not gifts:
-        logger.warning(f"Каталог устарел для user_id={user_id}")
+    if "catalog_version" not in data:
+        logger.warning("Каталог устарел для user_id=%s", user_id)
         await call.answer("🚫 Каталог устарел. Откройте заново.", show_alert=True)
         await safe_edit_text(call.message, "🚫 Каталог устарел. Откройте заново.", reply_markup=None)
         return
-    gift = next((g for g in gifts if str(g['id']) == gift_id), None)
+    snapshot = await get_catalog_snapshot(call.bot)
+    gift = snapshot.by_id.get(gift_id)
     if not gift:
-        logger.warning(f"Подарок {gift_id} не найден для user_id={user_id}")
+        logger.warning("Подарок %s не найден для user_id=%s", gift_id, user_id)
         await call.answer("🚫 Подарок не найден.", show_alert=True)
         return
 
     gift_display = f"{gift['left']:,} из {gift['supply']:,}" if gift.get("supply") is not None else gift.get("emoji")
+    # Каталог мог обновиться после показа страницы — цену подтверждаем по текущему снимку
+    notice = "⚠️ Каталог обновился, проверьте цену.\n" if snapshot.version != data["catalog_version"] else ""
 
-    await state.update_data(selected_gift=gift)
+    await state.update_data(selected_gift_id=gift_id, selected_price=gift["price"], catalog_version=snapshot.version)
     await call.message.edit_text(
+        f"{notice}"
         f"🎯 Вы выбрали: <b>{gift_display}</b> за ★{gift['price']}\n"
         f"🎁 Введите <b>количество</b> для покупки:\n\n"
         f"/cancel - для отмены",
@@ -155,7 +224,7 @@ async def on_gift_selected(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(CatalogFSM.waiting_quantity)
     await call.answer()
-    logger.info(f"Выбран подарок {gift_id} для user_id={user_id}")
+    logger.info("Выбран подарок %s для user_id=%s", gift_id, user_id)
 
 @wizard_router.message(CatalogFSM.waiting_quantity)
 async def on_quantity_entered(message: Message, state: FSMContext) -> None:
@@ -176,7 +245,7 @@ async def on_quantity_entered(message: Message, state: FSMContext) -> None:
         if qty <= 0:
             raise ValueError
     except Exception:
-        logger.warning(f"Некорректное количество для user_id={user_id}: {message.text}")
+        logger.warning("Некорректное количество для user_id=%s: %s", user_id, message.text)
         await message.answer("🚫 Введите целое положительное число!")
         return
 
@@ -189,7 +258,45 @@ async def on_quantity_entered(message: Message, state: FSMContext) -> None:
         "/cancel — отменить"
     )
     await state.set_state(CatalogFSM.waiting_recipient)
-    logger.info(f"Введено количество {qty} для user_id={user_id}")
+    logger.info("Введено количество %s для user_id=%s", qty, user_id)
+
+def confirm_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_purchase"),
+                InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_purchase"),
+            ]
+        ]
+    )
+
+def confirm_text(gift: dict, qty: int, recipient_display: str, previous_price: int | None = None) -> str:
+    """
+    Текст подтверждения покупки. Если цена отличается от previous_price (цены, которую пользователь
+    видел раньше), об этом пишется отдельной строкой.
+
+    Args:
+        gift: Подарок из снимка каталога.
+        qty: Количество.
+        recipient_display: Получатель для отображения.
+        previous_price: Цена, показанная пользователю ранее (опционально).
+
+    Returns:
+        str: Текст сообщения.
+    """
+    price = gift["price"]
+    gift_display = f"{gift['left']:,} из {gift['supply']:,}" if gift.get("supply") is not None else gift.get("emoji")
+    notice = ""
+    if previous_price is not None and previous_price != price:
+        notice = f"⚠️ <b>Цена изменилась:</b> было ★{previous_price:,}, стало ★{price:,}\n\n"
+    return (
+        f"{notice}"
+        f"📦 Подарок: <b>{gift_display}</b>\n"
+        f"🎁 Количество: <b>{qty}</b>\n"
+        f"💵 Цена подарка: <b>★{price:,}</b>\n"
+        f"💰 Общая сумма: <b>★{price * qty:,}</b>\n"
+        f"👤 Получатель: {recipient_display}"
+    )
 
 @wizard_router.message(CatalogFSM.waiting_recipient)
 async def on_recipient_entered(message: Message, state: FSMContext) -> None:
@@ -206,13 +313,18 @@ async def on_recipient_entered(message: Message, state: FSMContext) -> None:
 
     user_input = message.text.strip()
     if user_input.startswith("@"):
+        chat = await resolve_chat(message.bot, user_input)
+        if not chat or chat["type"] != "channel":
+            logger.warning("Некорректный username канала для user_id=%s: %s", user_id, user_input)
+            await message.answer("🚫 Вы указали неправильный <b>username канала</b>. Попробуйте ещё раз.")
+            return
         target_chat_id = user_input
         target_user_id = None
     elif user_input.isdigit():
         target_chat_id = None
         target_user_id = int(user_input)
     else:
-        logger.warning(f"Некорректный получатель для user_id={user_id}: {user_input}")
+        logger.warning("Некорректный получатель для user_id=%s: %s", user_id, user_input)
         await message.answer(
             "🚫 Если получатель аккаунт — введите ID, если канал — username с @. Попробуйте ещё раз."
         )
@@ -224,32 +336,22 @@ async def on_recipient_entered(message: Message, state: FSMContext) -> None:
     )
 
     data = await state.get_data()
-    gift = data["selected_gift"]
-    qty = data["selected_qty"]
-    price = gift.get("price")
-    total = price * qty
-
-    gift_display = f"{gift['left']:,} из {gift['supply']:,}" if gift.get("supply") is not None else gift.get("emoji")
-
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_purchase"),
-                InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_purchase"),
-            ]
-        ]
-    )
+    snapshot = await get_catalog_snapshot(message.bot)
+    gift = snapshot.by_id.get(data.get("selected_gift_id"))
+    if not gift:
+        logger.warning("Подарок %s больше не доступен для user_id=%s", data.get('selected_gift_id'), user_id)
+        await state.clear()
+        await message.answer("🚫 Подарок больше не доступен. Откройте каталог заново.")
+        await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=user_id, message_id=message.message_id)
+        return
+    await state.update_data(selected_price=gift["price"])
     recipient_display = get_target_display_local(target_user_id, target_chat_id, message.from_user.id)
     await message.answer(
-        f"📦 Подарок: <b>{gift_display}</b>\n"
-        f"🎁 Количество: <b>{qty}</b>\n"
-        f"💵 Цена подарка: <b>★{price:,}</b>\n"
-        f"💰 Общая сумма: <b>★{total:,}</b>\n"
-        f"👤 Получатель: {recipient_display}",
-        reply_markup=kb
+        confirm_text(gift, data["selected_qty"], recipient_display, data.get("selected_price")),
+        reply_markup=confirm_keyboard()
     )
     await state.set_state(CatalogFSM.waiting_confirm)
-    logger.info(f"Введён получатель {recipient_display} для user_id={user_id}")
+    logger.info("Введён получатель %s для user_id=%s", recipient_display, user_id)
 
 @wizard_router.callback_query(F.data == "confirm_purchase")
 async def confirm_purchase(call: CallbackQuery, state: FSMContext) -> None:
@@ -262,12 +364,31 @@ async def confirm_purchase(call: CallbackQuery, state: FSMContext) -> None:
     """
     user_id = call.from_user.id
     data = await state.get_data()
-    gift = data.get("selected_gift")
+    snapshot = await get_catalog_snapshot(call.bot)
+    gift = snapshot.by_id.get(data.get("selected_gift_id"))
     if not gift:
-        logger.warning(f"Запрос на покупку не актуален для user_id={user_id}")
+        logger.warning("Запрос на покупку не актуален для user_id=%s", user_id)
         await call.answer("🚫 Запрос на покупку не актуален. Пожалуйста, попробуйте снова.", show_alert=True)
         await safe_edit_text(call.message, "🚫 Запрос на покупку не актуален. Пожалуйста, попробуйте снова.", reply_markup=None)
         return
+    if gift["price"] != data.get("selected_price"):
+        # Цена изменилась после подтверждения суммы — показываем новую и просим подтвердить ещё раз
+        logger.warning(
+            "Цена подарка %s изменилась для user_id=%s: %s -> %s",
+            gift["id"], user_id, data.get("selected_price"), gift["price"]
+        )
+        await state.update_data(selected_price=gift["price"], catalog_version=snapshot.version)
+        recipient_display = get_target_display_local(data.get("target_user_id"), data.get("target_chat_id"), user_id)
+        await call.answer("⚠️ Цена подарка изменилась. Подтвердите покупку по новой цене.", show_alert=True)
+        await safe_edit_text(
+            call.message,
+            confirm_text(gift, data["selected_qty"], recipient_display, data.get("selected_price")),
+            reply_markup=confirm_keyboard()
+        )
+        return
+    # Сразу закрываем запрос, чтобы повторное нажатие не запустило вторую покупку
+    await state.clear()
+    await call.answer()
     await call.message.edit_text(text="⏳ Выполняется покупка подарков...", reply_markup=None)
     gift_id = gift.get("id")
     gift_price = gift.get("price")
@@ -276,23 +397,23 @@ async def confirm_purchase(call: CallbackQuery, state: FSMContext) -> None:
     target_chat_id = data.get("target_chat_id")
     gift_display = f"{gift['left']:,} из {gift['supply']:,}" if gift.get("supply") is not None else gift.get("emoji")
 
-    bought = 0
-    while bought < qty:
-        success = await buy_gift(
-            bot=call.bot,
-            env_user_id=user_id,
-            gift_id=gift_id,
-            user_id=target_user_id,
-            chat_id=target_chat_id,
-            gift_price=gift_price,
-            file_id=None
+    async def show_progress(bought: int, total: int) -> None:
+        await safe_edit_text(
+            call.message,
+            f"⏳ Выполняется покупка подарков...\n"
+            f"🎁 Куплено: <b>{bought}</b> из <b>{total}</b>"
         )
 
-        if not success:
-            break
-
-        bought += 1
-        await asyncio.sleep(0.3)
+    bought = await buy_gifts_bulk(
+        bot=call.bot,
+        env_user_id=user_id,
+        gift_id=gift_id,
+        user_id=target_user_id,
+        chat_id=target_chat_id,
+        gift_price=gift_price,
+        qty=qty,
+        progress_func=show_progress
+    )
 
     if bought == qty:
         await call.message.answer(
@@ -300,7 +421,7 @@ async def confirm_purchase(call: CallbackQuery, state: FSMContext) -> None:
             f"🎁 Куплено подарков: <b>{bought}</b> из <b>{qty}</b>\n"
             f"👤 Получатель: {get_target_display_local(target_user_id, target_chat_id, user_id)}"
         )
-        logger.info(f"Успешная покупка {bought}/{qty} подарков {gift_id} для user_id={user_id}")
+        logger.info("Успешная покупка %s/%s подарков %s для user_id=%s", bought, qty, gift_id, user_id)
     else:
         await call.message.answer(
             f"⚠️ Покупка <b>{gift_display}</b> остановлена.\n"
@@ -310,10 +431,8 @@ async def confirm_purchase(call: CallbackQuery, state: FSMContext) -> None:
             f"📦 Проверьте доступность подарка!\n"
             f"🚦 Статус изменён на 🔴 (неактивен)."
         )
-        logger.warning(f"Покупка остановлена для user_id={user_id}: {bought}/{qty} подарков {gift_id}")
+        logger.warning("Покупка остановлена для user_id=%s: %s/%s подарков %s", user_id, bought, qty, gift_id)
 
-    await state.clear()
-    await call.answer()
     await update_menu(bot=call.bot, chat_id=call.message.chat.id, user_id=user_id, message_id=call.message.message_id)
 
 @wizard_router.callback_query(F.data == "cancel_purchase")
@@ -326,7 +445,7 @@ async def cancel_callback(call: CallbackQuery, state: FSMContext) -> None:
         state: Контекст FSM.
     """
     user_id = call.from_user.id
-    logger.info(f"Отмена покупки для user_id={user_id}")
+    logger.info("Отмена покупки для user_id=%s", user_id)
     await state.clear()
     await call.answer()
     await safe_edit_text(call.message, "🚫 Действие отменено.", reply_markup=None)
@@ -346,7 +465,7 @@ async def try_cancel(message: Message, state: FSMContext) -> bool:
     """
     user_id = message.from_user.id
     if message.text and message.text.strip().lower() == "/cancel":
-        logger.info(f"Отмена действия для user_id={user_id}")
+        logger.info("Отмена действия для user_id=%s", user_id)
         await state.clear()
         await message.answer("🚫 Действие отменено.")
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=user_id, message_id=message.message_id)
@@ -369,7 +488,7 @@ async def safe_edit_text(message: Message, text: str, reply_markup: InlineKeyboa
         await message.edit_text(text, reply_markup=reply_markup)
         return True
     except TelegramBadRequest as e:
-        logger.error(f"Ошибка редактирования сообщения для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка редактирования сообщения для user_id=%s: %s", message.from_user.id, e)
         if "message can't be edited" in str(e) or "message to edit not found" in str(e):
             return False
         raise
@@ -1,23 +1,54 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+
 # --- Сторонние библиотеки ---
 from aiogram import F, Bot, Router
 from aiogram.filters import CommandStart, Command
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Message, PreCheckoutQuery
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Message, PreCheckoutQuery
 from aiogram.fsm.context import FSMContext
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, save_config, format_config_summary, get_target_display
-from services.menu import update_menu, config_action_keyboard
+from services.config import get_valid_config, save_config, format_config_summary, get_target_display, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS, PROFILE_TOP
+from services.menu import update_menu, edit_menu
 from services.balance import refresh_balance, refund_all_star_payments
 from services.buy import buy_gift
 from database import add_allowed_user, remove_allowed_user, get_allowed_users
+from utils.profiling import profile_for, dump_tasks, is_profiling
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 USER_ID = int(os.getenv("TELEGRAM_USER_ID"))  # ID админа из .env
 
+logger = logging.getLogger(__name__)
 router = Router()
+# Ссылки на фоновые задачи /profile, чтобы их не собрал сборщик мусора
+_profile_tasks: set[asyncio.Task] = set()
+
+async def send_profile(message: Message, seconds: float) -> None:
+    """
+    Снимает профиль за seconds секунд и присылает отчёт cProfile и снимок задач asyncio.
+
+    Args:
+        message: Сообщение с командой /profile.
+        seconds: Длительность профилирования.
+    """
+    try:
+        report = await profile_for(seconds, top=PROFILE_TOP)
+        tasks = dump_tasks()
+        stamp = int(message.date.timestamp())
+        await message.answer_document(
+            BufferedInputFile(report.encode("utf-8"), filename=f"profile_{stamp}.txt"),
+            caption=f"📊 Профиль за {seconds:g} сек"
+        )
+        await message.answer_document(
+            BufferedInputFile(tasks.encode("utf-8"), filename=f"tasks_{stamp}.txt"),
+            caption="🧵 Задачи asyncio"
+        )
+    except Exception as e:
+        logger.error("Ошибка профилирования: %s", e)
+        await message.answer("❌ Не удалось снять профиль.")
 
 def register_main_handlers(dp: Router, bot: Bot, version: str) -> None:
     """
@@ -134,6 +165,37 @@ def register_main_handlers(dp: Router, bot: Bot, version: str) -> None:
         text = "📋 Разрешённые пользователи:\n" + "\n".join([f"- {uid}" for uid in allowed_users])
         await message.answer(text)
 
+    @dp.message(Command("profile"))
+    async def command_profile_handler(message: Message) -> None:
+        """
+        Обрабатывает команду /profile [секунды] — профилирует работающего бота cProfile
+        и присылает топ функций по кумулятивному времени и снимок задач asyncio.
+        Профиль снимается в фоновой задаче: хендлер сразу возвращается и не держит
+        очередь апдейтов админа на время профилирования. Доступно только админу.
+        """
+        user_id = message.from_user.id
+        if user_id != USER_ID:
+            await message.answer("⚠️ Эта команда доступна только администратору.")
+            return
+        args = message.text.split()
+        seconds = PROFILE_DEFAULT_SECONDS
+        if len(args) > 1:
+            try:
+                seconds = float(args[1])
+            except ValueError:
+                await message.answer("❌ Длительность должна быть числом: /profile <секунды>")
+                return
+            if not 0 < seconds <= PROFILE_MAX_SECONDS:
+                await message.answer(f"❌ Длительность должна быть от 0 до {PROFILE_MAX_SECONDS} секунд.")
+                return
+        if is_profiling() or _profile_tasks:
+            await message.answer("⚠️ Профилирование уже запущено.")
+            return
+        await message.answer(f"⏱ Профилирование на {seconds:g} сек...")
+        task = asyncio.create_task(send_profile(message, seconds))
+        _profile_tasks.add(task)
+        task.add_done_callback(_profile_tasks.discard)
+
     @dp.callback_query(F.data == "main_menu")
     async def start_callback(call: CallbackQuery, state: FSMContext) -> None:
         """
@@ -161,7 +223,7 @@ def register_main_handlers(dp: Router, bot: Bot, version: str) -> None:
         # По умолчанию первый профиль
         profile = config["PROFILES"][0]
         target_display = get_target_display(profile, user_id)
-        bot_info = await bot.get_me()
+        bot_info = await bot.me()  # Кэшируется в экземпляре бота
         bot_username = bot_info.username
         help_text = (
             f"<b>🛠 Управление ботом <code>v{version}</code> :</b>\n\n"
@@ -235,15 +297,15 @@ def register_main_handlers(dp: Router, bot: Bot, version: str) -> None:
             profile["DONE"] = False
         config["ACTIVE"] = False
         await save_config(config, user_id)
-        info = format_config_summary(config, user_id)
-        try:
-            await call.message.edit_text(
-                info,
-                reply_markup=config_action_keyboard(config["ACTIVE"])
-            )
-        except TelegramBadRequest as e:
-            if "message is not modified" not in str(e):
-                raise
+        edited = await edit_menu(
+            bot=bot,
+            chat_id=call.message.chat.id,
+            user_id=user_id,
+            message_id=call.message.message_id,
+            config=config
+        )
+        if not edited:
+            await update_menu(bot=bot, chat_id=call.message.chat.id, user_id=user_id, message_id=call.message.message_id)
         await call.answer("Счётчик покупок сброшен.")
 
     @dp.callback_query(F.data == "toggle_active")
@@ -255,11 +317,15 @@ def register_main_handlers(dp: Router, bot: Bot, version: str) -> None:
         config = await get_valid_config(user_id)
         config["ACTIVE"] = not config.get("ACTIVE", False)
         await save_config(config, user_id)
-        info = format_config_summary(config, user_id)
-        await call.message.edit_text(
-            info,
-            reply_markup=config_action_keyboard(config["ACTIVE"])
+        edited = await edit_menu(
+            bot=bot,
+            chat_id=call.message.chat.id,
+            user_id=user_id,
+            message_id=call.message.message_id,
+            config=config
         )
+        if not edited:
+            await update_menu(bot=bot, chat_id=call.message.chat.id, user_id=user_id, message_id=call.message.message_id)
         await call.answer("Статус обновлён")
 
     @dp.pre_checkout_query()
@@ -1,5 +1,6 @@
 # --- Стандартные библиотеки ---
 import logging
+from functools import lru_cache
 
 # --- Сторонние библиотеки ---
 from aiogram import Router, F, Bot
@@ -7,12 +8,13 @@ from aiogram.types import Message, CallbackQuery, LabeledPrice, InlineKeyboardMa
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.exceptions import TelegramBadRequest, TelegramAPIError
+from aiogram.exceptions import TelegramBadRequest
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, get_target_display, save_config, CURRENCY, MAX_PROFILES, add_profile, remove_profile, update_profile
+from services.config import get_valid_config, get_target_display, update_config, CURRENCY, MAX_PROFILES, add_profile, remove_profile, update_profile
 from services.menu import update_menu, payment_keyboard
 from services.balance import refresh_balance, refund_all_star_payments
+from services.chats import resolve_chat
 
 logger = logging.getLogger(__name__)
 wizard_router = Router()
@@ -87,7 +89,7 @@ async def profiles_menu(message: Message, user_id: int) -> None:
 
     kb = InlineKeyboardMarkup(inline_keyboard=keyboard)
     await message.answer(f"📝 <b>Управление профилями (максимум 3):</b>\n\n{text_profiles}", reply_markup=kb)
-    logger.info(f"Открыто меню профилей для user_id={user_id}")
+    logger.info("Открыто меню профилей для user_id=%s", user_id)
 
 @wizard_router.callback_query(F.data == "profiles_menu")
 async def on_profiles_menu(call: CallbackQuery) -> None:
@@ -101,7 +103,7 @@ async def on_profiles_menu(call: CallbackQuery) -> None:
     user_id = call.from_user.id
     await profiles_menu(call.message, user_id)
     await call.answer()
-    logger.info(f"Переход к меню профилей для user_id={user_id}")
+    logger.info("Переход к меню профилей для user_id=%s", user_id)
 
 def profile_text(profile: dict, idx: int, user_id: int) -> str:
     """
@@ -124,9 +126,11 @@ def profile_text(profile: dict, idx: int, user_id: int) -> str:
             f"├⭐️ <b>Лимит</b>: {profile.get('SPENT'):,} / {profile.get('LIMIT'):,} ★\n"
             f"└👤 <b>Получатель</b>: {target_display}")
 
+@lru_cache(maxsize=MAX_PROFILES)
 def profile_edit_keyboard(idx: int) -> InlineKeyboardMarkup:
     """
     Создаёт инлайн-клавиатуру для быстрого редактирования параметров выбранного профиля.
+    Клавиатура зависит только от индекса профиля и создаётся один раз.
 
     Args:
         idx: Индекс профиля (начинается с 0).
@@ -151,6 +155,32 @@ def profile_edit_keyboard(idx: int) -> InlineKeyboardMarkup:
         ]
     )
 
+async def apply_profile_changes(user_id: int, idx: int, changes: dict) -> dict | None:
+    """
+    Сохраняет изменённые поля профиля одной записью в базу сразу после шага редактора,
+    чтобы воркер покупал уже с новыми ценами, лимитом, количеством и получателем.
+    Поля накладываются на актуальный конфиг (см. update_config), поэтому счётчики покупок,
+    обновлённые воркером во время редактирования, не затираются.
+
+    Args:
+        user_id: ID пользователя.
+        idx: Индекс профиля (начинается с 0).
+        changes: Изменённые поля профиля.
+
+    Returns:
+        dict | None: Обновлённый профиль или None, если профиль не найден.
+    """
+    def mutate(config: dict) -> None:
+        if idx < len(config["PROFILES"]):
+            config["PROFILES"][idx].update(changes)
+
+    config = await update_config(user_id, mutate)
+    if idx >= len(config["PROFILES"]):
+        logger.warning("Профиль %s не найден при сохранении изменений для user_id=%s", idx, user_id)
+        return None
+    logger.info("Сохранены изменения профиля %s для user_id=%s: %s", idx + 1, user_id, ", ".join(changes))
+    return config["PROFILES"][idx]
+
 @wizard_router.callback_query(F.data.startswith("profile_edit_"))
 async def on_profile_edit(call: CallbackQuery, state: FSMContext) -> None:
     """
@@ -164,18 +194,17 @@ async def on_profile_edit(call: CallbackQuery, state: FSMContext) -> None:
     idx = int(call.data.split("_")[-1])
     config = await get_valid_config(user_id)
     if idx >= len(config["PROFILES"]):
-        logger.warning(f"Профиль {idx} не найден для user_id={user_id}")
+        logger.warning("Профиль %s не найден для user_id=%s", idx, user_id)
         await call.answer("🚫 Профиль не найден.", show_alert=True)
         return
     profile = config["PROFILES"][idx]
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     await call.message.edit_text(
         profile_text(profile, idx, user_id),
         reply_markup=profile_edit_keyboard(idx)
     )
     await call.answer()
-    logger.info(f"Открыт редактор профиля {idx+1} для user_id={user_id}")
+    logger.info("Открыт редактор профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("edit_profile_price_"))
 async def edit_profile_min_price(call: CallbackQuery, state: FSMContext) -> None:
@@ -188,8 +217,7 @@ async def edit_profile_min_price(call: CallbackQuery, state: FSMContext) -> None
     """
     user_id = call.from_user.id
     idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     await call.message.answer(
         f"✏️ <b>Редактирование профиля {idx + 1}:</b>\n\n"
         "💰 Минимальная цена подарка, например: <code>5000</code>\n\n"
@@ -197,7 +225,7 @@ async def edit_profile_min_price(call: CallbackQuery, state: FSMContext) -> None
     )
     await state.set_state(ConfigWizard.edit_min_price)
     await call.answer()
-    logger.info(f"Начало редактирования минимальной цены профиля {idx+1} для user_id={user_id}")
+    logger.info("Начало редактирования минимальной цены профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("edit_profile_supply_"))
 async def edit_profile_min_supply(call: CallbackQuery, state: FSMContext) -> None:
@@ -210,8 +238,7 @@ async def edit_profile_min_supply(call: CallbackQuery, state: FSMContext) -> Non
     """
     user_id = call.from_user.id
     idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     await call.message.answer(
         f"✏️ <b>Редактирование профиля {idx + 1}:</b>\n\n"
         "📦 Минимальный саплай подарка, например: <code>1000</code>\n\n"
@@ -219,7 +246,7 @@ async def edit_profile_min_supply(call: CallbackQuery, state: FSMContext) -> Non
     )
     await state.set_state(ConfigWizard.edit_min_supply)
     await call.answer()
-    logger.info(f"Начало редактирования минимального саплая профиля {idx+1} для user_id={user_id}")
+    logger.info("Начало редактирования минимального саплая профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("edit_profile_limit_"))
 async def edit_profile_limit(call: CallbackQuery, state: FSMContext) -> None:
@@ -232,8 +259,7 @@ async def edit_profile_limit(call: CallbackQuery, state: FSMContext) -> None:
     """
     user_id = call.from_user.id
     idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     await call.message.answer(
         f"✏️ <b>Редактирование профиля {idx + 1}:</b>\n\n"
         "⭐️ Введите лимит звёзд для этого профиля (например: <code>10000</code>)\n\n"
@@ -241,7 +267,7 @@ async def edit_profile_limit(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.edit_limit)
     await call.answer()
-    logger.info(f"Начало редактирования лимита профиля {idx+1} для user_id={user_id}")
+    logger.info("Начало редактирования лимита профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("edit_profile_count_"))
 async def edit_profile_count(call: CallbackQuery, state: FSMContext) -> None:
@@ -254,8 +280,7 @@ async def edit_profile_count(call: CallbackQuery, state: FSMContext) -> None:
     """
     user_id = call.from_user.id
     idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     await call.message.answer(
         f"✏️ <b>Редактирование профиля {idx + 1}:</b>\n\n"
         "🎁 Максимальное количество подарков, например: <code>5</code>\n\n"
@@ -263,7 +288,7 @@ async def edit_profile_count(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.edit_count)
     await call.answer()
-    logger.info(f"Начало редактирования количества подарков профиля {idx+1} для user_id={user_id}")
+    logger.info("Начало редактирования количества подарков профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("edit_profile_target_"))
 async def edit_profile_target(call: CallbackQuery, state: FSMContext) -> None:
@@ -276,8 +301,7 @@ async def edit_profile_target(call: CallbackQuery, state: FSMContext) -> None:
     """
     user_id = call.from_user.id
     idx = int(call.data.split("_")[-1])
-    await state.update_data(profile_index=idx)
-    await state.update_data(message_id=call.message.message_id)
+    await state.update_data(profile_index=idx, message_id=call.message.message_id)
     await call.message.answer(
         f"✏️ <b>Редактирование профиля {idx + 1}:</b>\n\n"
         "👤 Введите адрес получателя:\n\n"
@@ -288,7 +312,7 @@ async def edit_profile_target(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.edit_user_id)
     await call.answer()
-    logger.info(f"Начало редактирования получателя профиля {idx+1} для user_id={user_id}")
+    logger.info("Начало редактирования получателя профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("edit_profiles_menu_"))
 async def edit_profiles_menu(call: CallbackQuery) -> None:
@@ -303,7 +327,7 @@ async def edit_profiles_menu(call: CallbackQuery) -> None:
     await safe_edit_text(call.message, f"✅ Редактирование <b>профиля {idx + 1}</b> завершено.", reply_markup=None)
     await profiles_menu(call.message, user_id)
     await call.answer()
-    logger.info(f"Возврат в меню профилей после редактирования профиля {idx+1} для user_id={user_id}")
+    logger.info("Возврат в меню профилей после редактирования профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.message(ConfigWizard.edit_min_price)
 async def step_edit_min_price(message: Message, state: FSMContext) -> None:
@@ -332,10 +356,10 @@ async def step_edit_min_price(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.edit_max_price)
-        logger.info(f"Установлена минимальная цена {value} для профиля {idx+1} для user_id={user_id}")
+        logger.info("Установлена минимальная цена %s для профиля %s для user_id=%s", value, idx+1, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод минимальной цены для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод минимальной цены для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.edit_max_price)
 async def step_edit_max_price(message: Message, state: FSMContext) -> None:
@@ -361,28 +385,29 @@ async def step_edit_max_price(message: Message, state: FSMContext) -> None:
         min_price = data.get("MIN_PRICE")
         if min_price and value < min_price:
             await message.answer("🚫 Максимальная цена не может быть меньше минимальной. Попробуйте ещё раз.")
-            logger.warning(f"Максимальная цена {value} меньше минимальной {min_price} для user_id={user_id}")
+            logger.warning("Максимальная цена %s меньше минимальной %s для user_id=%s", value, min_price, user_id)
             return
 
-        config = await get_valid_config(user_id)
-        config["PROFILES"][idx]["MIN_PRICE"] = min_price
-        config["PROFILES"][idx]["MAX_PRICE"] = value
-        await save_config(config, user_id)
+        profile = await apply_profile_changes(user_id, idx, {"MIN_PRICE": min_price, "MAX_PRICE": value})
+        if profile is None:
+            await state.clear()
+            await message.answer("🚫 Профиль не найден.")
+            return
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
         except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение для user_id={user_id}: {e}")
+            logger.warning("Не удалось удалить сообщение для user_id=%s: %s", user_id, e)
 
         await message.answer(
-            profile_text(config["PROFILES"][idx], idx, user_id),
+            profile_text(profile, idx, user_id),
             reply_markup=profile_edit_keyboard(idx)
         )
         await state.clear()
-        logger.info(f"Установлена максимальная цена {value} для профиля {idx+1} для user_id={user_id}")
+        logger.info("Установлена максимальная цена %s для профиля %s для user_id=%s", value, idx+1, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод максимальной цены для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод максимальной цены для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.edit_min_supply)
 async def step_edit_min_supply(message: Message, state: FSMContext) -> None:
@@ -411,10 +436,10 @@ async def step_edit_min_supply(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.edit_max_supply)
-        logger.info(f"Установлен минимальный саплай {value} для профиля {idx+1} для user_id={user_id}")
+        logger.info("Установлен минимальный саплай %s для профиля %s для user_id=%s", value, idx+1, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод минимального саплая для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод минимального саплая для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.edit_max_supply)
 async def step_edit_max_supply(message: Message, state: FSMContext) -> None:
@@ -440,28 +465,29 @@ async def step_edit_max_supply(message: Message, state: FSMContext) -> None:
         min_supply = data.get("MIN_SUPPLY")
         if min_supply and value < min_supply:
             await message.answer("🚫 Максимальный саплай не может быть меньше минимального. Попробуйте ещё раз.")
-            logger.warning(f"Максимальный саплай {value} меньше минимального {min_supply} для user_id={user_id}")
+            logger.warning("Максимальный саплай %s меньше минимального %s для user_id=%s", value, min_supply, user_id)
             return
 
-        config = await get_valid_config(user_id)
-        config["PROFILES"][idx]["MIN_SUPPLY"] = min_supply
-        config["PROFILES"][idx]["MAX_SUPPLY"] = value
-        await save_config(config, user_id)
+        profile = await apply_profile_changes(user_id, idx, {"MIN_SUPPLY": min_supply, "MAX_SUPPLY": value})
+        if profile is None:
+            await state.clear()
+            await message.answer("🚫 Профиль не найден.")
+            return
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
         except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение для user_id={user_id}: {e}")
+            logger.warning("Не удалось удалить сообщение для user_id=%s: %s", user_id, e)
 
         await message.answer(
-            profile_text(config["PROFILES"][idx], idx, user_id),
+            profile_text(profile, idx, user_id),
             reply_markup=profile_edit_keyboard(idx)
         )
         await state.clear()
-        logger.info(f"Установлен максимальный саплай {value} для профиля {idx+1} для user_id={user_id}")
+        logger.info("Установлен максимальный саплай %s для профиля %s для user_id=%s", value, idx+1, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод максимального саплая для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод максимального саплая для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.edit_limit)
 async def step_edit_limit(message: Message, state: FSMContext) -> None:
@@ -484,24 +510,26 @@ async def step_edit_limit(message: Message, state: FSMContext) -> None:
         if value <= 0:
             raise ValueError
 
-        config = await get_valid_config(user_id)
-        config["PROFILES"][idx]["LIMIT"] = value
-        await save_config(config, user_id)
+        profile = await apply_profile_changes(user_id, idx, {"LIMIT": value})
+        if profile is None:
+            await state.clear()
+            await message.answer("🚫 Профиль не найден.")
+            return
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
         except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение для user_id={user_id}: {e}")
+            logger.warning("Не удалось удалить сообщение для user_id=%s: %s", user_id, e)
 
         await message.answer(
-            profile_text(config["PROFILES"][idx], idx, user_id),
+            profile_text(profile, idx, user_id),
             reply_markup=profile_edit_keyboard(idx)
         )
         await state.clear()
-        logger.info(f"Установлен лимит {value} для профиля {idx+1} для user_id={user_id}")
+        logger.info("Установлен лимит %s для профиля %s для user_id=%s", value, idx+1, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод лимита для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод лимита для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.edit_count)
 async def step_edit_count(message: Message, state: FSMContext) -> None:
@@ -524,24 +552,26 @@ async def step_edit_count(message: Message, state: FSMContext) -> None:
         if value <= 0:
             raise ValueError
 
-        config = await get_valid_config(user_id)
-        config["PROFILES"][idx]["COUNT"] = value
-        await save_config(config, user_id)
+        profile = await apply_profile_changes(user_id, idx, {"COUNT": value})
+        if profile is None:
+            await state.clear()
+            await message.answer("🚫 Профиль не найден.")
+            return
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
         except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение для user_id={user_id}: {e}")
+            logger.warning("Не удалось удалить сообщение для user_id=%s: %s", user_id, e)
 
         await message.answer(
-            profile_text(config["PROFILES"][idx], idx, user_id),
+            profile_text(profile, idx, user_id),
             reply_markup=profile_edit_keyboard(idx)
         )
         await state.clear()
-        logger.info(f"Установлено количество подарков {value} для профиля {idx+1} для user_id={user_id}")
+        logger.info("Установлено количество подарков %s для профиля %s для user_id=%s", value, idx+1, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод количества подарков для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод количества подарков для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.edit_user_id)
 async def step_edit_user_id(message: Message, state: FSMContext) -> None:
@@ -567,32 +597,33 @@ async def step_edit_user_id(message: Message, state: FSMContext) -> None:
             target_user = None
         else:
             await message.answer("🚫 Вы указали неправильный <b>username канала</b>. Попробуйте ещё раз.")
-            logger.warning(f"Некорректный username канала для user_id={user_id}: {user_input}")
+            logger.warning("Некорректный username канала для user_id=%s: %s", user_id, user_input)
             return
     elif user_input.isdigit():
         target_chat = None
         target_user = int(user_input)
     else:
         await message.answer("🚫 Введите ID или @username канала. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод получателя для user_id={user_id}: {user_input}")
+        logger.warning("Некорректный ввод получателя для user_id=%s: %s", user_id, user_input)
         return
 
-    config = await get_valid_config(user_id)
-    config["PROFILES"][idx]["TARGET_USER_ID"] = target_user
-    config["PROFILES"][idx]["TARGET_CHAT_ID"] = target_chat
-    await save_config(config, user_id)
+    profile = await apply_profile_changes(user_id, idx, {"TARGET_USER_ID": target_user, "TARGET_CHAT_ID": target_chat})
+    if profile is None:
+        await state.clear()
+        await message.answer("🚫 Профиль не найден.")
+        return
 
     try:
         await message.bot.delete_message(message.chat.id, data["message_id"])
     except Exception as e:
-        logger.warning(f"Не удалось удалить сообщение для user_id={user_id}: {e}")
+        logger.warning("Не удалось удалить сообщение для user_id=%s: %s", user_id, e)
 
     await message.answer(
-        profile_text(config["PROFILES"][idx], idx, user_id),
+        profile_text(profile, idx, user_id),
         reply_markup=profile_edit_keyboard(idx)
     )
     await state.clear()
-    logger.info(f"Установлен получатель {target_user or target_chat} для профиля {idx+1} для user_id={user_id}")
+    logger.info("Установлен получатель %s для профиля %s для user_id=%s", target_user or target_chat, idx+1, user_id)
 
 @wizard_router.callback_query(F.data == "profile_add")
 async def on_profile_add(call: CallbackQuery, state: FSMContext) -> None:
@@ -607,7 +638,7 @@ async def on_profile_add(call: CallbackQuery, state: FSMContext) -> None:
     config = await get_valid_config(user_id)
     if len(config["PROFILES"]) >= MAX_PROFILES:
         await call.answer("🚫 Достигнут лимит профилей.", show_alert=True)
-        logger.warning(f"Попытка добавить профиль сверх лимита для user_id={user_id}")
+        logger.warning("Попытка добавить профиль сверх лимита для user_id=%s", user_id)
         return
     await state.update_data(profile_index=None)
     await call.message.answer(
@@ -618,7 +649,7 @@ async def on_profile_add(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.min_price)
     await call.answer()
-    logger.info(f"Начало создания нового профиля для user_id={user_id}")
+    logger.info("Начало создания нового профиля для user_id=%s", user_id)
 
 @wizard_router.message(ConfigWizard.user_id)
 async def step_user_id(message: Message, state: FSMContext) -> None:
@@ -641,14 +672,14 @@ async def step_user_id(message: Message, state: FSMContext) -> None:
             target_user = None
         else:
             await message.answer("🚫 Вы указали неправильный <b>username канала</b>. Попробуйте ещё раз.")
-            logger.warning(f"Некорректный username канала для user_id={user_id}: {user_input}")
+            logger.warning("Некорректный username канала для user_id=%s: %s", user_id, user_input)
             return
     elif user_input.isdigit():
         target_chat = None
         target_user = int(user_input)
     else:
         await message.answer("🚫 Введите ID или @username канала. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод получателя для user_id={user_id}: {user_input}")
+        logger.warning("Некорректный ввод получателя для user_id=%s: %s", user_id, user_input)
         return
 
     data = await state.get_data()
@@ -669,14 +700,21 @@ async def step_user_id(message: Message, state: FSMContext) -> None:
     config = await get_valid_config(user_id)
     profile_index = data.get("profile_index")
 
+    if profile_index is None and len(config["PROFILES"]) >= MAX_PROFILES:
+        await state.clear()
+        await message.answer("🚫 Достигнут лимит профилей.")
+        logger.warning("Попытка добавить профиль сверх лимита для user_id=%s", user_id)
+        await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=user_id, message_id=message.message_id)
+        return
+
     if profile_index is None:
         await add_profile(config, profile_data, user_id)
         await message.answer("✅ <b>Новый профиль</b> создан.")
-        logger.info(f"Создан новый профиль для user_id={user_id}")
+        logger.info("Создан новый профиль для user_id=%s", user_id)
     else:
         await update_profile(config, profile_index, profile_data, user_id)
         await message.answer(f"✅ <b>Профиль {profile_index+1}</b> обновлён.")
-        logger.info(f"Обновлён профиль {profile_index+1} для user_id={user_id}")
+        logger.info("Обновлён профиль %s для user_id=%s", profile_index+1, user_id)
 
     await state.clear()
     await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=user_id, message_id=message.message_id)
@@ -701,7 +739,7 @@ async def start_callback(call: CallbackQuery, state: FSMContext) -> None:
         user_id=user_id,
         message_id=call.message.message_id
     )
-    logger.info(f"Возврат в главное меню для user_id={user_id}")
+    logger.info("Возврат в главное меню для user_id=%s", user_id)
 
 @wizard_router.callback_query(F.data.startswith("profile_delete_"))
 async def on_profile_delete_confirm(call: CallbackQuery, state: FSMContext) -> None:
@@ -718,7 +756,7 @@ async def on_profile_delete_confirm(call: CallbackQuery, state: FSMContext) -> N
     profiles = config.get("PROFILES", [])
     if idx >= len(profiles):
         await call.answer("🚫 Профиль не найден.", show_alert=True)
-        logger.warning(f"Профиль {idx} не найден для user_id={user_id}")
+        logger.warning("Профиль %s не найден для user_id=%s", idx, user_id)
         return
     profile = profiles[idx]
     target_display = get_target_display(profile, user_id)
@@ -741,7 +779,7 @@ async def on_profile_delete_confirm(call: CallbackQuery, state: FSMContext) -> N
         reply_markup=kb
     )
     await call.answer()
-    logger.info(f"Запрос подтверждения удаления профиля {idx+1} для user_id={user_id}")
+    logger.info("Запрос подтверждения удаления профиля %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("confirm_delete_"))
 async def on_profile_delete_final(call: CallbackQuery) -> None:
@@ -756,17 +794,16 @@ async def on_profile_delete_final(call: CallbackQuery) -> None:
     config = await get_valid_config(user_id)
     if idx >= len(config["PROFILES"]):
         await call.answer("🚫 Профиль не найден.", show_alert=True)
-        logger.warning(f"Профиль {idx} не найден для user_id={user_id}")
+        logger.warning("Профиль %s не найден для user_id=%s", idx, user_id)
         return
     default_added = "\n➕ <b>Добавлен</b> стандартный профиль.\n🚦 Статус изменён на 🔴 (неактивен)." if len(config["PROFILES"]) == 1 else ""
     if len(config["PROFILES"]) == 1:
         config["ACTIVE"] = False
-        await save_config(config, user_id)
-    await remove_profile(config, idx, user_id)
+    await remove_profile(config, idx, user_id)  # Сохраняет конфиг вместе со статусом
     await call.message.edit_text(f"✅ <b>Профиль {idx+1}</b> удалён.{default_added}", reply_markup=None)
     await profiles_menu(call.message, user_id)
     await call.answer()
-    logger.info(f"Удалён профиль {idx+1} для user_id={user_id}")
+    logger.info("Удалён профиль %s для user_id=%s", idx+1, user_id)
 
 @wizard_router.callback_query(F.data.startswith("cancel_delete_"))
 async def on_profile_delete_cancel(call: CallbackQuery) -> None:
@@ -781,7 +818,7 @@ async def on_profile_delete_cancel(call: CallbackQuery) -> None:
     await call.message.edit_text(f"🚫 Удаление <b>профиля {idx + 1}</b> отменено.", reply_markup=None)
     await profiles_menu(call.message, user_id)
     await call.answer()
-    logger.info(f"Отмена удаления профиля {idx+1} для user_id={user_id}")
+    logger.info("Отмена удаления профиля %s для user_id=%s", idx+1, user_id)
 
 async def safe_edit_text(message: Message, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> bool:
     """
@@ -799,7 +836,7 @@ async def safe_edit_text(message: Message, text: str, reply_markup: InlineKeyboa
         await message.edit_text(text, reply_markup=reply_markup)
         return True
     except TelegramBadRequest as e:
-        logger.error(f"Ошибка редактирования сообщения для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка редактирования сообщения для user_id=%s: %s", message.from_user.id, e)
         if "message can't be edited" in str(e) or "message to edit not found" in str(e):
             return False
         raise
@@ -820,7 +857,7 @@ async def edit_config_handler(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.min_price)
     await call.answer()
-    logger.info(f"Запуск мастера редактирования конфигурации для user_id={user_id}")
+    logger.info("Запуск мастера редактирования конфигурации для user_id=%s", user_id)
 
 @wizard_router.message(ConfigWizard.min_price)
 async def step_min_price(message: Message, state: FSMContext) -> None:
@@ -845,10 +882,10 @@ async def step_min_price(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.max_price)
-        logger.info(f"Установлена минимальная цена {value} для нового профиля для user_id={user_id}")
+        logger.info("Установлена минимальная цена %s для нового профиля для user_id=%s", value, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод минимальной цены для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод минимальной цены для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.max_price)
 async def step_max_price(message: Message, state: FSMContext) -> None:
@@ -872,7 +909,7 @@ async def step_max_price(message: Message, state: FSMContext) -> None:
         min_price = data.get("MIN_PRICE")
         if min_price and value < min_price:
             await message.answer("🚫 Максимальная цена не может быть меньше минимальной. Попробуйте ещё раз.")
-            logger.warning(f"Максимальная цена {value} меньше минимальной {min_price} для user_id={user_id}")
+            logger.warning("Максимальная цена %s меньше минимальной %s для user_id=%s", value, min_price, user_id)
             return
 
         await state.update_data(MAX_PRICE=value)
@@ -881,10 +918,10 @@ async def step_max_price(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.min_supply)
-        logger.info(f"Установлена максимальная цена {value} для нового профиля для user_id={user_id}")
+        logger.info("Установлена максимальная цена %s для нового профиля для user_id=%s", value, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод максимальной цены для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод максимальной цены для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.min_supply)
 async def step_min_supply(message: Message, state: FSMContext) -> None:
@@ -909,10 +946,10 @@ async def step_min_supply(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.max_supply)
-        logger.info(f"Установлен минимальный саплай {value} для нового профиля для user_id={user_id}")
+        logger.info("Установлен минимальный саплай %s для нового профиля для user_id=%s", value, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод минимального саплая для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод минимального саплая для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.max_supply)
 async def step_max_supply(message: Message, state: FSMContext) -> None:
@@ -936,7 +973,7 @@ async def step_max_supply(message: Message, state: FSMContext) -> None:
         min_supply = data.get("MIN_SUPPLY")
         if min_supply and value < min_supply:
             await message.answer("🚫 Максимальный саплай не может быть меньше минимального. Попробуйте ещё раз.")
-            logger.warning(f"Максимальный саплай {value} меньше минимального {min_supply} для user_id={user_id}")
+            logger.warning("Максимальный саплай %s меньше минимального %s для user_id=%s", value, min_supply, user_id)
             return
 
         await state.update_data(MAX_SUPPLY=value)
@@ -945,10 +982,10 @@ async def step_max_supply(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.count)
-        logger.info(f"Установлен максимальный саплай {value} для нового профиля для user_id={user_id}")
+        logger.info("Установлен максимальный саплай %s для нового профиля для user_id=%s", value, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод максимального саплая для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод максимального саплая для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.count)
 async def step_count(message: Message, state: FSMContext) -> None:
@@ -973,10 +1010,10 @@ async def step_count(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.limit)
-        logger.info(f"Установлено количество подарков {value} для нового профиля для user_id={user_id}")
+        logger.info("Установлено количество подарков %s для нового профиля для user_id=%s", value, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод количества подарков для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод количества подарков для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.limit)
 async def step_limit(message: Message, state: FSMContext) -> None:
@@ -1004,10 +1041,10 @@ async def step_limit(message: Message, state: FSMContext) -> None:
             "/cancel — отменить"
         )
         await state.set_state(ConfigWizard.user_id)
-        logger.info(f"Установлен лимит {value} для нового профиля для user_id={user_id}")
+        logger.info("Установлен лимит %s для нового профиля для user_id=%s", value, user_id)
     except ValueError:
         await message.answer("🚫 Введите положительное число. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод лимита для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод лимита для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.callback_query(F.data == "deposit_menu")
 async def deposit_menu(call: CallbackQuery, state: FSMContext) -> None:
@@ -1025,7 +1062,7 @@ async def deposit_menu(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.deposit_amount)
     await call.answer()
-    logger.info(f"Открыт диалог пополнения баланса для user_id={user_id}")
+    logger.info("Открыт диалог пополнения баланса для user_id=%s", user_id)
 
 @wizard_router.message(ConfigWizard.deposit_amount)
 async def deposit_amount_input(message: Message, state: FSMContext) -> None:
@@ -1056,10 +1093,10 @@ async def deposit_amount_input(message: Message, state: FSMContext) -> None:
             reply_markup=payment_keyboard(amount=amount),
         )
         await state.clear()
-        logger.info(f"Отправлен счёт на ★{amount} для user_id={user_id}")
+        logger.info("Отправлен счёт на ★%s для user_id=%s", amount, user_id)
     except ValueError:
         await message.answer("🚫 Введите число от 1 до 10000. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод суммы пополнения для user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод суммы пополнения для user_id=%s: %s", user_id, message.text)
 
 @wizard_router.callback_query(F.data == "refund_menu")
 async def refund_menu(call: CallbackQuery, state: FSMContext) -> None:
@@ -1078,7 +1115,7 @@ async def refund_menu(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.refund_id)
     await call.answer()
-    logger.info(f"Открыт диалог возврата для user_id={user_id}")
+    logger.info("Открыт диалог возврата для user_id=%s", user_id)
 
 @wizard_router.message(ConfigWizard.refund_id)
 async def refund_input(message: Message, state: FSMContext) -> None:
@@ -1107,10 +1144,10 @@ async def refund_input(message: Message, state: FSMContext) -> None:
         await message.answer("✅ Возврат успешно выполнен.")
         await refresh_balance(message.bot, user_id)  # Исправлено: добавлен user_id
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=user_id, message_id=message.message_id)
-        logger.info(f"Выполнен возврат транзакции {txn_id} для user_id={user_id}")
+        logger.info("Выполнен возврат транзакции %s для user_id=%s", txn_id, user_id)
     except Exception as e:
         await message.answer(f"🚫 Ошибка при возврате:\n<code>{e}</code>")
-        logger.error(f"Ошибка возврата транзакции {txn_id} для user_id={user_id}: {e}")
+        logger.error("Ошибка возврата транзакции %s для user_id=%s: %s", txn_id, user_id, e)
     await state.clear()
 
 @wizard_router.callback_query(F.data == "guest_deposit_menu")
@@ -1128,7 +1165,7 @@ async def guest_deposit_menu(call: CallbackQuery, state: FSMContext) -> None:
     )
     await state.set_state(ConfigWizard.guest_deposit_amount)
     await call.answer()
-    logger.info(f"Открыт диалог пополнения баланса для гостя user_id={user_id}")
+    logger.info("Открыт диалог пополнения баланса для гостя user_id=%s", user_id)
 
 @wizard_router.message(ConfigWizard.guest_deposit_amount)
 async def guest_deposit_amount_input(message: Message, state: FSMContext) -> None:
@@ -1159,10 +1196,10 @@ async def guest_deposit_amount_input(message: Message, state: FSMContext) -> Non
             reply_markup=payment_keyboard(amount=amount),
         )
         await state.clear()
-        logger.info(f"Отправлен счёт на ★{amount} для гостя user_id={user_id}")
+        logger.info("Отправлен счёт на ★%s для гостя user_id=%s", amount, user_id)
     except ValueError:
         await message.answer("🚫 Введите число от 1 до 10000. Попробуйте ещё раз.")
-        logger.warning(f"Некорректный ввод суммы пополнения для гостя user_id={user_id}: {message.text}")
+        logger.warning("Некорректный ввод суммы пополнения для гостя user_id=%s: %s", user_id, message.text)
 
 @wizard_router.message(ConfigWizard.guest_refund_id)
 async def guest_refund_input(message: Message, state: FSMContext) -> None:
@@ -1185,10 +1222,10 @@ async def guest_refund_input(message: Message, state: FSMContext) -> None:
         )
         await message.answer("✅ Возврат успешно выполнен.")
         await state.clear()
-        logger.info(f"Выполнен возврат транзакции {txn_id} для гостя user_id={user_id}")
+        logger.info("Выполнен возврат транзакции %s для гостя user_id=%s", txn_id, user_id)
     except Exception as e:
         await message.answer(f"🚫 Ошибка при возврате:\n<code>{e}</code>")
-        logger.error(f"Ошибка возврата транзакции {txn_id} для гостя user_id={user_id}: {e}")
+        logger.error("Ошибка возврата транзакции %s для гостя user_id=%s: %s", txn_id, user_id, e)
     await state.clear()
 
 @wizard_router.message(Command("withdraw_all"))
@@ -1204,7 +1241,7 @@ async def withdraw_all_handler(message: Message) -> None:
     if balance == 0:
         await message.answer("⚠️ Не найдено звёзд для возврата.")
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=user_id, message_id=message.message_id)
-        logger.info(f"Попытка вывода всех звёзд для user_id={user_id}, баланс 0")
+        logger.info("Попытка вывода всех звёзд для user_id=%s, баланс 0", user_id)
         return
 
     keyboard = InlineKeyboardMarkup(
@@ -1219,7 +1256,7 @@ async def withdraw_all_handler(message: Message) -> None:
         "⚠️ Вы уверены, что хотите вывести все звёзды?",
         reply_markup=keyboard,
     )
-    logger.info(f"Запрос подтверждения вывода всех звёзд для user_id={user_id}")
+    logger.info("Запрос подтверждения вывода всех звёзд для user_id=%s", user_id)
 
 @wizard_router.callback_query(F.data == "withdraw_all_confirm")
 async def withdraw_all_confirmed(call: CallbackQuery) -> None:
@@ -1254,10 +1291,10 @@ async def withdraw_all_confirmed(call: CallbackQuery) -> None:
                     f"\n➕ Пополните баланс ещё минимум на ★{need} (или суммарно до ★{dep['amount']})."
                 )
         await call.message.answer(msg)
-        logger.info(f"Выполнен возврат ★{result['refunded']} ({result['count']} транзакций) для user_id={user_id}")
+        logger.info("Выполнен возврат ★%s (%s транзакций) для user_id=%s", result['refunded'], result['count'], user_id)
     else:
         await call.message.answer("🚫 Звёзд для возврата не найдено.")
-        logger.info(f"Звёзд для возврата не найдено для user_id={user_id}")
+        logger.info("Звёзд для возврата не найдено для user_id=%s", user_id)
 
     await refresh_balance(call.bot, user_id)  # Исправлено: добавлен user_id
     await update_menu(bot=call.bot, chat_id=call.message.chat.id, user_id=user_id, message_id=call.message.message_id)
@@ -1274,7 +1311,7 @@ async def withdraw_all_cancel(call: CallbackQuery) -> None:
     await call.message.edit_text("🚫 Действие отменено.")
     await call.answer()
     await update_menu(bot=call.bot, chat_id=call.message.chat.id, user_id=user_id, message_id=call.message.message_id)
-    logger.info(f"Отмена вывода всех звёзд для user_id={user_id}")
+    logger.info("Отмена вывода всех звёзд для user_id=%s", user_id)
 
 async def try_cancel(message: Message, state: FSMContext) -> bool:
     """
@@ -1292,13 +1329,14 @@ async def try_cancel(message: Message, state: FSMContext) -> bool:
         await state.clear()
         await message.answer("🚫 Действие отменено.")
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=user_id, message_id=message.message_id)
-        logger.info(f"Отмена действия для user_id={user_id}")
+        logger.info("Отмена действия для user_id=%s", user_id)
         return True
     return False
 
 async def get_chat_type(bot: Bot, username: str) -> str:
     """
     Определяет тип Telegram-объекта по username для каналов.
+    Результат берётся из общего кэша резолвера чатов.
 
     Args:
         bot: Экземпляр бота.
@@ -1307,22 +1345,10 @@ async def get_chat_type(bot: Bot, username: str) -> str:
     Returns:
         str: Тип чата ("channel", "user", "bot", "group", или "error").
     """
-    if not username.startswith("@"):
-        username = "@" + username
-    try:
-        chat = await bot.get_chat(username)
-        if chat.type == "private":
-            if getattr(chat, "is_bot", False):
-                return "bot"
-            return "user"
-        elif chat.type == "channel":
-            return "channel"
-        elif chat.type in ("group", "supergroup"):
-            return "group"
-        return chat.type
-    except TelegramAPIError as e:
-        logger.error(f"Ошибка проверки чата {username}: {e}")
+    chat = await resolve_chat(bot, username)
+    if chat is None:
         return "error"
+    return chat["type"]
 
 def register_wizard_handlers(dp: Router) -> None:
     """
@@ -3,255 +3,334 @@ import asyncio
 import logging
 import os
 import sys
+import time
 
 # --- Сторонние библиотеки ---
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 # --- Внутренние модули ---
 from services.config import (
     ensure_config,
-    save_config,
     get_valid_config,
-    get_target_display,
+    format_config_summary,
     DEFAULT_CONFIG,
     VERSION,
-    PURCHASE_COOLDOWN
+    FSM_CACHE_SIZE,
+    FSM_TTL,
+    MAX_IN_FLIGHT_UPDATES,
+    HTTP_POOL_LIMIT,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_KEEPALIVE_INTERVAL,
+    HTTP_REQUEST_TIMEOUT,
+    HTTP_WARM_CONNECTIONS,
+    LOOP_LAG_INTERVAL,
+    LOOP_LAG_THRESHOLD,
+    CPU_WORKERS,
+    CPU_JOB_MODULES,
+    IO_WORKERS,
+    OUTBOX_GLOBAL_INTERVAL,
+    PURCHASE_GLOBAL_INTERVAL,
+    API_CONCURRENCY,
+    TOKEN_BALANCE_REFRESH,
+    TOKEN_SEND_CONCURRENCY,
+    TOKEN_SEND_INTERVAL
 )
-from services.menu import update_menu
-from services.balance import refresh_balance
-from services.gifts import get_filtered_gifts
-from services.buy import buy_gift
+from services.outbox import outbox
+from services.scheduler import scheduler
+from services.buy import purchase_pacer
+from services.gifts import get_catalog_snapshot
+from services.chats import resolve_chat
+from services.worker import gift_purchase_worker
+from services.shards import ShardSupervisor
+from services.tokens import token_pool
 from handlers.handlers_wizard import register_wizard_handlers
 from handlers.handlers_catalog import register_catalog_handlers
 from handlers.handlers_main import register_main_handlers
 from utils.logging import setup_logging
+from utils.storage import SQLiteStorage
+from utils.ordering import UserOrderedIsolation
+from utils.session import PooledAiohttpSession
+from utils.metrics import registry, start_metrics_server
+from utils.tracing import tracer
+from utils.looplag import LoopLagMonitor
+from utils.executor import executor
 from middlewares.access_control import AccessControlMiddleware
 from middlewares.rate_limit import RateLimitMiddleware
-from database import init_db, get_allowed_users, add_allowed_user
+from middlewares.update_recorder import UpdateRecorderMiddleware
+from middlewares.request_priority import RequestPriorityMiddleware
+from middlewares.request_metrics import RequestMetricsMiddleware
+from database import init_db, get_allowed_users, add_allowed_user, db_stats
 
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Дополнительные токены для покупок через запятую: у каждого свой баланс звёзд и свои лимиты
+EXTRA_TOKENS = [token.strip() for token in os.getenv("TELEGRAM_BOT_TOKENS", "").split(",") if token.strip()]
 USER_ID = int(os.getenv("TELEGRAM_USER_ID"))
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес; без него webhook не регистрируется в Telegram
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_BACKGROUND = os.getenv("WEBHOOK_BACKGROUND", "1") != "0"
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    # Без секрета любой, кто знает адрес, может слать боту поддельные апдейты (в том числе оплаты)
+    raise RuntimeError("Для BOT_MODE=webhook задайте WEBHOOK_SECRET")
+UPDATES_RECORD_PATH = os.getenv("UPDATES_RECORD_PATH")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")  # Без порта эндпоинт метрик не запускается
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+TRACE_PATH = os.getenv("TRACE_PATH")  # JSONL-файл трасс дропов (без него трассы только в памяти)
+WORKER_SHARDS = int(os.getenv("WORKER_SHARDS", "0"))  # 0 — воркер покупок в главном процессе
 
-setup_logging()
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
-dp.message.middleware(RateLimitMiddleware(commands_limits={"/start": 3, "/withdraw_all": 3, "/grant_access": 3, "/revoke_access": 3}))
-dp.message.middleware(AccessControlMiddleware())
-dp.callback_query.middleware(AccessControlMiddleware())
+# Воркер покупок стартует только после загрузки базового снимка каталога
+worker_ready = asyncio.Event()
+startup_stats = {}
 
-register_wizard_handlers(dp)
-register_catalog_handlers(dp)
-register_main_handlers(
-    dp=dp,
-    bot=bot,
-    version=VERSION
-)
+# Создаются в setup()
+session: PooledAiohttpSession | None = None
+bot: Bot | None = None
+dp: Dispatcher | None = None
+lag_monitor: LoopLagMonitor | None = None
+shard_supervisor: ShardSupervisor | None = None
 
-async def gift_purchase_worker():
+def setup() -> None:
     """
-    Фоновый воркер для покупки подарков по профилям всех разрешённых пользователей.
-    Учитывает параметр LIMIT — максимальную сумму звёзд, которую можно потратить на профиль.
-    Если лимит исчерпан — профиль считается завершённым и воркер переходит к следующему.
+    Настраивает логирование и создаёт бота, диспетчер с обработчиками и мидлварями и метрики.
+    Вызывается из точки входа, а не при импорте: процессы пула (forkserver/spawn) импортируют
+    main.py как __mp_main__, и создавать в них бота, сессию и обработчики не нужно.
     """
-    while True:
-        try:
-            allowed_user_ids = await get_allowed_users()  # Получаем список разрешённых пользователей
-            for user_id in allowed_user_ids:
-                config = await get_valid_config(user_id)
-                if not config["ACTIVE"]:
-                    continue
-
-                message = None
-                report_message_lines = []
-                progress_made = False  # Был ли прогресс по профилям на этом проходе
-                any_success = True
-
-                for profile_index, profile in enumerate(config["PROFILES"]):
-                    # Пропускаем завершённые профили
-                    if profile.get("DONE"):
-                        continue
-
-                    MIN_PRICE = profile["MIN_PRICE"]
-                    MAX_PRICE = profile["MAX_PRICE"]
-                    MIN_SUPPLY = profile["MIN_SUPPLY"]
-                    MAX_SUPPLY = profile["MAX_SUPPLY"]
-                    COUNT = profile["COUNT"]
-                    LIMIT = profile.get("LIMIT", 0)
-                    TARGET_USER_ID = profile["TARGET_USER_ID"]
-                    TARGET_CHAT_ID = profile["TARGET_CHAT_ID"]
-
-                    filtered_gifts = await get_filtered_gifts(
-                        bot, MIN_PRICE, MAX_PRICE, MIN_SUPPLY, MAX_SUPPLY
-                    )
-
-                    if not filtered_gifts:
-                        continue
-
-                    purchases = []
-                    before_bought = profile["BOUGHT"]
-                    before_spent = profile["SPENT"]
-
-                    for gift in filtered_gifts:
-                        gift_id = gift["id"]
-                        gift_price = gift["price"]
-                        gift_total_count = gift["supply"]
-                        sticker_file_id = gift["sticker_file_id"]
-
-                        # Проверяем лимит перед каждой покупкой
-                        while (profile["BOUGHT"] < COUNT and
-                               profile["SPENT"] + gift_price <= LIMIT):
-                            success = await buy_gift(
-                                bot=bot,
-                                env_user_id=user_id,  # Используем user_id вместо USER_ID
-                                gift_id=gift_id,
-                                user_id=TARGET_USER_ID,
-                                chat_id=TARGET_CHAT_ID,
-                                gift_price=gift_price,
-                                file_id=sticker_file_id
-                            )
-
-                            if not success:
-                                any_success = False
-                                break  # Не удалось купить — пробуем следующий подарок
-
-                            config = await get_valid_config(user_id)
-                            profile = config["PROFILES"][profile_index]
-                            profile["BOUGHT"] += 1
-                            profile["SPENT"] += gift_price
-                            purchases.append({"id": gift_id, "price": gift_price})
-                            await save_config(config, user_id)
-                            await asyncio.sleep(PURCHASE_COOLDOWN)
-
-                            # Проверяем: не достигли ли лимит после покупки
-                            if profile["SPENT"] >= LIMIT:
-                                break
-
-                        if profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT:
-                            break  # Достигли лимит либо по количеству, либо по сумме
-
-                    after_bought = profile["BOUGHT"]
-                    after_spent = profile["SPENT"]
-                    made_local_progress = (after_bought > before_bought) or (after_spent > before_spent)
-
-                    # Профиль полностью выполнен: либо по количеству, либо по лимиту
-                    if (profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT) and not profile["DONE"]:
-                        config = await get_valid_config(user_id)
-                        profile = config["PROFILES"][profile_index]
-                        profile["DONE"] = True
-                        await save_config(config, user_id)
-
-                        target_display = get_target_display(profile, user_id)
-                        summary_lines = [
-                            f"\n┌✅ <b>Профиль {profile_index+1}</b>\n"
-                            f"├👤 <b>Получатель:</b> {target_display}\n"
-                            f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
-                            f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
-                        ]
-                        gift_summary = {}
-                        for p in purchases:
-                            key = p["id"]
-                            if key not in gift_summary:
-                                gift_summary[key] = {"price": p["price"], "count": 0}
-                            gift_summary[key]["count"] += 1
-
-                        gift_items = list(gift_summary.items())
-                        for idx, (gid, data) in enumerate(gift_items):
-                            prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
-                            summary_lines.append(
-                                f"{prefix} {data['price']:,} ★ × {data['count']}"
-                            )
-                        report_message_lines += summary_lines
-
-                        logger.info(f"Профиль #{profile_index+1} завершён для user_id={user_id}")
-                        progress_made = True
-                        await refresh_balance(bot, user_id)  # Передаём user_id
-                        continue  # К следующему профилю
-
-                    # Если ничего не куплено — баланс/лимит/подарки кончились
-                    if (profile["BOUGHT"] < COUNT or profile["SPENT"] < LIMIT) and not profile["DONE"] and made_local_progress:
-                        target_display = get_target_display(profile, user_id)
-                        summary_lines = [
-                            f"\n┌⚠️ <b>Профиль {profile_index+1}</b> (частично)\n"
-                            f"├👤 <b>Получатель:</b> {target_display}\n"
-                            f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
-                            f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
-                        ]
-                        gift_summary = {}
-                        for p in purchases:
-                            key = p["id"]
-                            if key not in gift_summary:
-                                gift_summary[key] = {"price": p["price"], "count": 0}
-                            gift_summary[key]["count"] += 1
-
-                        gift_items = list(gift_summary.items())
-                        for idx, (gid, data) in enumerate(gift_items):
-                            prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
-                            summary_lines.append(
-                                f"{prefix} {data['price']:,} ★ × {data['count']}"
-                            )
-                        report_message_lines += summary_lines
-
-                        logger.warning(f"Профиль #{profile_index+1} не завершён для user_id={user_id}")
-                        progress_made = True
-                        await refresh_balance(bot, user_id)  # Передаём user_id
-                        continue  # К следующему профилю
-
-                if not any_success and not progress_made:
-                    logger.warning(
-                        f"Не удалось купить ни один подарок ни в одном профиле для user_id={user_id}"
-                    )
-                    config["ACTIVE"] = False
-                    await save_config(config, user_id)
-                    text = "⚠️ Найдены подходящие подарки, но <b>не удалось</b> купить.\n💰 Пополните баланс!\n🚦 Статус изменён на 🔴 (неактивен)."
-                    message = await bot.send_message(chat_id=user_id, text=text)
-                    await update_menu(
-                        bot=bot, chat_id=user_id, user_id=user_id, message_id=message.message_id
-                    )
-
-                # После обработки всех профилей:
-                if progress_made:
-                    config["ACTIVE"] = not all(p.get("DONE") for p in config["PROFILES"])
-                    await save_config(config, user_id)
-                    logger.info(f"Отчёт: хотя бы один профиль обработан для user_id={user_id}")
-                    text = "🍀 <b>Отчёт по профилям:</b>\n"
-                    text += "\n".join(report_message_lines) if report_message_lines else "⚠️ Покупок не совершено."
-                    message = await bot.send_message(chat_id=user_id, text=text)
-                    await update_menu(
-                        bot=bot, chat_id=user_id, user_id=user_id, message_id=message.message_id
-                    )
-
-                if all(p.get("DONE") for p in config["PROFILES"]) and config["ACTIVE"]:
-                    config["ACTIVE"] = False
-                    await save_config(config, user_id)
-                    text = "✅ Все профили <b>завершены</b>!\n⚠️ Нажмите ♻️ <b>Сбросить</b> или ✏️ <b>Изменить</b>!"
-                    message = await bot.send_message(chat_id=user_id, text=text)
-                    await update_menu(
-                        bot=bot, chat_id=user_id, user_id=user_id, message_id=message.message_id
-                    )
-
-        except Exception as e:
-            logger.error(f"Ошибка в gift_purchase_worker для user_id={user_id}: {e}")
+    global session, bot, dp, lag_monitor, shard_supervisor
+    setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT)
+    tracer.path = TRACE_PATH
+
+    session = PooledAiohttpSession(
+        limit=HTTP_POOL_LIMIT,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        timeout=HTTP_REQUEST_TIMEOUT
+    )
+    bot = Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(RequestPriorityMiddleware(scheduler))
+    bot.session.middleware(RequestMetricsMiddleware())
+    if EXTRA_TOKENS:
+        # Боты пула работают через общую сессию (и её мидлвари), апдейты принимает только основной.
+        # Бюджет каждого токена делят главный процесс и шарды воркера
+        token_pool.configure(
+            [bot] + [Bot(token=token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML)) for token in EXTRA_TOKENS],
+            concurrency=max(1, TOKEN_SEND_CONCURRENCY // (WORKER_SHARDS + 1)),
+            interval=TOKEN_SEND_INTERVAL * (WORKER_SHARDS + 1)
+        )
+    # Разные пользователи — параллельно, апдейты одного пользователя — по порядку
+    update_isolation = UserOrderedIsolation(max_in_flight=MAX_IN_FLIGHT_UPDATES)
+    dp = Dispatcher(
+        storage=SQLiteStorage(maxsize=FSM_CACHE_SIZE, ttl=FSM_TTL),
+        events_isolation=update_isolation
+    )
+    rate_limit = RateLimitMiddleware(
+        commands_limits={"/start": 3, "/withdraw_all": 3, "/grant_access": 3, "/revoke_access": 3, "/profile": 3},
+        callback_limit=0.5,
+        callback_burst=5
+    )
+    dp.message.middleware(rate_limit)
+    dp.callback_query.middleware(rate_limit)
+    dp.message.middleware(AccessControlMiddleware())
+    dp.callback_query.middleware(AccessControlMiddleware())
+    if UPDATES_RECORD_PATH:
+        dp.update.outer_middleware(UpdateRecorderMiddleware(UPDATES_RECORD_PATH))
+
+    # Глубины очередей и счётчики считаются в момент запроса метрик
+    registry.gauge("outbox_pending_chats", "Чатов с неотправленными уведомлениями", func=outbox.qsize)
+    registry.gauge(
+        "updates_in_progress", "Апдейты в обработке и в очереди", ("state",),
+        func=lambda: {("in_flight",): update_isolation.in_flight, ("queued",): update_isolation.stats()["queued"]}
+    )
+    registry.gauge("api_requests_in_flight", "Выполняемые запросы к Bot API", func=lambda: scheduler.in_flight)
+    registry.gauge(
+        "api_requests_waiting", "Запросы к Bot API в очереди планировщика", ("priority",),
+        func=lambda: {(priority,): count for priority, count in scheduler.stats()["waiting"].items()}
+    )
+    registry.gauge(
+        "http_connections", "Соединения пула HTTP: открыто и переиспользовано", ("event",),
+        func=lambda: {("created",): session.connections_created, ("reused",): session.connections_reused}
+    )
+    registry.gauge("db_operations", "Обращения к базе с момента запуска", ("op",), func=lambda: {(op,): n for op, n in db_stats.items()})
+    registry.gauge(
+        "executor_jobs", "Задачи пулов процессов и потоков: отправлено и не уложилось в таймаут", ("pool", "event"),
+        func=lambda: {
+            **{(pool, "submitted"): n for pool, n in executor.submitted.items()},
+            **{(pool, "timeout"): n for pool, n in executor.timeouts.items()}
+        }
+    )
+
+    # Перебор комбинаций для возврата звёзд — в процессах, разбор крупных JSON — в потоках
+    executor.configure(processes=CPU_WORKERS, threads=IO_WORKERS, preload=CPU_JOB_MODULES)
+
+    # Задержка цикла событий и стеки вызовов, которые его блокируют
+    lag_monitor = LoopLagMonitor(interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD)
+
+    if EXTRA_TOKENS:
+        registry.gauge(
+            "bot_token_stars", "Доступный баланс звёзд токенов пула", ("token",),
+            func=lambda: {(index,): stats["stars"] for index, stats in token_pool.stats().items() if stats["stars"] is not None}
+        )
+        registry.gauge(
+            "bot_token_in_flight", "Выполняемые send_gift по токенам пула", ("token",),
+            func=lambda: {(index,): stats["in_flight"] for index, stats in token_pool.stats().items()}
+        )
+
+    shard_supervisor = ShardSupervisor(WORKER_SHARDS)
+    if WORKER_SHARDS:
+        registry.gauge(
+            "worker_shards", "Шарды воркера покупок: живых процессов и перезапусков", ("state",),
+            func=lambda: {("alive",): shard_supervisor.stats()["alive"], ("restarts",): sum(shard_supervisor.stats()["restarts"].values())}
+        )
+
+    register_wizard_handlers(dp)
+    register_catalog_handlers(dp)
+    register_main_handlers(
+        dp=dp,
+        bot=bot,
+        version=VERSION
+    )
+
+async def warm_up() -> asyncio.Task:
+    """
+    Прогрев перед запуском polling: параллельно загружает список разрешённых пользователей,
+    их конфиги (с отрисовкой меню и проверкой каналов-получателей), базовый снимок каталога
+    и данные бота. Воркер помечается готовым, только когда снимок каталога загружен.
 
-        await asyncio.sleep(0.5)
+    Returns:
+        asyncio.Task: Задача загрузки каталога — она может ещё выполняться.
+    """
+    started = time.monotonic()
+    allowed_user_ids = await get_allowed_users()
+
+    async def warm_user(user_id: int) -> None:
+        config = await get_valid_config(user_id)
+        format_config_summary(config, user_id)
+        for profile in config["PROFILES"]:
+            if profile["TARGET_CHAT_ID"]:
+                await resolve_chat(bot, profile["TARGET_CHAT_ID"])
+
+    async def warm_catalog() -> None:
+        while True:
+            try:
+                snapshot = await get_catalog_snapshot(bot, force=True)
+                startup_stats["catalog_size"] = len(snapshot.gifts)
+                startup_stats["catalog_seconds"] = time.monotonic() - started
+                worker_ready.set()
+                return
+            except Exception as e:
+                logger.error("Не удалось загрузить базовый каталог: %s. Повтор через 1 секунду...", e)
+                await asyncio.sleep(1)
+
+    catalog_task = asyncio.create_task(warm_catalog())
+    results = await asyncio.gather(
+        bot.me(),
+        session.warm(bot, HTTP_WARM_CONNECTIONS),
+        *(warm_user(user_id) for user_id in allowed_user_ids),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Ошибка при прогреве: %s", result)
+
+    # Ждём каталог недолго: если Telegram недоступен, polling запускается, а воркер дождётся каталога сам
+    try:
+        await asyncio.wait_for(asyncio.shield(catalog_task), timeout=10)
+    except asyncio.TimeoutError:
+        logger.warning("Базовый каталог ещё не загружен, воркер запустится после его загрузки")
+
+    startup_stats["users"] = len(allowed_user_ids)
+    startup_stats["warm_up_seconds"] = time.monotonic() - started
+    logger.info(
+        "Прогрев завершён за %.2f с: пользователей — %s, подарков в каталоге — %s, соединений — %s",
+        startup_stats["warm_up_seconds"], len(allowed_user_ids), startup_stats.get("catalog_size", "—"),
+        session.connections_created
+    )
+    return catalog_task
 
 async def main() -> None:
     """
-    Точка входа: инициализация базы данных, добавление админа, запуск воркера и polling.
+    Точка входа: инициализация базы данных, добавление админа, запуск воркера, отправки уведомлений
+    и приёма апдейтов (polling или webhook, в зависимости от BOT_MODE).
     """
     logger.info("Бот запущен!")
-    await init_db()  # Инициализация базы данных
-    await add_allowed_user(USER_ID)  # Добавляем админа в список разрешённых
-    await ensure_config(USER_ID)  # Создаём конфиг для админа
-    asyncio.create_task(gift_purchase_worker())
-    await dp.start_polling(bot)
+    executor.warm()
+    # Ссылки на фоновые задачи держим сами: иначе их может собрать сборщик мусора, а при остановке их нужно отменить
+    tasks = [asyncio.create_task(lag_monitor.run())]
+    try:
+        await init_db()  # Инициализация базы данных
+        await add_allowed_user(USER_ID)  # Добавляем админа в список разрешённых
+        await ensure_config(USER_ID)  # Создаём конфиг для админа
+        if METRICS_PORT:
+            await start_metrics_server(METRICS_HOST, int(METRICS_PORT))
+        tasks.append(await warm_up())
+        tasks.append(asyncio.create_task(outbox.run(bot)))
+        tasks.append(asyncio.create_task(session.keep_alive(bot, HTTP_WARM_CONNECTIONS, HTTP_KEEPALIVE_INTERVAL)))
+        if EXTRA_TOKENS:
+            tasks.append(asyncio.create_task(token_pool.keep_refreshed(TOKEN_BALANCE_REFRESH)))
+        if WORKER_SHARDS:
+            # Покупки — в дочерних процессах, здесь остаются приём апдейтов и меню
+            outbox.global_interval = OUTBOX_GLOBAL_INTERVAL * (WORKER_SHARDS + 1)
+            purchase_pacer.interval = PURCHASE_GLOBAL_INTERVAL * (WORKER_SHARDS + 1)
+            scheduler.capacity = max(1, API_CONCURRENCY // (WORKER_SHARDS + 1))
+            tasks.append(asyncio.create_task(shard_supervisor.run()))
+        else:
+            tasks.append(asyncio.create_task(gift_purchase_worker(bot, worker_ready)))
+        if BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            # getUpdates не работает, пока установлен webhook (например, после запуска в режиме webhook)
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def run_webhook() -> None:
+    """
+    Запускает aiohttp-сервер, принимающий апдейты от Telegram через webhook.
+    Запросы без верного секретного токена (WEBHOOK_SECRET, обязателен в этом режиме) отклоняются.
+    Если WEBHOOK_URL не задан, webhook не регистрируется — режим для локальной проверки через utils.replay.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=WEBHOOK_BACKGROUND,
+        secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+    logger.info("Webhook слушает %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
 
 if __name__ == "__main__":
+    setup()
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
\ No newline at end of file
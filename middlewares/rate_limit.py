@@ -4,34 +4,100 @@ import logging
 
 # --- Сторонние библиотеки ---
 from aiogram import BaseMiddleware
-from aiogram.types import Message, TelegramObject
+from aiogram.types import Message, CallbackQuery, TelegramObject
 
 logger = logging.getLogger(__name__)
 
+CALLBACK_KEY = "callback"
+
 class RateLimitMiddleware(BaseMiddleware):
-    def __init__(self, commands_limits: dict = None, allowed_user_ids: list[int] = None):
-        self.last_times = {}  # user_id -> {command: timestamp}
+    """
+    Ограничение частоты команд (и, опционально, нажатий на inline-кнопки) по алгоритму token bucket.
+    Для каждой пары (пользователь, команда) хранится корзина на burst запросов, пополняемая
+    на один запрос каждые limit секунд. Заполненные корзины периодически удаляются, поэтому память
+    зависит только от числа недавно активных пользователей.
+    """
+    def __init__(
+            self,
+            commands_limits: dict = None,
+            allowed_user_ids: list[int] = None,
+            burst: int = 1,
+            callback_limit: float | None = None,
+            callback_burst: int = 5,
+            cleanup_interval: float = 60
+    ):
         self.commands_limits = commands_limits or {}  # command: seconds
-        self.allowed_user_ids = allowed_user_ids or []
+        self.allowed_user_ids = set(allowed_user_ids or [])
+        self.burst = burst
+        self.callback_limit = callback_limit
+        self.callback_burst = callback_burst
+        self.cleanup_interval = cleanup_interval
+        self.buckets = {}  # (user_id, command) -> (tokens, updated_at, full_at)
+        self._next_cleanup = time.monotonic() + cleanup_interval
 
     async def __call__(self, handler, event: TelegramObject, data: dict):
-        message = data.get("message") or data.get("event_message") or event
-        if not isinstance(message, Message):
+        if isinstance(event, Message):
+            if not event.text or not event.from_user:
+                return await handler(event, data)
+            # Команда без аргументов и без @username бота
+            command = event.text.split(maxsplit=1)[0].split("@", 1)[0]
+            limit = self.commands_limits.get(command)
+            burst = self.burst
+        elif isinstance(event, CallbackQuery):
+            command = CALLBACK_KEY
+            limit = self.callback_limit
+            burst = self.callback_burst
+        else:
             return await handler(event, data)
 
-        user_id = message.from_user.id
-        if user_id in self.allowed_user_ids:
+        if limit is None or event.from_user.id in self.allowed_user_ids:
             return await handler(event, data)
-        text = message.text
+
         now = time.monotonic()
+        if now >= self._next_cleanup:
+            self.cleanup(now)
+
+        if not self.allow(event.from_user.id, command, limit, burst, now):
+            if isinstance(event, CallbackQuery):
+                await event.answer("⏳ Слишком часто. Попробуйте чуть позже.")
+            else:
+                await event.answer("⏳ Не спамьте, пожалуйста. Попробуйте чуть позже.")
+            return  # игнорируем спам
+        return await handler(event, data)
+
+    def allow(self, user_id: int, command: str, limit: float, burst: int, now: float) -> bool:
+        """
+        Проверяет и расходует один запрос из корзины пользователя.
+
+        Args:
+            user_id: ID пользователя.
+            command: Команда или CALLBACK_KEY для нажатий на кнопки.
+            limit: Время пополнения одного запроса в секундах.
+            burst: Размер корзины.
+            now: Текущее время (time.monotonic()).
+
+        Returns:
+            bool: True, если запрос разрешён.
+        """
+        key = (user_id, command)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens, updated_at, _ = bucket
+            tokens = min(burst, tokens + (now - updated_at) / limit) if limit > 0 else burst
+        if tokens < 1:
+            return False
+        tokens -= 1
+        self.buckets[key] = (tokens, now, now + (burst - tokens) * limit)
+        return True
+
+    def cleanup(self, now: float) -> None:
+        """
+        Удаляет корзины, которые уже полностью пополнились.
 
-        if text:
-            for cmd, limit in self.commands_limits.items():
-                if text.split()[0] == cmd:  # Только команда без аргументов/или с ними
-                    user_times = self.last_times.setdefault(user_id, {})
-                    last = user_times.get(cmd, 0)
-                    if now - last < limit:
-                        await message.answer("⏳ Не спамьте, пожалуйста. Попробуйте чуть позже.")
-                        return  # игнорируем спам
-                    user_times[cmd] = now
-        return await handler(event, data)
\ No newline at end of file
+        Args:
+            now: Текущее время (time.monotonic()).
+        """
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[2] > now}
+        self._next_cleanup = now + self.cleanup_interval
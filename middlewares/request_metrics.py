@@ -0,0 +1,31 @@
+# --- Стандартные библиотеки ---
+import time
+
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod, Response
+
+# --- Внутренние модули ---
+from utils.metrics import registry
+
+API_REQUESTS = registry.counter("bot_api_requests_total", "Запросы к Bot API", ("method",))
+API_ERRORS = registry.counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+API_LATENCY = registry.histogram("bot_api_request_duration_seconds", "Длительность запросов к Bot API", ("method",))
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Мидлварь сессии бота: считает запросы к Bot API, ошибки по классам исключений и гистограмму задержек по методам.
+    Подключается через bot.session.middleware(...) после планировщика, чтобы не учитывать ожидание в очереди.
+    """
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        api_method = method.__api_method__
+        API_REQUESTS.inc(method=api_method)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(method=api_method, error=type(e).__name__)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, method=api_method)
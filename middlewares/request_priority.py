@@ -0,0 +1,25 @@
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod, Response
+
+# --- Внутренние модули ---
+from services.scheduler import RequestScheduler
+
+class RequestPriorityMiddleware(BaseRequestMiddleware):
+    """
+    Мидлварь сессии бота: пропускает каждый запрос к Bot API через планировщик с приоритетами.
+    Подключается через bot.session.middleware(...).
+    """
+    def __init__(self, scheduler: RequestScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        priority = self.scheduler.priority(method.__api_method__)
+        if priority is None:
+            return await make_request(bot, method)
+        await self.scheduler.acquire(priority)
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.scheduler.release()
@@ -0,0 +1,45 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+
+# --- Сторонние библиотеки ---
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+# --- Внутренние модули ---
+from utils.executor import executor
+
+logger = logging.getLogger(__name__)
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """
+    Записывает входящие апдейты в JSONL-файл (по одному апдейту в строке).
+    Апдейт только ставится в очередь, а в файл строки пишет фоновая задача пачками
+    через пул потоков, чтобы запись на диск не блокировала цикл событий.
+    Записанный файл можно воспроизвести на локальном webhook-сервере через `python -m utils.replay`.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._writer: asyncio.Task | None = None
+
+    def _append(self, lines: list[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    async def _write_loop(self) -> None:
+        while True:
+            lines = [await self._queue.get()]
+            while not self._queue.empty():
+                lines.append(self._queue.get_nowait())
+            try:
+                await executor.run_io(self._append, lines)
+            except OSError as e:
+                logger.error("Не удалось записать %s апдейтов: %s", len(lines), e)
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        if isinstance(event, Update):
+            if self._writer is None or self._writer.done():
+                self._writer = asyncio.create_task(self._write_loop())
+            self._queue.put_nowait(event.model_dump_json(exclude_none=True) + "\n")
+        return await handler(event, data)
@@ -1,13 +1,83 @@
 # --- Стандартные библиотеки ---
 from itertools import combinations
+import asyncio
 import logging
+import time
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, save_config
+from services.config import (
+    get_valid_config,
+    update_config,
+    REFUND_EXACT_LIMIT,
+    REFUND_INLINE_LIMIT,
+    REFUND_SEARCH_BUDGET,
+    REFUND_SEARCH_TIMEOUT
+)
+from utils.executor import executor
+from database import get_pool_spent
 from aiogram import Bot
 
 logger = logging.getLogger(__name__)
 
+def greedy_refund_combination(amounts: list[int], balance: int) -> list[int]:
+    """
+    Жадно набирает депозиты от крупных к мелким, пока сумма не превышает баланс.
+
+    Args:
+        amounts: Суммы депозитов.
+        balance: Баланс, который нужно вывести.
+
+    Returns:
+        list[int]: Индексы выбранных депозитов.
+    """
+    chosen = []
+    total = 0
+    for i in sorted(range(len(amounts)), key=lambda i: amounts[i], reverse=True):
+        if total + amounts[i] <= balance:
+            chosen.append(i)
+            total += amounts[i]
+    return chosen
+
+def find_refund_combination(amounts: list[int], balance: int, exact_limit: int = 18, time_budget: float | None = None) -> list[int]:
+    """
+    Подбирает депозиты с максимальной суммой, не превышающей баланс.
+    До exact_limit депозитов перебирает все комбинации, иначе набирает жадно.
+    Чисто вычислительная функция: выполняется в пуле процессов (utils.executor).
+
+    Args:
+        amounts: Суммы депозитов.
+        balance: Баланс, который нужно вывести.
+        exact_limit: Максимальное число депозитов для полного перебора.
+        time_budget: Ограничение перебора в секундах; по его истечении возвращается
+            лучший из найденного и жадного вариантов.
+
+    Returns:
+        list[int]: Индексы выбранных депозитов.
+    """
+    n = len(amounts)
+    if n > exact_limit:
+        return greedy_refund_combination(amounts, balance)
+
+    deadline = time.monotonic() + time_budget if time_budget else None
+    best_combo = ()
+    best_sum = 0
+    checked = 0
+    for r in range(1, n + 1):
+        for combo in combinations(range(n), r):
+            s = sum(amounts[i] for i in combo)
+            if s <= balance and s > best_sum:
+                best_combo = combo
+                best_sum = s
+            if best_sum == balance:
+                return list(best_combo)
+            checked += 1
+            if deadline and checked % 4096 == 0 and time.monotonic() > deadline:
+                greedy = greedy_refund_combination(amounts, balance)
+                if sum(amounts[i] for i in greedy) > best_sum:
+                    return greedy
+                return list(best_combo)
+    return list(best_combo)
+
 async def get_stars_balance(bot: Bot, user_id: int) -> int:
     """
     Получает суммарный баланс звёзд по транзакциям пользователя через API бота.
@@ -42,15 +112,46 @@ async def get_stars_balance(bot: Bot, user_id: int) -> int:
 
             offset += limit
         except Exception as e:
-            logger.error(f"Ошибка при получении транзакций для user_id={user_id}: {e}")
+            logger.error("Ошибка при получении транзакций для user_id=%s: %s", user_id, e)
             break
 
-    logger.info(f"Получен баланс для user_id={user_id}: {balance}")
+    logger.info("Получен баланс для user_id=%s: %s", user_id, balance)
+    return balance
+
+async def get_bot_star_balance(bot: Bot) -> int:
+    """
+    Считает общий баланс звёзд бота по всем его транзакциям: входящие минус исходящие
+    (возвраты, покупки подарков, выводы).
+
+    Args:
+        bot: Экземпляр бота.
+
+    Returns:
+        int: Баланс бота.
+
+    Raises:
+        TelegramAPIError: Если не удалось получить транзакции.
+    """
+    offset = 0
+    limit = 100
+    balance = 0
+    while True:
+        transactions = (await bot.get_star_transactions(offset=offset, limit=limit)).transactions
+        if not transactions:
+            break
+        for transaction in transactions:
+            if transaction.source is not None:
+                balance += transaction.amount
+            else:
+                balance -= transaction.amount
+        offset += limit
     return balance
 
 async def refresh_balance(bot: Bot, user_id: int) -> int:
     """
     Обновляет и сохраняет баланс звёзд в конфиге пользователя, возвращает актуальное значение.
+    Баланс считается по транзакциям основного бота минус покупки через другие токены пула
+    (журнал трат в базе): их транзакции основной бот не видит.
 
     Args:
         bot: Экземпляр бота.
@@ -60,14 +161,12 @@ async def refresh_balance(bot: Bot, user_id: int) -> int:
         int: Текущий баланс.
     """
     try:
-        balance = await get_stars_balance(bot, user_id)
-        config = await get_valid_config(user_id)
-        config["BALANCE"] = balance
-        await save_config(config, user_id)
-        logger.info(f"Баланс обновлён для user_id={user_id}: {balance}")
+        balance = max(0, await get_stars_balance(bot, user_id) - await get_pool_spent(user_id))
+        await update_config(user_id, lambda config: config.update(BALANCE=balance))
+        logger.info("Баланс обновлён для user_id=%s: %s", user_id, balance)
         return balance
     except Exception as e:
-        logger.error(f"Ошибка при обновлении баланса для user_id={user_id}: {e}")
+        logger.error("Ошибка при обновлении баланса для user_id=%s: %s", user_id, e)
         config = await get_valid_config(user_id)
         return config.get("BALANCE", 0)
 
@@ -84,14 +183,14 @@ async def change_balance(bot: Bot, user_id: int, delta: int) -> int:
         int: Новый баланс.
     """
     try:
-        config = await get_valid_config(user_id)
-        config["BALANCE"] = max(0, config.get("BALANCE", 0) + delta)
+        config = await update_config(
+            user_id, lambda config: config.update(BALANCE=max(0, config.get("BALANCE", 0) + delta))
+        )
         balance = config["BALANCE"]
-        await save_config(config, user_id)
-        logger.info(f"Баланс изменён для user_id={user_id}: {balance}")
+        logger.info("Баланс изменён для user_id=%s: %s", user_id, balance)
         return balance
     except Exception as e:
-        logger.error(f"Ошибка при изменении баланса для user_id={user_id}: {e}")
+        logger.error("Ошибка при изменении баланса для user_id=%s: %s", user_id, e)
         config = await get_valid_config(user_id)
         return config.get("BALANCE", 0)
 
@@ -112,7 +211,7 @@ async def refund_all_star_payments(bot: Bot, user_id: int, username: str, messag
     try:
         balance = await refresh_balance(bot, user_id)
         if balance <= 0:
-            logger.info(f"Баланс user_id={user_id} равен 0, возврат не требуется")
+            logger.info("Баланс user_id=%s равен 0, возврат не требуется", user_id)
             return {"refunded": 0, "count": 0, "txn_ids": [], "left": 0, "next_deposit": None}
 
         # Получаем все транзакции
@@ -128,7 +227,7 @@ async def refund_all_star_payments(bot: Bot, user_id: int, username: str, messag
                 all_txns.extend(txns)
                 offset += limit
             except Exception as e:
-                logger.error(f"Ошибка при получении транзакций для user_id={user_id}: {e}")
+                logger.error("Ошибка при получении транзакций для user_id=%s: %s", user_id, e)
                 break
 
         # Фильтруем депозиты без возврата и только с нужным username
@@ -142,34 +241,26 @@ async def refund_all_star_payments(bot: Bot, user_id: int, username: str, messag
         refunded_ids = {t.id for t in all_txns if t.source is None}
         unrefunded_deposits = [t for t in deposits if t.id not in refunded_ids]
 
-        n = len(unrefunded_deposits)
-        best_combo = []
-        best_sum = 0
-
-        # Ищем идеальную комбинацию или greedy
-        if n <= 18:
-            for r in range(1, n + 1):
-                for combo in combinations(unrefunded_deposits, r):
-                    s = sum(t.amount for t in combo)
-                    if s <= balance and s > best_sum:
-                        best_combo = combo
-                        best_sum = s
-                    if best_sum == balance:
-                        break
-                if best_sum == balance:
-                    break
+        # Ищем идеальную комбинацию или greedy. Полный перебор (до 2^18 сумм) идёт в пуле процессов,
+        # чтобы не останавливать цикл событий и покупки других пользователей
+        amounts = [t.amount for t in unrefunded_deposits]
+        if len(amounts) <= REFUND_INLINE_LIMIT:
+            indices = find_refund_combination(amounts, balance, REFUND_EXACT_LIMIT)
         else:
-            unrefunded_deposits.sort(key=lambda t: t.amount, reverse=True)
-            curr_sum = 0
-            best_combo = []
-            for t in unrefunded_deposits:
-                if curr_sum + t.amount <= balance:
-                    best_combo.append(t)
-                    curr_sum += t.amount
-            best_sum = curr_sum
+            try:
+                indices = await executor.run_cpu(
+                    find_refund_combination, amounts, balance, REFUND_EXACT_LIMIT, REFUND_SEARCH_BUDGET,
+                    timeout=REFUND_SEARCH_TIMEOUT
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Перебор депозитов для user_id=%s не выполнен (%r), использую жадный подбор", user_id, e)
+                indices = greedy_refund_combination(amounts, balance)
+        best_combo = [unrefunded_deposits[i] for i in indices]
 
         if not best_combo:
-            logger.info(f"Нет подходящих депозитов для возврата для user_id={user_id}")
+            logger.info("Нет подходящих депозитов для возврата для user_id=%s", user_id)
             return {"refunded": 0, "count": 0, "txn_ids": [], "left": balance, "next_deposit": None}
 
         # Делаем возвраты только по выбранным транзакциям
@@ -186,9 +277,9 @@ async def refund_all_star_payments(bot: Bot, user_id: int, username: str, messag
                 )
                 total_refunded += txn.amount
                 refund_ids.append(txn_id)
-                logger.info(f"Возврат {txn.amount} звёзд для user_id={user_id}, txn_id={txn_id}")
+                logger.info("Возврат %s звёзд для user_id=%s, txn_id=%s", txn.amount, user_id, txn_id)
             except Exception as e:
-                logger.error(f"Ошибка при возврате {txn.amount} звёзд для user_id={user_id}: {e}")
+                logger.error("Ошибка при возврате %s звёзд для user_id=%s: %s", txn.amount, user_id, e)
                 if message_func:
                     await message_func(f"🚫 Ошибка при возврате ★{txn.amount}")
 
@@ -215,5 +306,5 @@ async def refund_all_star_payments(bot: Bot, user_id: int, username: str, messag
             "next_deposit": next_possible
         }
     except Exception as e:
-        logger.error(f"Ошибка при возврате платежей для user_id={user_id}: {e}")
+        logger.error("Ошибка при возврате платежей для user_id=%s: %s", user_id, e)
         return {"refunded": 0, "count": 0, "txn_ids": [], "left": balance, "next_deposit": None}
\ No newline at end of file
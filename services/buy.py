@@ -2,18 +2,71 @@
 import asyncio
 import logging
 import random
+import time
+from contextlib import nullcontext
+from typing import Awaitable, Callable
 
 # --- Сторонние библиотеки ---
 from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
 from aiogram import Bot
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, save_config, DEV_MODE
+from services.config import (
+    get_valid_config,
+    update_config,
+    count_purchase,
+    config_lock,
+    DEV_MODE,
+    BULK_PURCHASE_CONCURRENCY,
+    BULK_PURCHASE_INTERVAL,
+    BULK_PROGRESS_INTERVAL,
+    PURCHASE_GLOBAL_INTERVAL
+)
 from services.balance import change_balance
+from services.chats import resolve_chat_id
+from services.scheduler import scheduler, PRIORITY_PURCHASE, PRIORITY_INTERACTIVE
+from services.tokens import token_pool
+from database import record_spend
+from utils.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
 
+class PurchasePacer:
+    """
+    Общий темп отправки запросов send_gift для нескольких параллельных покупок.
+    Выдерживает минимальный интервал между запросами и общую паузу после flood wait.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """
+        Ждёт, пока можно будет отправить следующий запрос.
+        """
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Откладывает все следующие запросы на указанное время (например, после TelegramRetryAfter).
+
+        Args:
+            seconds: Длительность паузы в секундах.
+        """
+        self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+# Общий темп send_gift основного токена на весь процесс; шарды делят его (см. services.shards)
+purchase_pacer = PurchasePacer(PURCHASE_GLOBAL_INTERVAL)
+
+
 async def buy_gift(
         bot: Bot,
         env_user_id: int,
@@ -23,7 +76,8 @@ async def buy_gift(
         gift_price: int,
         file_id: str | None,
         retries: int = 3,
-        add_test_purchases: bool = False
+        add_test_purchases: bool = False,
+        pacer: PurchasePacer | None = None
 ) -> bool:
     """
     Покупает подарок с заданными параметрами и количеством попыток.
@@ -38,6 +92,7 @@ async def buy_gift(
         file_id: ID файла (не используется в этой версии бота).
         retries: Количество попыток при ошибках.
         add_test_purchases: Включает тестовую логику покупки.
+        pacer: Общий темп запросов для параллельных покупок (опционально).
 
     Returns:
         bool: True, если покупка успешна, иначе False.
@@ -45,51 +100,193 @@ async def buy_gift(
     # Тестовая логика
     if add_test_purchases or DEV_MODE:
         result = random.choice([True, True, True, False])
-        logger.info(f"[ТЕСТ] ({result}) Покупка подарка {gift_id} за {gift_price} (имитация, баланс не трогаем)")
+        logger.info("[ТЕСТ] (%s) Покупка подарка %s за %s (имитация, баланс не трогаем)", result, gift_id, gift_price)
         return result
 
     # Обычная логика
-    config = await get_valid_config(env_user_id)
-    balance = config["BALANCE"]
-    if balance < gift_price:
-        logger.error(f"Недостаточно звёзд для покупки подарка {gift_id} (требуется: {gift_price}, доступно: {balance})")
-        config["ACTIVE"] = False
-        await save_config(config, env_user_id)
-        return False
+    with tracer.span("reserve", user_id=env_user_id, gift_id=gift_id) as span:
+        config = await get_valid_config(env_user_id)
+        balance = config["BALANCE"]
+        span["ok"] = balance >= gift_price
+        if balance < gift_price:
+            logger.error("Недостаточно звёзд для покупки подарка %s (требуется: %s, доступно: %s)", gift_id, gift_price, balance)
+            await update_config(env_user_id, lambda config: config.update(ACTIVE=False))
+            return False
+
+        # Username канала заменяем на числовой ID из кэша резолвера. getChat здесь — часть покупки,
+        # поэтому идёт с её приоритетом и не откладывается планировщиком вместе с запросами интерфейса
+        if chat_id is not None:
+            with scheduler.prioritized(PRIORITY_PURCHASE):
+                chat_id = await resolve_chat_id(bot, chat_id)
 
     for attempt in range(1, retries + 1):
+        if pacer:
+            await pacer.wait()
+        token = None
         try:
             if user_id is not None and chat_id is None:
-                result = await bot.send_gift(gift_id=gift_id, user_id=user_id)
+                target = {"user_id": user_id}
             elif user_id is None and chat_id is not None:
-                result = await bot.send_gift(gift_id=gift_id, chat_id=chat_id)
+                target = {"chat_id": chat_id}
             else:
-                logger.error(f"Некорректные параметры: user_id={user_id}, chat_id={chat_id}")
+                logger.error("Некорректные параметры: user_id=%s, chat_id=%s", user_id, chat_id)
                 break
+            # При нескольких токенах покупка уходит на токен со свободным слотом и достаточным балансом
+            lease = token_pool.lease(env_user_id, gift_price) if len(token_pool) > 1 else nullcontext()
+            with tracer.span("send_gift", user_id=env_user_id, gift_id=gift_id, attempt=attempt) as span:
+                async with lease as token:
+                    if token is None:
+                        # Токены пула выдерживают свой темп сами, основной токен — через общий
+                        await purchase_pacer.wait()
+                    # Пока идёт покупка, запросы интерфейса откладываются планировщиком
+                    async with scheduler.purchasing():
+                        result = await (token.bot if token else bot).send_gift(gift_id=gift_id, **target)
+                    if result and token:
+                        token_pool.commit(token, gift_price)
+                span["ok"] = bool(result)
+                if token:
+                    span["token"] = token.index
 
             if result:
-                new_balance = await change_balance(bot, env_user_id, -gift_price)
-                # Обновляем профиль
-                config = await get_valid_config(env_user_id)
-                config["PROFILES"][0]["BOUGHT"] = config["PROFILES"][0].get("BOUGHT", 0) + 1
-                config["PROFILES"][0]["SPENT"] = config["PROFILES"][0].get("SPENT", 0) + gift_price
-                await save_config(config, env_user_id)
-                logger.info(f"Успешная покупка подарка {gift_id} за {gift_price} звёзд. Остаток: {new_balance}")
+                with tracer.span("commit", user_id=env_user_id, gift_id=gift_id):
+                    # Журнал нужен refresh_balance: покупки других токенов не видны в транзакциях основного бота
+                    await record_spend(env_user_id, token.index if token else 0, gift_id, gift_price)
+                    async with config_lock(env_user_id):
+                        new_balance = await change_balance(bot, env_user_id, -gift_price)
+                        # Обновляем профиль
+                        await update_config(env_user_id, lambda config: count_purchase(config, 0, gift_price))
+                logger.info("Успешная покупка подарка %s за %s звёзд. Остаток: %s", gift_id, gift_price, new_balance)
                 return True
 
-            logger.error(f"Попытка {attempt}/{retries}: Не удалось купить подарок {gift_id}. Повтор...")
+            logger.error("Попытка %s/%s: Не удалось купить подарок %s. Повтор...", attempt, retries, gift_id)
 
         except TelegramRetryAfter as e:
-            logger.error(f"Flood wait: ждём {e.retry_after} секунд")
-            await asyncio.sleep(e.retry_after)
+            if token:
+                # Ждёт только этот токен, следующая попытка может уйти на другой
+                logger.error("Flood wait токена #%s: %s секунд", token.index, e.retry_after)
+                token.pause(e.retry_after)
+            else:
+                # Лимит общий для токена — ждут все покупки процесса
+                logger.error("Flood wait: ждём %s секунд", e.retry_after)
+                purchase_pacer.pause(e.retry_after)
 
         except TelegramNetworkError as e:
-            logger.error(f"Попытка {attempt}/{retries}: Сетевая ошибка: {e}. Повтор через {2 ** attempt} секунд...")
+            logger.error("Попытка %s/%s: Сетевая ошибка: %s. Повтор через %s секунд...", attempt, retries, e, 2 ** attempt)
             await asyncio.sleep(2 ** attempt)
 
         except TelegramAPIError as e:
-            logger.error(f"Ошибка Telegram API: {e}")
+            if token and "BALANCE_TOO_LOW" in str(e):
+                logger.error("У токена #%s кончились звёзды, пробуем другой", token.index)
+                token_pool.mark_empty(token)
+                continue
+            logger.error("Ошибка Telegram API: %s", e)
             break
 
-    logger.error(f"Не удалось купить подарок {gift_id} после {retries} попыток.")
-    return False
\ No newline at end of file
+    logger.error("Не удалось купить подарок %s после %s попыток.", gift_id, retries)
+    return False
+
+
+async def buy_gifts_bulk(
+        bot: Bot,
+        env_user_id: int,
+        gift_id: str,
+        user_id: int,
+        chat_id: int,
+        gift_price: int,
+        qty: int,
+        concurrency: int = BULK_PURCHASE_CONCURRENCY,
+        interval: float = BULK_PURCHASE_INTERVAL,
+        progress_func: Callable[[int, int], Awaitable[None]] | None = None,
+        progress_interval: float = BULK_PROGRESS_INTERVAL
+) -> int:
+    """
+    Покупает qty копий подарка несколькими параллельными задачами с общим темпом запросов.
+    Останавливается при первой неудачной покупке (подарок закончился, ошибка API)
+    или когда баланса пользователя не хватает на следующую копию.
+
+    Args:
+        bot: Экземпляр бота.
+        env_user_id: ID пользователя, с баланса которого идёт покупка.
+        gift_id: ID подарка.
+        user_id: ID пользователя-получателя (может быть None).
+        chat_id: ID чата-получателя (может быть None).
+        gift_price: Стоимость подарка.
+        qty: Количество копий.
+        concurrency: Максимум одновременных покупок.
+        interval: Минимальный интервал между запросами send_gift в секундах.
+        progress_func: Функция для отображения прогресса (куплено, всего), вызывается не чаще progress_interval.
+        progress_interval: Минимальный интервал между обновлениями прогресса в секундах.
+
+    Returns:
+        int: Количество купленных подарков.
+    """
+    pacer = PurchasePacer(interval)
+    stop = asyncio.Event()
+    done = asyncio.Event()
+    remaining = qty
+    bought = 0
+    insufficient = False
+
+    # Резервируем баланс заранее, чтобы параллельные покупки не потратили больше, чем есть
+    budget = None
+    if not DEV_MODE:
+        config = await get_valid_config(env_user_id)
+        budget = config["BALANCE"]
+
+    async def purchase_loop() -> None:
+        nonlocal remaining, bought, budget, insufficient
+        while remaining > 0 and not stop.is_set():
+            if budget is not None:
+                if budget < gift_price:
+                    insufficient = True
+                    stop.set()
+                    break
+                budget -= gift_price
+            remaining -= 1
+            success = await buy_gift(
+                bot=bot,
+                env_user_id=env_user_id,
+                gift_id=gift_id,
+                user_id=user_id,
+                chat_id=chat_id,
+                gift_price=gift_price,
+                file_id=None,
+                pacer=pacer
+            )
+            if not success:
+                stop.set()
+                break
+            bought += 1
+
+    async def progress_loop() -> None:
+        reported = 0
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), timeout=progress_interval)
+            except asyncio.TimeoutError:
+                pass
+            if done.is_set() or bought == reported:
+                continue
+            reported = bought
+            try:
+                # Прогресс пользователь ждёт прямо сейчас — drop mode его не откладывает
+                with scheduler.prioritized(PRIORITY_INTERACTIVE):
+                    await progress_func(bought, qty)
+            except Exception as e:
+                logger.warning("Не удалось обновить прогресс покупки для user_id=%s: %s", env_user_id, e)
+
+    progress_task = asyncio.create_task(progress_loop()) if progress_func else None
+    try:
+        await asyncio.gather(*(purchase_loop() for _ in range(max(1, min(concurrency, qty)))))
+    finally:
+        done.set()
+        if progress_task:
+            await progress_task
+
+    if insufficient:
+        logger.error("Недостаточно звёзд для покупки подарка %s: куплено %s из %s", gift_id, bought, qty)
+        async with config_lock(env_user_id):
+            await update_config(env_user_id, lambda config: config.update(ACTIVE=False))
+
+    logger.info("Пакетная покупка подарка %s для user_id=%s: %s/%s", gift_id, env_user_id, bought, qty)
+    return bought
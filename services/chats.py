@@ -0,0 +1,100 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+
+# --- Внутренние модули ---
+from services.config import CHAT_CACHE_TTL, CHAT_NEGATIVE_TTL
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# username -> {"id": ..., "type": ...} или None (чат не найден)
+_chats = TTLCache(maxsize=4096, ttl=CHAT_CACHE_TTL)
+# Запросы get_chat, которые уже выполняются, чтобы не дублировать их
+_pending: dict[str, asyncio.Task] = {}
+_NOT_CACHED = object()
+
+
+def normalize_username(username: str) -> str:
+    """
+    Приводит username к виду "@username" в нижнем регистре.
+
+    Args:
+        username: Username с @ или без.
+
+    Returns:
+        str: Нормализованный username.
+    """
+    username = username.strip()
+    if not username.startswith("@"):
+        username = "@" + username
+    return username.lower()
+
+
+async def resolve_chat(bot: Bot, username: str) -> dict | None:
+    """
+    Определяет ID и тип чата по username с кэшированием результата.
+    Найденные чаты кэшируются на CHAT_CACHE_TTL секунд, ненайденные — на CHAT_NEGATIVE_TTL.
+    Сетевые ошибки не кэшируются.
+
+    Args:
+        bot: Экземпляр бота.
+        username: Username канала или пользователя.
+
+    Returns:
+        dict | None: {"id": ID чата, "type": "channel" | "user" | "bot" | "group" | ...} или None, если чат не найден.
+    """
+    key = normalize_username(username)
+    cached = _chats.get(key, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+
+    task = _pending.get(key)
+    if task is None:
+        task = _pending[key] = asyncio.create_task(_fetch_chat(bot, key))
+        task.add_done_callback(lambda _: _pending.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _fetch_chat(bot: Bot, key: str) -> dict | None:
+    try:
+        chat = await bot.get_chat(key)
+    except TelegramBadRequest as e:
+        logger.warning("Чат %s не найден: %s", key, e)
+        _chats.set(key, None, ttl=CHAT_NEGATIVE_TTL)
+        return None
+    except TelegramAPIError as e:
+        logger.error("Ошибка проверки чата %s: %s", key, e)
+        return None
+
+    if chat.type == "private":
+        chat_type = "bot" if getattr(chat, "is_bot", False) else "user"
+    elif chat.type in ("group", "supergroup"):
+        chat_type = "group"
+    else:
+        chat_type = chat.type
+    result = {"id": chat.id, "type": chat_type}
+    _chats.set(key, result)
+    return result
+
+
+async def resolve_chat_id(bot: Bot, chat_id: int | str) -> int | str:
+    """
+    Возвращает числовой ID чата для username из кэша резолвера.
+    Если чат определить не удалось, возвращает исходное значение.
+
+    Args:
+        bot: Экземпляр бота.
+        chat_id: Числовой ID или username чата.
+
+    Returns:
+        int | str: Числовой ID чата или исходное значение.
+    """
+    if not isinstance(chat_id, str) or not chat_id.startswith("@"):
+        return chat_id
+    chat = await resolve_chat(bot, chat_id)
+    return chat["id"] if chat else chat_id
@@ -1,5 +1,8 @@
-from typing import Optional
-from database import save_config as db_save_config, load_config, ensure_config
+from typing import Optional, Callable
+import asyncio
+import json
+from database import save_config as db_save_config, load_config_record, ensure_config
+from utils.cache import LRUCache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,6 +12,72 @@ VERSION = '1.2.0'
 DEV_MODE = False
 MAX_PROFILES = 3
 PURCHASE_COOLDOWN = 0.3
+RENDER_CACHE_SIZE = 1024
+CONFIG_TRACK_SIZE = 1024
+CONFIG_SAVE_RETRIES = 5
+CATALOG_PAGE_SIZE = 10
+CATALOG_TTL = 5
+BULK_PURCHASE_CONCURRENCY = 5
+BULK_PURCHASE_INTERVAL = 0.1
+BULK_PROGRESS_INTERVAL = 2.0
+PURCHASE_GLOBAL_INTERVAL = 1 / 20
+OUTBOX_CHAT_INTERVAL = 1.0
+OUTBOX_GLOBAL_INTERVAL = 1 / 30
+CHAT_CACHE_TTL = 3600
+CHAT_NEGATIVE_TTL = 60
+FSM_CACHE_SIZE = 1024
+FSM_TTL = 24 * 3600
+MAX_IN_FLIGHT_UPDATES = 64
+HTTP_POOL_LIMIT = 100
+HTTP_KEEPALIVE_TIMEOUT = 75
+HTTP_KEEPALIVE_INTERVAL = 30
+HTTP_REQUEST_TIMEOUT = 60
+HTTP_WARM_CONNECTIONS = BULK_PURCHASE_CONCURRENCY + 1
+API_CONCURRENCY = 20
+DEFER_MAX_WAIT = 5.0
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 120
+PROFILE_TOP = 50
+LOOP_LAG_INTERVAL = 0.1
+LOOP_LAG_THRESHOLD = 0.25
+CPU_WORKERS = 2
+CPU_JOB_MODULES = ["services.balance"]
+IO_WORKERS = 4
+REFUND_EXACT_LIMIT = 18
+REFUND_INLINE_LIMIT = 10
+REFUND_SEARCH_BUDGET = 5.0
+REFUND_SEARCH_TIMEOUT = 10.0
+SHARD_ALLOWED_USERS_TTL = 5
+SHARD_RESTART_DELAY = 5
+SHARD_STOP_TIMEOUT = 10
+TOKEN_SEND_CONCURRENCY = BULK_PURCHASE_CONCURRENCY
+TOKEN_SEND_INTERVAL = BULK_PURCHASE_INTERVAL
+TOKEN_WAIT_TIMEOUT = 10
+TOKEN_BALANCE_REFRESH = 300
+
+# Отрисованные по конфигу тексты по ключу (user_id, вид текста, версия конфига в базе)
+_render_cache = LRUCache(RENDER_CACHE_SIZE)
+# Загруженные конфиги: id(config) -> (config, версия в базе, JSON конфига на момент загрузки)
+_loaded_configs = LRUCache(CONFIG_TRACK_SIZE)
+_MISSING = object()
+# Блокировки для последовательного изменения конфига одного пользователя
+_config_locks: dict[int, asyncio.Lock] = {}
+
+def config_lock(user_id: int) -> asyncio.Lock:
+    """
+    Возвращает блокировку конфига пользователя.
+    Нужна, когда несколько задач одновременно читают и сохраняют один конфиг.
+
+    Args:
+        user_id: ID пользователя.
+
+    Returns:
+        asyncio.Lock: Блокировка конфига.
+    """
+    lock = _config_locks.get(user_id)
+    if lock is None:
+        lock = _config_locks[user_id] = asyncio.Lock()
+    return lock
 
 def DEFAULT_PROFILE(user_id: int) -> dict:
     return {
@@ -88,27 +157,134 @@ async def validate_config(config: dict, user_id: int) -> dict:
                 valid[key] = config[key]
     return valid
 
+def _track(config: dict, version: int, text: str | None) -> None:
+    """
+    Запоминает версию, с которой загружен или сохранён конфиг, и его JSON — базу для слияния в save_config.
+    Копия не создаётся: JSON разбирается заново только при конфликте версий.
+    """
+    _loaded_configs.set(id(config), (config, version, text))
+
+def config_version(config: dict) -> Optional[int]:
+    """
+    Возвращает версию в базе, с которой загружен или сохранён конфиг.
+
+    Args:
+        config: Конфиг из get_valid_config.
+
+    Returns:
+        Optional[int]: Версия конфига или None, если конфиг получен не из get_valid_config.
+    """
+    tracked = _loaded_configs.get(id(config))
+    if tracked is None or tracked[0] is not config:
+        return None
+    return tracked[1]
+
+def _merge(base, mine, theirs):
+    """
+    Трёхстороннее слияние конфигов: изменения theirs относительно base накладываются на mine.
+    Словари и списки одинаковой длины сливаются поэлементно на месте (ссылки на вложенные словари,
+    например на профиль, остаются рабочими); если одно значение изменили обе стороны, остаётся mine.
+
+    Args:
+        base: Конфиг на момент загрузки.
+        mine: Конфиг, который сохраняется (изменяется на месте).
+        theirs: Конфиг, сохранённый в базе другим процессом или задачей.
+
+    Returns:
+        Результат слияния.
+    """
+    if isinstance(mine, dict) and isinstance(base, dict) and isinstance(theirs, dict):
+        for key in list(base) + [k for k in mine if k not in base] + [k for k in theirs if k not in base and k not in mine]:
+            merged = _merge(base.get(key, _MISSING), mine.get(key, _MISSING), theirs.get(key, _MISSING))
+            if merged is _MISSING:
+                mine.pop(key, None)
+            elif mine.get(key, _MISSING) is not merged:
+                mine[key] = merged
+        return mine
+    if isinstance(mine, list) and isinstance(base, list) and isinstance(theirs, list) and len(mine) == len(base) == len(theirs):
+        for index in range(len(mine)):
+            mine[index] = _merge(base[index], mine[index], theirs[index])
+        return mine
+    if mine == base:
+        return theirs
+    return mine
+
 async def get_valid_config(user_id: int, path: str = None) -> dict:
     await ensure_config(user_id)
-    config = await load_config(user_id)
+    config, version, text = await load_config_record(user_id)
     validated = await validate_config(config, user_id)
     if validated != config:
-        await db_save_config(user_id, validated)
+        # Если конфиг тем временем изменил другой процесс, исправленный сохранится при следующей записи
+        text = json.dumps(validated)
+        version = await db_save_config(text, user_id, expected_version=version) or version
+    _track(validated, version, text)
     return validated
 
 async def save_config(config: dict, user_id: int) -> None:
     """
     Сохраняет конфигурацию пользователя в базу данных.
+    Конфиг, полученный из get_valid_config, сохраняется условно — только если версия в базе
+    не изменилась с момента загрузки. Если конфиг тем временем сохранил другой процесс (шард)
+    или задача, его изменения сливаются с нашими (см. _merge) и запись повторяется.
+    Счётчики (баланс, покупки) так не сохраняются: для них есть update_config.
 
     Args:
         config: Конфигурация для сохранения.
         user_id: ID пользователя.
     """
     try:
-        await db_save_config(user_id, config)
-        logger.info(f"Конфигурация сохранена для user_id={user_id}")
+        data = json.dumps(config)
+        tracked = _loaded_configs.get(id(config))
+        if tracked is None or tracked[0] is not config:
+            version = await db_save_config(data, user_id)
+        else:
+            _, expected, base_text = tracked
+            for _ in range(CONFIG_SAVE_RETRIES):
+                version = await db_save_config(data, user_id, expected_version=expected)
+                if version is not None:
+                    break
+                theirs, expected, theirs_text = await load_config_record(user_id)
+                logger.info("Конфиг user_id=%s изменён параллельно (версия %s), сливаю изменения", user_id, expected)
+                _merge(json.loads(base_text) if base_text else {}, config, theirs)
+                data, base_text = json.dumps(config), theirs_text
+            else:
+                logger.warning("Не удалось сохранить конфиг user_id=%s без конфликта, записываю поверх", user_id)
+                version = await db_save_config(data, user_id)
+        _track(config, version, data)
+        logger.debug("Конфигурация сохранена для user_id=%s", user_id)
     except Exception as e:
-        logger.error(f"Ошибка при сохранении конфигурации для user_id={user_id}: {e}")
+        # Версия несохранённого конфига больше не соответствует его содержимому
+        _loaded_configs.pop(id(config))
+        logger.error("Ошибка при сохранении конфигурации для user_id=%s: %s", user_id, e)
+
+async def update_config(user_id: int, mutate: Callable[[dict], None]) -> dict:
+    """
+    Изменяет конфиг пользователя функцией mutate и сохраняет его условно (compare-and-set).
+    При конфликте версий конфиг перечитывается и mutate применяется заново, поэтому
+    приращения счётчиков (баланс, BOUGHT, SPENT) из разных шардов и задач не теряются.
+    Каждый конфликт означает, что чья-то запись прошла, так что повторы конечны.
+
+    Args:
+        user_id: ID пользователя.
+        mutate: Функция, изменяющая конфиг на месте.
+
+    Returns:
+        dict: Изменённый конфиг.
+    """
+    while True:
+        config = await get_valid_config(user_id)
+        mutate(config)
+        data = json.dumps(config)
+        try:
+            version = await db_save_config(data, user_id, expected_version=config_version(config))
+        except Exception as e:
+            logger.error("Ошибка при сохранении конфигурации для user_id=%s: %s", user_id, e)
+            return config
+        if version is not None:
+            _track(config, version, data)
+            logger.debug("Конфигурация обновлена для user_id=%s", user_id)
+            return config
+        logger.info("Конфиг user_id=%s изменён параллельно, повторяю изменение", user_id)
 
 async def add_profile(config: dict, profile: dict, user_id: int, save: bool = True) -> dict:
     config.setdefault("PROFILES", []).append(profile)
@@ -134,7 +310,49 @@ async def remove_profile(config: dict, index: int, user_id: int, save: bool = Tr
         await save_config(config, user_id)
     return config
 
+def count_purchase(config: dict, index: int, price: int) -> None:
+    """
+    Учитывает покупку в счётчиках профиля. Используется как mutate для update_config.
+
+    Args:
+        config: Конфиг пользователя.
+        index: Индекс профиля.
+        price: Цена купленного подарка.
+    """
+    profile = config["PROFILES"][index]
+    profile["BOUGHT"] = profile.get("BOUGHT", 0) + 1
+    profile["SPENT"] = profile.get("SPENT", 0) + price
+
+def cached_render(user_id: int, config: dict, key: tuple, render: Callable[[], str]) -> str:
+    """
+    Возвращает отрисованный по конфигу текст из кэша. Ключ строится из версии конфига в базе,
+    поэтому после каждого сохранения (в том числе другим шардом) текст отрисовывается заново.
+    Конфиг с неизвестной версией (не из get_valid_config или не сохранённый из-за ошибки)
+    отрисовывается без кэша.
+
+    Args:
+        user_id: ID пользователя.
+        config: Конфиг из get_valid_config.
+        key: Дополнительная часть ключа кэша (вид текста).
+        render: Функция отрисовки текста.
+
+    Returns:
+        str: Отрисованный текст.
+    """
+    version = config_version(config)
+    if version is None:
+        return render()
+    cache_key = (user_id,) + key + (version,)
+    text = _render_cache.get(cache_key)
+    if text is None:
+        text = render()
+        _render_cache.set(cache_key, text)
+    return text
+
 def format_config_summary(config: dict, user_id: int) -> str:
+    return cached_render(user_id, config, ("summary",), lambda: _render_config_summary(config, user_id))
+
+def _render_config_summary(config: dict, user_id: int) -> str:
     status_text = "🟢 Активен" if config.get("ACTIVE") else "🔴 Неактивен"
     balance = config.get("BALANCE", 0)
     profiles = config.get("PROFILES", [])
@@ -1,6 +1,29 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import hashlib
+import json
+import time
+
 # --- Внутренние модули ---
 from utils.mockdata import generate_test_gifts
-from services.config import DEV_MODE
+from services.config import DEV_MODE, CATALOG_TTL
+
+
+class CatalogSnapshot:
+    """
+    Общий для всех пользователей снимок каталога подарков с индексом по id.
+    """
+    def __init__(self, gifts: list[dict], version: str):
+        self.gifts = gifts
+        self.version = version
+        self.by_id = {str(gift["id"]): gift for gift in gifts}
+        self.limited_count = sum(1 for gift in gifts if gift["supply"] is not None)
+        self.unlimited_count = len(gifts) - self.limited_count
+        self.fetched_at = time.monotonic()
+
+
+_snapshot: CatalogSnapshot | None = None
+_snapshot_lock = asyncio.Lock()
 
 def normalize_gift(gift) -> dict:
     """
@@ -71,3 +94,68 @@ async def get_filtered_gifts(
     all_gifts = normalized + test_gifts
     all_gifts .sort(key=lambda g: g["price"], reverse=True)
     return all_gifts 
+
+
+def filter_gifts(gifts: list[dict], min_price, max_price, min_supply, max_supply) -> list[dict]:
+    """
+    Фильтрует нормализованные подарки (например, из снимка каталога) по цене и тиражу
+    так же, как get_filtered_gifts: безлимитные подарки считаются подарками с тиражом 0.
+
+    :param gifts: Список нормализованных подарков.
+    :param min_price: Минимальная цена подарка.
+    :param max_price: Максимальная цена подарка.
+    :param min_supply: Минимальный supply подарка.
+    :param max_supply: Максимальный supply подарка.
+    :return: Подходящие подарки, отсортированные по цене по убыванию.
+    """
+    filtered = [
+        gift for gift in gifts
+        if min_price <= gift["price"] <= max_price and min_supply <= (gift["supply"] or 0) <= max_supply
+    ]
+    filtered.sort(key=lambda g: g["price"], reverse=True)
+    return filtered
+
+
+def catalog_version(gifts: list[dict]) -> str:
+    """
+    Вычисляет версию каталога по составу подарков, ценам и остаткам.
+    Одинаковые каталоги дают одинаковую версию в любом процессе: версия хранится в FSM
+    и сравнивается после перезапуска и в других шардах, поэтому встроенный hash() не подходит.
+
+    :param gifts: Список нормализованных подарков.
+    :return: Версия каталога.
+    """
+    fields = [(g["id"], g["price"], g["supply"], g["left"]) for g in gifts]
+    return hashlib.blake2b(json.dumps(fields, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+async def get_catalog_snapshot(bot, force: bool = False) -> CatalogSnapshot:
+    """
+    Возвращает общий снимок полного каталога подарков, обновляя его не чаще раза в CATALOG_TTL секунд.
+    Если состав каталога не изменился, сохраняется прежний объект снимка и его версия.
+
+    :param bot: Экземпляр бота aiogram.
+    :param force: Обновить снимок, не дожидаясь истечения TTL.
+    :return: Снимок каталога.
+    """
+    global _snapshot
+    if not force and _snapshot and time.monotonic() - _snapshot.fetched_at < CATALOG_TTL:
+        return _snapshot
+    async with _snapshot_lock:
+        # Пока ждали блокировку, снимок мог обновить другой запрос
+        if not force and _snapshot and time.monotonic() - _snapshot.fetched_at < CATALOG_TTL:
+            return _snapshot
+        gifts = await get_filtered_gifts(
+            bot=bot,
+            min_price=0,
+            max_price=1000000,
+            min_supply=0,
+            max_supply=100000000,
+            unlimited=True
+        )
+        version = catalog_version(gifts)
+        if _snapshot and _snapshot.version == version:
+            _snapshot.fetched_at = time.monotonic()
+        else:
+            _snapshot = CatalogSnapshot(gifts, version)
+        return _snapshot
@@ -1,12 +1,19 @@
+# --- Стандартные библиотеки ---
+from functools import lru_cache
+
 # --- Сторонние библиотеки ---
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 # --- Внутренние библиотеки ---
-from services.config import get_valid_config, save_config, format_config_summary
+from services.config import get_valid_config, save_config, config_version, format_config_summary, RENDER_CACHE_SIZE
+from utils.cache import LRUCache
 from aiogram import Bot
 
+# Последнее отрисованное этим процессом меню: user_id -> (message_id, версия конфига)
+_rendered_menus = LRUCache(RENDER_CACHE_SIZE)
+
 async def update_last_menu_message_id(user_id: int, message_id: int) -> None:
     """
     Сохраняет id последнего сообщения с меню в конфиг пользователя.
@@ -32,9 +39,11 @@ async def get_last_menu_message_id(user_id: int) -> int | None:
     config = await get_valid_config(user_id)
     return config.get("LAST_MENU_MESSAGE_ID")
 
+@lru_cache(maxsize=2)
 def config_action_keyboard(active: bool) -> InlineKeyboardMarkup:
     """
     Генерирует inline-клавиатуру для меню с действиями.
+    Клавиатура зависит только от статуса, поэтому оба варианта создаются один раз и переиспользуются.
 
     Args:
         active: Статус активности бота.
@@ -63,18 +72,59 @@ def config_action_keyboard(active: bool) -> InlineKeyboardMarkup:
 
 async def update_menu(bot: Bot, chat_id: int, user_id: int, message_id: int = None) -> None:
     """
-    Обновляет меню в чате: удаляет предыдущее и отправляет новое.
+    Обновляет меню в чате. Последнее отправленное меню (LAST_MENU_MESSAGE_ID) редактируется на месте,
+    кто бы ни вызвал обновление; новое меню отправляется, только если старое отредактировать нельзя.
 
     Args:
         bot: Экземпляр бота.
         chat_id: ID чата.
         user_id: ID пользователя.
-        message_id: ID сообщения для редактирования (опционально).
+        message_id: ID текущего сообщения, которое не нужно удалять при отправке нового меню (опционально).
     """
     config = await get_valid_config(user_id)
+    last_menu_message_id = config.get("LAST_MENU_MESSAGE_ID")
+    if last_menu_message_id and await edit_menu(bot, chat_id, user_id, last_menu_message_id, config):
+        return
     await delete_menu(bot=bot, chat_id=chat_id, user_id=user_id, current_message_id=message_id)
     await send_menu(bot=bot, chat_id=chat_id, user_id=user_id, config=config, text=format_config_summary(config, user_id))
 
+async def edit_menu(bot: Bot, chat_id: int, user_id: int, message_id: int, config: dict) -> bool:
+    """
+    Редактирует сообщение с меню на месте по конфигу пользователя.
+    Запрос пропускается, только если этот процесс уже отрисовал в сообщении ту же версию конфига;
+    после перезапуска или правки из другого шарда меню редактируется, а ответ
+    "message is not modified" считается успехом.
+
+    Args:
+        bot: Экземпляр бота.
+        chat_id: ID чата.
+        user_id: ID пользователя.
+        message_id: ID сообщения с меню.
+        config: Конфигурация пользователя из get_valid_config.
+
+    Returns:
+        bool: True, если меню актуально, False — если сообщение нельзя отредактировать.
+    """
+    version = config_version(config)
+    if version is not None and _rendered_menus.get(user_id) == (message_id, version):
+        return True
+    try:
+        await bot.edit_message_text(
+            text=format_config_summary(config, user_id),
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=config_action_keyboard(config.get("ACTIVE"))
+        )
+    except TelegramBadRequest as e:
+        error_text = str(e)
+        if "message is not modified" not in error_text:
+            _rendered_menus.pop(user_id)
+            if "message can't be edited" in error_text or "message to edit not found" in error_text:
+                return False
+            raise
+    _rendered_menus.set(user_id, (message_id, version))
+    return True
+
 async def delete_menu(bot: Bot, chat_id: int, user_id: int, current_message_id: int = None) -> None:
     """
     Удаляет последнее сообщение с меню, если оно отличается от текущего.
@@ -115,11 +165,13 @@ async def send_menu(bot: Bot, chat_id: int, user_id: int, config: dict, text: st
     Returns:
         int: ID отправленного сообщения.
     """
+    reply_markup = config_action_keyboard(config.get("ACTIVE"))
     sent = await bot.send_message(
         chat_id=chat_id,
         text=text,
-        reply_markup=config_action_keyboard(config.get("ACTIVE"))
+        reply_markup=reply_markup
     )
+    _rendered_menus.set(user_id, (sent.message_id, config_version(config)))
     await update_last_menu_message_id(user_id, sent.message_id)
     return sent.message_id
 
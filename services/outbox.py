@@ -0,0 +1,159 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import time
+
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+# --- Внутренние модули ---
+from services.config import OUTBOX_CHAT_INTERVAL, OUTBOX_GLOBAL_INTERVAL
+from services.menu import update_menu
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+
+
+def split_text(texts: list[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Склеивает несколько текстов в минимальное число сообщений, не превышающих limit символов.
+
+    Args:
+        texts: Тексты для отправки.
+        limit: Максимальная длина одного сообщения.
+
+    Returns:
+        list[str]: Готовые сообщения.
+    """
+    chunks = []
+    current = ""
+    for text in texts:
+        while len(text) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(text[:limit])
+            text = text[limit:]
+        if not current:
+            current = text
+        elif len(current) + 2 + len(text) <= limit:
+            current += "\n\n" + text
+        else:
+            chunks.append(current)
+            current = text
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class Outbox:
+    """
+    Очередь исходящих уведомлений (отчёты, меню, предупреждения).
+    Задачи покупки только ставят уведомления в очередь, а отправляет их отдельная задача
+    с учётом лимитов Telegram: не чаще OUTBOX_CHAT_INTERVAL на чат и OUTBOX_GLOBAL_INTERVAL на бота.
+    Несколько ожидающих сообщений в один чат отправляются одним сообщением.
+    """
+    def __init__(self, chat_interval: float = OUTBOX_CHAT_INTERVAL, global_interval: float = OUTBOX_GLOBAL_INTERVAL):
+        self.chat_interval = chat_interval
+        self.global_interval = global_interval
+        self._pending: dict[int, dict] = {}  # chat_id -> {"texts": [...], "menu_user_id": ...}
+        self._next_at: dict[int, float] = {}  # chat_id -> время, раньше которого писать в чат нельзя
+        self._ready = asyncio.Event()
+
+    def send_message(self, chat_id: int, text: str) -> None:
+        """
+        Ставит сообщение в очередь на отправку.
+
+        Args:
+            chat_id: ID чата.
+            text: Текст сообщения.
+        """
+        self._entry(chat_id)["texts"].append(text)
+        self._ready.set()
+
+    def update_menu(self, chat_id: int, user_id: int) -> None:
+        """
+        Ставит в очередь обновление меню. Повторные запросы для одного чата объединяются.
+
+        Args:
+            chat_id: ID чата.
+            user_id: ID пользователя.
+        """
+        self._entry(chat_id)["menu_user_id"] = user_id
+        self._ready.set()
+
+    def qsize(self) -> int:
+        """
+        Возвращает количество чатов с ожидающими уведомлениями.
+        """
+        return len(self._pending)
+
+    def _entry(self, chat_id: int) -> dict:
+        entry = self._pending.get(chat_id)
+        if entry is None:
+            entry = self._pending[chat_id] = {"texts": [], "menu_user_id": None}
+        return entry
+
+    async def run(self, bot: Bot) -> None:
+        """
+        Фоновая задача отправки уведомлений из очереди.
+
+        Args:
+            bot: Экземпляр бота.
+        """
+        while True:
+            if not self._pending:
+                self._ready.clear()
+                await self._ready.wait()
+
+            now = time.monotonic()
+            due = [chat_id for chat_id in self._pending if self._next_at.get(chat_id, 0) <= now]
+            if not due:
+                delay = min(self._next_at[chat_id] for chat_id in self._pending) - now
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for chat_id in due:
+                entry = self._pending.pop(chat_id)
+                try:
+                    await self._flush(bot, chat_id, entry)
+                    self._next_at[chat_id] = time.monotonic() + self.chat_interval
+                except TelegramRetryAfter as e:
+                    logger.warning("Flood wait при отправке уведомлений в чат %s: ждём %s секунд", chat_id, e.retry_after)
+                    self._requeue(chat_id, entry)
+                    self._next_at[chat_id] = time.monotonic() + e.retry_after
+                except Exception as e:
+                    logger.error("Ошибка при отправке уведомлений в чат %s: %s", chat_id, e)
+                await asyncio.sleep(self.global_interval)
+
+            # Чистим устаревшие ограничения по чатам
+            if len(self._next_at) > 1000:
+                now = time.monotonic()
+                self._next_at = {chat_id: at for chat_id, at in self._next_at.items() if at > now}
+
+    async def _flush(self, bot: Bot, chat_id: int, entry: dict) -> None:
+        texts = entry["texts"]
+        while texts:
+            chunks = split_text(texts)
+            await bot.send_message(chat_id=chat_id, text=chunks[0])
+            # Отправленное убираем, чтобы при flood wait не отправить его повторно
+            texts[:] = [] if len(chunks) == 1 else chunks[1:]
+        if entry["menu_user_id"] is not None:
+            await update_menu(bot=bot, chat_id=chat_id, user_id=entry["menu_user_id"])
+
+    def _requeue(self, chat_id: int, entry: dict) -> None:
+        pending = self._pending.get(chat_id)
+        if pending:
+            entry["texts"].extend(pending["texts"])
+            entry["menu_user_id"] = pending["menu_user_id"] or entry["menu_user_id"]
+        self._pending[chat_id] = entry
+        self._ready.set()
+
+
+outbox = Outbox()
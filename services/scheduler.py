@@ -0,0 +1,173 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+# --- Внутренние модули ---
+from services.config import API_CONCURRENCY, DEFER_MAX_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета запросов к Bot API (меньше — важнее)
+PRIORITY_PURCHASE = 0
+PRIORITY_CATALOG = 1
+PRIORITY_PAYMENTS = 2
+PRIORITY_INTERACTIVE = 3  # ответ на нажатие кнопки и прогресс текущей покупки — не откладываются
+PRIORITY_TRANSACTIONS = 4
+PRIORITY_UI = 5
+
+METHOD_PRIORITIES = {
+    "sendGift": PRIORITY_PURCHASE,
+    "getAvailableGifts": PRIORITY_CATALOG,
+    "sendInvoice": PRIORITY_PAYMENTS,
+    "answerPreCheckoutQuery": PRIORITY_PAYMENTS,
+    "refundStarPayment": PRIORITY_PAYMENTS,
+    "answerCallbackQuery": PRIORITY_INTERACTIVE,
+    "getStarTransactions": PRIORITY_TRANSACTIONS,
+}
+
+# Запросы вне очереди: long polling занимал бы слот на всё время ожидания
+BYPASS_METHODS = {"getUpdates", "setWebhook", "deleteWebhook"}
+
+# Приоритет, заданный для запросов внутри блока scheduler.prioritized(...)
+_priority_override: ContextVar[int | None] = ContextVar("priority_override", default=None)
+
+
+class RequestScheduler:
+    """
+    Планировщик запросов к Bot API с классами приоритета.
+    Одновременно выполняется не больше capacity запросов; освободившийся слот получает
+    самый приоритетный ожидающий запрос (при равном приоритете — первый пришедший).
+    Пока идут покупки (см. purchasing), запросы класса PRIORITY_UI и ниже откладываются
+    до их завершения ("drop mode"), но не дольше max_defer секунд: при длинной серии покупок
+    уведомления и меню всё равно уходят, просто с задержкой.
+    """
+    def __init__(self, capacity: int = API_CONCURRENCY, deferrable: int = PRIORITY_UI, max_defer: float = DEFER_MAX_WAIT):
+        self.capacity = capacity
+        self.deferrable = deferrable
+        self.max_defer = max_defer
+        self.in_flight = 0
+        self._waiters = []  # куча (приоритет, порядковый номер, время постановки, future)
+        self._seq = itertools.count()
+        self._purchases = 0
+
+    @staticmethod
+    def priority(api_method: str) -> int | None:
+        """
+        Возвращает класс приоритета метода API или None, если запрос идёт вне очереди.
+        Внутри блока prioritized приоритет запроса не ниже заданного.
+        """
+        if api_method in BYPASS_METHODS:
+            return None
+        priority = METHOD_PRIORITIES.get(api_method, PRIORITY_UI)
+        override = _priority_override.get()
+        return priority if override is None else min(priority, override)
+
+    @staticmethod
+    @contextmanager
+    def prioritized(priority: int):
+        """
+        Повышает приоритет запросов, выполняемых внутри блока (в том числе в дочерних задачах),
+        например PRIORITY_INTERACTIVE для сообщения о прогрессе покупки.
+        """
+        token = _priority_override.set(priority)
+        try:
+            yield
+        finally:
+            _priority_override.reset(token)
+
+    def _deferred(self, priority: int) -> bool:
+        return self._purchases > 0 and priority >= self.deferrable
+
+    async def acquire(self, priority: int) -> None:
+        """
+        Ждёт свободный слот для запроса с указанным приоритетом.
+        """
+        if self.in_flight < self.capacity and not self._waiters and not self._deferred(priority):
+            self.in_flight += 1
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), time.monotonic(), future))
+        if self._deferred(priority):
+            # Отложенный запрос дольше max_defer не ждёт: к этому времени очередь перепроверится
+            loop.call_later(self.max_defer, self._wake)
+        # Слот может быть свободен, если впереди в очереди только отложенные запросы
+        self._wake()
+        if future.done():
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот мог быть выдан одновременно с отменой — возвращаем его
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """
+        Освобождает слот и передаёт его следующему ожидающему запросу.
+        """
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.capacity:
+            priority, _, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)  # отменённый запрос
+                continue
+            if self._deferred(priority):
+                # В куче дальше только отложенные запросы — выпускаем те, что ждут дольше max_defer
+                self._release_overdue()
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _release_overdue(self) -> None:
+        """
+        Выдаёт свободные слоты отложенным запросам, которые ждут дольше max_defer (самым важным и старым первыми).
+        """
+        deadline = time.monotonic() - self.max_defer
+        overdue = sorted(waiter for waiter in self._waiters if waiter[2] <= deadline and not waiter[3].done())
+        if not overdue:
+            return
+        for waiter in overdue:
+            if self.in_flight >= self.capacity:
+                break
+            self._waiters.remove(waiter)
+            self.in_flight += 1
+            waiter[3].set_result(None)
+        heapq.heapify(self._waiters)
+
+    @asynccontextmanager
+    async def purchasing(self):
+        """
+        Включает drop mode на время покупки: запросы интерфейса ждут её завершения.
+        Вызовы могут быть вложенными и параллельными.
+        """
+        self._purchases += 1
+        try:
+            yield
+        finally:
+            self._purchases -= 1
+            if not self._purchases:
+                self._wake()
+
+    def stats(self) -> dict:
+        """
+        Возвращает число выполняемых запросов, ожидающих запросов по классам приоритета и флаг drop mode.
+        """
+        waiting = {}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                waiting[priority] = waiting.get(priority, 0) + 1
+        return {"in_flight": self.in_flight, "waiting": waiting, "purchasing": self._purchases > 0}
+
+
+scheduler = RequestScheduler()
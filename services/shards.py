@@ -0,0 +1,210 @@
+"""
+Шардирование воркера покупок по процессам.
+
+Главный процесс (main.py) принимает апдейты и обслуживает меню, а покупки по профилям выполняют
+WORKER_SHARDS дочерних процессов. Пользователи распределяются по шардам консистентным хешированием
+(utils.sharding.HashRing), у каждого шарда свой цикл событий, свой бот и пул соединений.
+Шарды координируются через общую базу SQLite (WAL): конфиги перечитываются на каждом проходе,
+список разрешённых пользователей — раз в SHARD_ALLOWED_USERS_TTL секунд. Через stdin дочерний
+процесс следит за родителем: когда главный процесс завершается, шард останавливается сам.
+
+Запуск шарда вручную (обычно его запускает ShardSupervisor):
+    python -m services.shards --index 0 --shards 4
+"""
+
+# --- Стандартные библиотеки ---
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+# --- Сторонние библиотеки ---
+from dotenv import load_dotenv
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+# --- Внутренние модули ---
+from services.config import (
+    HTTP_POOL_LIMIT,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_KEEPALIVE_INTERVAL,
+    HTTP_REQUEST_TIMEOUT,
+    HTTP_WARM_CONNECTIONS,
+    OUTBOX_GLOBAL_INTERVAL,
+    API_CONCURRENCY,
+    PURCHASE_GLOBAL_INTERVAL,
+    SHARD_ALLOWED_USERS_TTL,
+    SHARD_RESTART_DELAY,
+    SHARD_STOP_TIMEOUT,
+    TOKEN_BALANCE_REFRESH,
+    TOKEN_SEND_CONCURRENCY,
+    TOKEN_SEND_INTERVAL
+)
+from services.outbox import outbox
+from services.scheduler import scheduler
+from services.buy import purchase_pacer
+from services.worker import gift_purchase_worker
+from services.tokens import token_pool
+from database import init_db
+from utils.logging import setup_logging
+from utils.session import PooledAiohttpSession
+from utils.metrics import start_metrics_server
+from utils.sharding import HashRing
+from utils.tracing import tracer
+from middlewares.request_priority import RequestPriorityMiddleware
+from middlewares.request_metrics import RequestMetricsMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+class ShardSupervisor:
+    """
+    Запускает шарды воркера дочерними процессами и перезапускает упавшие.
+
+    Args:
+        shards: Число шардов.
+        restart_delay: Пауза перед перезапуском упавшего шарда в секундах.
+    """
+    def __init__(self, shards: int, restart_delay: float = SHARD_RESTART_DELAY):
+        self.shards = shards
+        self.restart_delay = restart_delay
+        self.processes: dict[int, asyncio.subprocess.Process] = {}
+        self.restarts = {index: 0 for index in range(shards)}
+
+    async def _run_shard(self, index: int) -> None:
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "services.shards", "--index", str(index), "--shards", str(self.shards),
+                stdin=asyncio.subprocess.PIPE
+            )
+            self.processes[index] = process
+            logger.info("Шард %s/%s запущен, pid=%s", index, self.shards, process.pid)
+            code = await process.wait()
+            self.restarts[index] += 1
+            logger.error("Шард %s завершился с кодом %s, перезапуск через %s с", index, code, self.restart_delay)
+            await asyncio.sleep(self.restart_delay)
+
+    async def run(self) -> None:
+        """
+        Держит все шарды запущенными. При отмене закрывает им stdin и ждёт завершения,
+        а не успевшие остановиться за SHARD_STOP_TIMEOUT процессы завершает принудительно.
+        """
+        tasks = [asyncio.create_task(self._run_shard(index)) for index in range(self.shards)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for process in self.processes.values():
+                if process.returncode is None and process.stdin is not None:
+                    process.stdin.close()
+            for process in self.processes.values():
+                try:
+                    await asyncio.wait_for(process.wait(), SHARD_STOP_TIMEOUT)
+                except asyncio.TimeoutError:
+                    process.kill()
+
+    def stats(self) -> dict:
+        return {
+            "alive": sum(1 for process in self.processes.values() if process.returncode is None),
+            "restarts": dict(self.restarts),
+        }
+
+
+async def wait_parent_exit() -> None:
+    """
+    Ждёт закрытия stdin — родительский процесс завершился или останавливает шард.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    while await reader.read(1024):
+        pass
+
+
+async def run_shard(index: int, shards: int) -> bool:
+    """
+    Шард: воркер покупок и отправка уведомлений для пользователей своего сегмента кольца.
+    Работает, пока жив главный процесс и воркер.
+
+    Args:
+        index: Номер шарда.
+        shards: Общее число шардов.
+
+    Returns:
+        bool: True, если шард остановлен главным процессом, False — если завершился воркер.
+    """
+    session = PooledAiohttpSession(
+        limit=HTTP_POOL_LIMIT,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        timeout=HTTP_REQUEST_TIMEOUT
+    )
+    bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"), session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(RequestPriorityMiddleware(scheduler))
+    bot.session.middleware(RequestMetricsMiddleware())
+    extra_tokens = [token.strip() for token in os.getenv("TELEGRAM_BOT_TOKENS", "").split(",") if token.strip()]
+    if extra_tokens:
+        # Бюджет каждого токена делят главный процесс и все шарды
+        token_pool.configure(
+            [bot] + [Bot(token=token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML)) for token in extra_tokens],
+            concurrency=max(1, TOKEN_SEND_CONCURRENCY // (shards + 1)),
+            interval=TOKEN_SEND_INTERVAL * (shards + 1)
+        )
+    # Общие лимиты бота на рассылку и покупки делят главный процесс и все шарды
+    outbox.global_interval = OUTBOX_GLOBAL_INTERVAL * (shards + 1)
+    purchase_pacer.interval = PURCHASE_GLOBAL_INTERVAL * (shards + 1)
+    scheduler.capacity = max(1, API_CONCURRENCY // (shards + 1))
+
+    await init_db()
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        await start_metrics_server(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port) + 1 + index)
+    await session.warm(bot, HTTP_WARM_CONNECTIONS)
+
+    owns = HashRing(shards).owns(index)
+    worker = asyncio.create_task(gift_purchase_worker(bot, owns=owns, allowed_users_max_age=SHARD_ALLOWED_USERS_TTL))
+    parent = asyncio.create_task(wait_parent_exit())
+    tasks = [
+        worker,
+        parent,
+        asyncio.create_task(outbox.run(bot)),
+        asyncio.create_task(session.keep_alive(bot, HTTP_WARM_CONNECTIONS, HTTP_KEEPALIVE_INTERVAL)),
+    ]
+    if extra_tokens:
+        tasks.append(asyncio.create_task(token_pool.keep_refreshed(TOKEN_BALANCE_REFRESH)))
+    logger.info("Шард %s/%s готов", index, shards)
+    try:
+        await asyncio.wait((worker, parent), return_when=asyncio.FIRST_COMPLETED)
+        if parent.done():
+            logger.info("Шард %s останавливается: главный процесс завершился", index)
+            return True
+        # Воркер не должен завершаться: выходим с ошибкой, чтобы ShardSupervisor перезапустил шард
+        error = None if worker.cancelled() else worker.exception()
+        logger.error("Воркер шарда %s завершился: %s", index, error)
+        return False
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await bot.session.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Шард воркера покупок")
+    parser.add_argument("--index", type=int, required=True, help="Номер шарда")
+    parser.add_argument("--shards", type=int, required=True, help="Число шардов")
+    args = parser.parse_args()
+
+    load_dotenv()
+    setup_logging(level=os.getenv("LOG_LEVEL", "INFO"), fmt=os.getenv("LOG_FORMAT", "text"))
+    trace_path = os.getenv("TRACE_PATH")
+    if trace_path:
+        root, ext = os.path.splitext(trace_path)
+        tracer.path = f"{root}.shard{args.index}{ext}"
+    if not asyncio.run(run_shard(args.index, args.shards)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
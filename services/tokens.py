@@ -0,0 +1,204 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+
+# --- Внутренние модули ---
+from services.config import TOKEN_SEND_CONCURRENCY, TOKEN_SEND_INTERVAL, TOKEN_WAIT_TIMEOUT
+from services.balance import get_bot_star_balance
+from utils.sharding import HashRing
+
+logger = logging.getLogger(__name__)
+
+
+class BotToken:
+    """
+    Токен из пула: бот, его баланс звёзд и бюджет запросов send_gift.
+    Баланс stars — последнее значение из транзакций бота минус покупки, сделанные после этого;
+    reserved — звёзды под покупки, которые выполняются прямо сейчас.
+    """
+    def __init__(self, index: int, bot: Bot, concurrency: int, interval: float):
+        self.index = index
+        self.bot = bot
+        self.concurrency = concurrency
+        self.interval = interval
+        self.stars: int | None = None  # None — баланс ещё не загружен
+        self.reserved = 0
+        self.in_flight = 0
+        self.sent = 0
+        self._next_at = 0.0
+        self._paused_until = 0.0
+
+    @property
+    def available(self) -> int | None:
+        return None if self.stars is None else self.stars - self.reserved
+
+    def can_afford(self, price: int) -> bool:
+        return self.available is None or self.available >= price
+
+    def has_capacity(self, now: float) -> bool:
+        return self.in_flight < self.concurrency and now >= self._paused_until
+
+    def next_slot(self) -> float:
+        """
+        Занимает место в темпе токена и возвращает, сколько секунд ждать до отправки.
+        """
+        now = time.monotonic()
+        start = max(now, self._next_at, self._paused_until)
+        self._next_at = start + self.interval
+        return start - now
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self, now: float) -> float:
+        return max(self._paused_until - now, 0.0)
+
+
+class TokenPool:
+    """
+    Пул ботов с разными токенами для покупок. Каждый пользователь закреплён за «своим» токеном
+    консистентным хешированием; покупка уходит на него, если у токена есть свободный слот
+    и хватает звёзд, иначе — на токен с наибольшим запасом слотов среди тех, кому хватает звёзд.
+    У каждого токена свой лимит параллельных send_gift, свой темп и своя пауза после flood wait.
+    """
+    def __init__(self):
+        self.tokens: list[BotToken] = []
+        self._ring: HashRing | None = None
+        self._released = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def configure(self, bots: list[Bot], concurrency: int = TOKEN_SEND_CONCURRENCY, interval: float = TOKEN_SEND_INTERVAL) -> None:
+        """
+        Задаёт ботов пула. Первый бот — основной (приём апдейтов и меню).
+
+        Args:
+            bots: Боты с разными токенами.
+            concurrency: Максимум одновременных send_gift на токен.
+            interval: Минимальный интервал между send_gift одного токена в секундах.
+        """
+        self.tokens = [BotToken(index, bot, concurrency, interval) for index, bot in enumerate(bots)]
+        self._ring = HashRing(len(bots))
+
+    def home(self, user_id: int) -> BotToken:
+        """
+        Токен, за которым закреплён пользователь.
+        """
+        return self.tokens[self._ring.shard_for(user_id)]
+
+    def pick(self, user_id: int, price: int) -> BotToken | None:
+        """
+        Выбирает токен для покупки: свой токен пользователя, если он свободен и ему хватает звёзд,
+        иначе свободный токен с наибольшим запасом слотов (при равенстве — с большим балансом).
+
+        Returns:
+            BotToken | None: Токен или None, если сейчас подходящих нет.
+        """
+        now = time.monotonic()
+        home = self.home(user_id)
+        if home.has_capacity(now) and home.can_afford(price):
+            return home
+        candidates = [token for token in self.tokens if token.has_capacity(now) and token.can_afford(price)]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda token: (token.concurrency - token.in_flight, token.available or 0))
+
+    @asynccontextmanager
+    async def lease(self, user_id: int, price: int):
+        """
+        Занимает токен под одну попытку send_gift: слот, резерв звёзд и очередь в темпе токена.
+        Если свободного токена нет, ждёт до TOKEN_WAIT_TIMEOUT секунд; если звёзд не хватает
+        ни одному токену, отдаёт токен пользователя — ошибку вернёт сам Telegram.
+
+        Args:
+            user_id: ID пользователя, который покупает.
+            price: Стоимость подарка.
+
+        Yields:
+            BotToken: Занятый токен.
+        """
+        deadline = time.monotonic() + TOKEN_WAIT_TIMEOUT
+        while True:
+            token = self.pick(user_id, price)
+            if token is not None:
+                break
+            if not any(t.can_afford(price) for t in self.tokens) or time.monotonic() >= deadline:
+                token = self.home(user_id)
+                break
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), min(deadline - time.monotonic(), self._recheck_after()))
+            except asyncio.TimeoutError:
+                pass
+
+        token.in_flight += 1
+        token.reserved += price
+        try:
+            delay = token.next_slot()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield token
+        finally:
+            token.in_flight -= 1
+            token.reserved -= price
+            self._released.set()
+
+    @staticmethod
+    def commit(token: BotToken, price: int) -> None:
+        """
+        Учитывает успешную покупку в балансе токена.
+        """
+        token.sent += 1
+        if token.stars is not None:
+            token.stars -= price
+
+    def _recheck_after(self) -> float:
+        """
+        Через сколько секунд перепроверить токены: слот освобождает и конец паузы после flood wait,
+        о котором событие освобождения не сообщит.
+        """
+        now = time.monotonic()
+        pauses = [token.paused_for(now) for token in self.tokens if token.paused_for(now) > 0]
+        return max(min(pauses, default=TOKEN_WAIT_TIMEOUT), 0.01)
+
+    @staticmethod
+    def mark_empty(token: BotToken) -> None:
+        """
+        Помечает, что у токена кончились звёзды (Telegram ответил BALANCE_TOO_LOW).
+        Баланс уточнится при следующей сверке с транзакциями.
+        """
+        token.stars = 0
+
+    async def refresh_balances(self) -> None:
+        """
+        Перечитывает балансы всех токенов из их транзакций.
+        """
+        for token in self.tokens:
+            try:
+                token.stars = await get_bot_star_balance(token.bot)
+            except Exception as e:
+                logger.warning("Не удалось получить баланс токена #%s: %s", token.index, e)
+        logger.info("Балансы токенов: %s", ", ".join(f"#{token.index}={token.stars}" for token in self.tokens))
+
+    async def keep_refreshed(self, interval: float) -> None:
+        """
+        Бесконечный цикл: раз в interval секунд сверяет балансы токенов с транзакциями.
+        """
+        while True:
+            await self.refresh_balances()
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {
+            token.index: {"stars": token.available, "in_flight": token.in_flight, "sent": token.sent}
+            for token in self.tokens
+        }
+
+
+token_pool = TokenPool()
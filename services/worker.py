@@ -0,0 +1,257 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import time
+from typing import Callable
+
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+
+# --- Внутренние модули ---
+from services.config import get_valid_config, update_config, count_purchase, get_target_display, PURCHASE_COOLDOWN
+from services.outbox import outbox
+from services.balance import refresh_balance
+from services.gifts import CatalogSnapshot, get_catalog_snapshot, filter_gifts
+from services.buy import buy_gift
+from database import get_allowed_users
+from utils.metrics import registry
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+WORKER_TICK = registry.histogram("worker_tick_duration_seconds", "Длительность одного прохода воркера покупок")
+
+async def process_user(bot: Bot, user_id: int, snapshot: CatalogSnapshot) -> None:
+    """
+    Один проход воркера по профилям пользователя: покупает подходящие подарки из снимка каталога
+    в пределах COUNT и LIMIT каждого профиля и отправляет отчёт.
+
+    Args:
+        bot: Экземпляр бота.
+        user_id: ID пользователя.
+        snapshot: Снимок каталога этого прохода.
+    """
+    config = await get_valid_config(user_id)
+    if not config["ACTIVE"]:
+        return
+
+    report_message_lines = []
+    progress_made = False  # Был ли прогресс по профилям на этом проходе
+    any_success = True
+
+    for profile_index, profile in enumerate(config["PROFILES"]):
+        # Пропускаем завершённые профили
+        if profile.get("DONE"):
+            continue
+
+        MIN_PRICE = profile["MIN_PRICE"]
+        MAX_PRICE = profile["MAX_PRICE"]
+        MIN_SUPPLY = profile["MIN_SUPPLY"]
+        MAX_SUPPLY = profile["MAX_SUPPLY"]
+        COUNT = profile["COUNT"]
+        LIMIT = profile.get("LIMIT", 0)
+        TARGET_USER_ID = profile["TARGET_USER_ID"]
+        TARGET_CHAT_ID = profile["TARGET_CHAT_ID"]
+
+        with tracer.span("match", user_id=user_id, profile=profile_index) as span:
+            filtered_gifts = filter_gifts(snapshot.gifts, MIN_PRICE, MAX_PRICE, MIN_SUPPLY, MAX_SUPPLY)
+            span["matched"] = len(filtered_gifts)
+
+        if not filtered_gifts:
+            continue
+
+        purchases = []
+        before_bought = profile["BOUGHT"]
+        before_spent = profile["SPENT"]
+
+        for gift in filtered_gifts:
+            gift_id = gift["id"]
+            gift_price = gift["price"]
+            gift_total_count = gift["supply"]
+            sticker_file_id = gift["sticker_file_id"]
+
+            # Проверяем лимит перед каждой покупкой
+            while (profile["BOUGHT"] < COUNT and
+                   profile["SPENT"] + gift_price <= LIMIT):
+                success = await buy_gift(
+                    bot=bot,
+                    env_user_id=user_id,  # Используем user_id вместо USER_ID
+                    gift_id=gift_id,
+                    user_id=TARGET_USER_ID,
+                    chat_id=TARGET_CHAT_ID,
+                    gift_price=gift_price,
+                    file_id=sticker_file_id
+                )
+
+                if not success:
+                    any_success = False
+                    break  # Не удалось купить — пробуем следующий подарок
+
+                with tracer.span("commit", user_id=user_id, profile=profile_index):
+                    config = await update_config(
+                        user_id, lambda config: count_purchase(config, profile_index, gift_price)
+                    )
+                    profile = config["PROFILES"][profile_index]
+                    purchases.append({"id": gift_id, "price": gift_price})
+                await asyncio.sleep(PURCHASE_COOLDOWN)
+
+                # Проверяем: не достигли ли лимит после покупки
+                if profile["SPENT"] >= LIMIT:
+                    break
+
+            if profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT:
+                break  # Достигли лимит либо по количеству, либо по сумме
+
+        after_bought = profile["BOUGHT"]
+        after_spent = profile["SPENT"]
+        made_local_progress = (after_bought > before_bought) or (after_spent > before_spent)
+
+        # Профиль полностью выполнен: либо по количеству, либо по лимиту
+        if (profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT) and not profile["DONE"]:
+            config = await update_config(user_id, lambda config: config["PROFILES"][profile_index].update(DONE=True))
+            profile = config["PROFILES"][profile_index]
+
+            target_display = get_target_display(profile, user_id)
+            summary_lines = [
+                f"\n┌✅ <b>Профиль {profile_index+1}</b>\n"
+                f"├👤 <b>Получатель:</b> {target_display}\n"
+                f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
+                f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
+            ]
+            gift_summary = {}
+            for p in purchases:
+                key = p["id"]
+                if key not in gift_summary:
+                    gift_summary[key] = {"price": p["price"], "count": 0}
+                gift_summary[key]["count"] += 1
+
+            gift_items = list(gift_summary.items())
+            for idx, (gid, data) in enumerate(gift_items):
+                prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
+                summary_lines.append(
+                    f"{prefix} {data['price']:,} ★ × {data['count']}"
+                )
+            report_message_lines += summary_lines
+
+            logger.info("Профиль #%s завершён для user_id=%s", profile_index+1, user_id)
+            progress_made = True
+            await refresh_balance(bot, user_id)  # Передаём user_id
+            continue  # К следующему профилю
+
+        # Если ничего не куплено — баланс/лимит/подарки кончились
+        if (profile["BOUGHT"] < COUNT or profile["SPENT"] < LIMIT) and not profile["DONE"] and made_local_progress:
+            target_display = get_target_display(profile, user_id)
+            summary_lines = [
+                f"\n┌⚠️ <b>Профиль {profile_index+1}</b> (частично)\n"
+                f"├👤 <b>Получатель:</b> {target_display}\n"
+                f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
+                f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
+            ]
+            gift_summary = {}
+            for p in purchases:
+                key = p["id"]
+                if key not in gift_summary:
+                    gift_summary[key] = {"price": p["price"], "count": 0}
+                gift_summary[key]["count"] += 1
+
+            gift_items = list(gift_summary.items())
+            for idx, (gid, data) in enumerate(gift_items):
+                prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
+                summary_lines.append(
+                    f"{prefix} {data['price']:,} ★ × {data['count']}"
+                )
+            report_message_lines += summary_lines
+
+            logger.warning("Профиль #%s не завершён для user_id=%s", profile_index+1, user_id)
+            progress_made = True
+            await refresh_balance(bot, user_id)  # Передаём user_id
+            continue  # К следующему профилю
+
+    if not any_success and not progress_made:
+        logger.warning(
+            "Не удалось купить ни один подарок ни в одном профиле для user_id=%s", user_id
+        )
+        config = await update_config(user_id, lambda config: config.update(ACTIVE=False))
+        text = "⚠️ Найдены подходящие подарки, но <b>не удалось</b> купить.\n💰 Пополните баланс!\n🚦 Статус изменён на 🔴 (неактивен)."
+        with tracer.span("notify", user_id=user_id):
+            outbox.send_message(user_id, text)
+            outbox.update_menu(user_id, user_id)
+
+    # После обработки всех профилей:
+    if progress_made:
+        config = await update_config(
+            user_id, lambda config: config.update(ACTIVE=not all(p.get("DONE") for p in config["PROFILES"]))
+        )
+        logger.info("Отчёт: хотя бы один профиль обработан для user_id=%s", user_id)
+        text = "🍀 <b>Отчёт по профилям:</b>\n"
+        text += "\n".join(report_message_lines) if report_message_lines else "⚠️ Покупок не совершено."
+        with tracer.span("notify", user_id=user_id):
+            outbox.send_message(user_id, text)
+            outbox.update_menu(user_id, user_id)
+
+    if all(p.get("DONE") for p in config["PROFILES"]) and config["ACTIVE"]:
+        config = await update_config(user_id, lambda config: config.update(ACTIVE=False))
+        text = "✅ Все профили <b>завершены</b>!\n⚠️ Нажмите ♻️ <b>Сбросить</b> или ✏️ <b>Изменить</b>!"
+        with tracer.span("notify", user_id=user_id):
+            outbox.send_message(user_id, text)
+            outbox.update_menu(user_id, user_id)
+
+async def gift_purchase_worker(
+        bot: Bot,
+        ready: asyncio.Event | None = None,
+        owns: Callable[[int], bool] | None = None,
+        allowed_users_max_age: float | None = None
+) -> None:
+    """
+    Фоновый воркер для покупки подарков по профилям всех разрешённых пользователей.
+    Учитывает параметр LIMIT — максимальную сумму звёзд, которую можно потратить на профиль.
+    Если лимит исчерпан — профиль считается завершённым и воркер переходит к следующему.
+    Начинает работу после прогрева (см. warm_up в main.py).
+    Каталог запрашивается один раз за проход; если в нём появились новые подарки (дроп),
+    проход трассируется целиком (см. utils.tracing).
+
+    Args:
+        bot: Экземпляр бота.
+        ready: Событие готовности базового снимка каталога (опционально).
+        owns: Фильтр пользователей, которых обслуживает этот воркер (шард, см. services.shards).
+        allowed_users_max_age: Период перечитывания списка разрешённых пользователей из базы.
+    """
+    if ready is not None:
+        await ready.wait()
+    known_gift_ids = None  # Подарки, уже виденные воркером (первый проход — базовый)
+    while True:
+        tick_started = time.perf_counter()
+        trace = None
+        try:
+            poll_started = time.monotonic()
+            snapshot = await get_catalog_snapshot(bot, force=True)
+            poll_finished = time.monotonic()
+            if known_gift_ids is None:
+                known_gift_ids = set(snapshot.by_id)
+            new_gift_ids = set(snapshot.by_id) - known_gift_ids
+            if new_gift_ids:
+                known_gift_ids |= new_gift_ids
+                trace = tracer.start("drop", started=poll_started, gifts=sorted(new_gift_ids))
+                trace.add_span("poll", poll_started, poll_finished, catalog=len(snapshot.gifts))
+                trace.add_span("diff", poll_finished, time.monotonic(), new=len(new_gift_ids))
+                logger.info("Новые подарки в каталоге: %s", ', '.join(sorted(new_gift_ids)))
+
+            allowed_user_ids = await get_allowed_users(allowed_users_max_age)  # Получаем список разрешённых пользователей
+            if owns is not None:
+                allowed_user_ids = [user_id for user_id in allowed_user_ids if owns(user_id)]
+        except Exception as e:
+            # Сбой опроса каталога или базы — пропускаем проход, воркер продолжает работу
+            logger.error("Не удалось начать проход gift_purchase_worker: %s", e)
+            allowed_user_ids = []
+
+        for user_id in allowed_user_ids:
+            try:
+                await process_user(bot, user_id, snapshot)
+            except Exception as e:
+                logger.error("Ошибка в gift_purchase_worker для user_id=%s: %s", user_id, e)
+
+        if trace is not None:
+            summary = tracer.finish(trace)
+            logger.info("Трасса дропа #%s: покупок %s за %.3f с", summary['trace_id'], summary['purchases'], summary['duration'])
+        WORKER_TICK.observe(time.perf_counter() - tick_started)
+        await asyncio.sleep(0.5)
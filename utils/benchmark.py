@@ -0,0 +1,181 @@
+"""
+Нагрузочный бенчмарк реакции воркера на выход лимитированного подарка.
+
+Поднимает N разрешённых пользователей по M профилей против имитации Bot API (utils.fakebot),
+запускает gift_purchase_worker, выпускает подарок с ограниченным тиражом и замеряет
+задержку до первой покупки, скорость покупок, число запросов к API и записей в базу на покупку,
+а также число попыток купить уже распроданный подарок. Результат — JSON.
+
+Пример:
+    python -m utils.benchmark --users 20 --profiles 3 --supply 50 --latency 0.05 --output bench.json
+"""
+
+# --- Стандартные библиотеки ---
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+
+# --- Внутренние модули ---
+import database
+from database import init_db, add_allowed_user, db_stats
+from services.config import DEFAULT_PROFILE, get_valid_config, save_config
+from services.outbox import outbox
+from services.scheduler import scheduler
+from services.worker import gift_purchase_worker
+from middlewares.request_priority import RequestPriorityMiddleware
+from utils.fakebot import FakeTelegram, FakeSession, FAKE_TOKEN
+from utils.tracing import tracer
+
+DROP_GIFT_ID = "drop"
+USER_ID_BASE = 100000
+
+async def setup_users(telegram: FakeTelegram, users: int, profiles: int, price: int, count: int) -> list[int]:
+    """
+    Создаёт пользователей с активными профилями, подходящими под подарок из дропа, и пополняет их баланс.
+
+    Returns:
+        list[int]: ID созданных пользователей.
+    """
+    user_ids = []
+    for i in range(users):
+        user_id = USER_ID_BASE + i
+        await add_allowed_user(user_id)
+        config = await get_valid_config(user_id)
+        config["PROFILES"] = []
+        for _ in range(profiles):
+            profile = DEFAULT_PROFILE(user_id)
+            profile.update(MIN_PRICE=price, MAX_PRICE=price, MIN_SUPPLY=1, MAX_SUPPLY=10 ** 9, COUNT=count, LIMIT=price * count)
+            config["PROFILES"].append(profile)
+        budget = price * count * profiles
+        config["BALANCE"] = budget
+        config["ACTIVE"] = True
+        await save_config(config, user_id)
+        telegram.deposit(user_id, budget, username=f"user{user_id}")
+        user_ids.append(user_id)
+    return user_ids
+
+async def all_idle(user_ids: list[int]) -> bool:
+    for user_id in user_ids:
+        config = await get_valid_config(user_id)
+        if config["ACTIVE"]:
+            return False
+    return True
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    """
+    Выполняет один прогон бенчмарка.
+
+    Returns:
+        dict: Параметры прогона и результаты.
+    """
+    telegram = FakeTelegram(
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        retry_after_rate=args.retry_after_rate,
+        network_error_rate=args.network_error_rate,
+        error_methods={"sendGift", "getAvailableGifts"}
+    )
+    bot = Bot(token=FAKE_TOKEN, session=FakeSession(telegram))
+    bot.session.middleware(RequestPriorityMiddleware(scheduler))
+
+    await init_db()
+    user_ids = await setup_users(telegram, args.users, args.profiles, args.price, args.count)
+
+    outbox_task = asyncio.create_task(outbox.run(bot))
+    worker_task = asyncio.create_task(gift_purchase_worker(bot))
+    try:
+        # Воркер крутится вхолостую, пока в каталоге нет подходящих подарков
+        await asyncio.sleep(args.warmup)
+
+        calls_before = telegram.calls.copy()
+        writes_before = db_stats["writes"]
+        telegram.add_gift(DROP_GIFT_ID, star_count=args.price, total_count=args.supply)
+        drop_time = time.monotonic()
+
+        timed_out = True
+        while time.monotonic() - drop_time < args.timeout:
+            await asyncio.sleep(0.05)
+            if await all_idle(user_ids):
+                timed_out = False
+                break
+        finished = time.monotonic()
+        calls = telegram.calls - calls_before
+        writes = db_stats["writes"] - writes_before
+    finally:
+        worker_task.cancel()
+        outbox_task.cancel()
+        await asyncio.gather(worker_task, outbox_task, return_exceptions=True)
+        await bot.session.close()
+
+    purchases = [gift for gift in telegram.sent_gifts if gift["gift_id"] == DROP_GIFT_ID]
+    bought = len(purchases)
+    first = purchases[0]["time"] - drop_time if purchases else None
+    span = purchases[-1]["time"] - purchases[0]["time"] if bought > 1 else 0.0
+    sold_out_misses = telegram.errors[("sendGift", "Bad Request: STARGIFT_USAGE_LIMITED")]
+
+    return {
+        "params": vars(args),
+        "results": {
+            "demand": args.users * args.profiles * args.count,
+            "supply": args.supply,
+            "purchases": bought,
+            "sold_out": telegram.gifts[DROP_GIFT_ID]["remaining_count"] == 0,
+            "drop_to_first_purchase_s": first,
+            "drop_to_finish_s": finished - drop_time,
+            "purchases_per_second": (bought - 1) / span if span else None,
+            "api_calls": calls.total(),
+            "api_calls_per_purchase": calls.total() / bought if bought else None,
+            "api_calls_by_method": dict(calls),
+            "db_writes": writes,
+            "db_writes_per_purchase": writes / bought if bought else None,
+            "sold_out_misses": sold_out_misses,
+            "errors": {f"{method}: {description}": n for (method, description), n in telegram.errors.items()},
+            "timed_out": timed_out,
+        },
+        "traces": list(tracer.recent),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк реакции воркера на выход лимитированного подарка")
+    parser.add_argument("--users", type=int, default=10, help="Число разрешённых пользователей")
+    parser.add_argument("--profiles", type=int, default=1, help="Профилей на пользователя")
+    parser.add_argument("--count", type=int, default=5, help="Подарков на профиль (COUNT)")
+    parser.add_argument("--price", type=int, default=100, help="Цена подарка в звёздах")
+    parser.add_argument("--supply", type=int, default=20, help="Тираж подарка")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка ответа API в секундах")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Случайная добавка к задержке в секундах")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="Доля ответов 429 на sendGift/getAvailableGifts")
+    parser.add_argument("--network-error-rate", type=float, default=0.0, help="Доля сетевых ошибок на sendGift/getAvailableGifts")
+    parser.add_argument("--seed", type=int, default=1, help="Seed имитации")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Секунд работы воркера до дропа")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Максимальная длительность прогона после дропа")
+    parser.add_argument("--output", default=None, help="Файл для JSON-результата (по умолчанию stdout)")
+    parser.add_argument("--trace", default=None, help="JSONL-файл для трасс дропа (см. python -m utils.tracing)")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логирования бота")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, stream=sys.stderr)
+    tracer.path = args.trace
+    with tempfile.TemporaryDirectory() as tmp:
+        # Отдельная база, чтобы не трогать bot.db
+        database.DB_PATH = os.path.join(tmp, "benchmark.db")
+        result = asyncio.run(run_benchmark(args))
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# --- Стандартные библиотеки ---
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Кэш фиксированного размера с вытеснением давно не использованных записей (LRU).
+    """
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Возвращает значение по ключу и помечает запись как недавно использованную.
+
+        Args:
+            key: Ключ записи.
+            default: Значение, если записи нет.
+
+        Returns:
+            Значение из кэша или default.
+        """
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def set(self, key, value) -> None:
+        """
+        Сохраняет значение, вытесняя самую старую запись при переполнении.
+
+        Args:
+            key: Ключ записи.
+            value: Значение.
+        """
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Удаляет запись из кэша и возвращает её значение.
+        """
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        """
+        Очищает кэш.
+        """
+        self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    """
+    LRU-кэш, записи которого устаревают через заданное время.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        """
+        Возвращает значение по ключу, если запись ещё не устарела.
+
+        Args:
+            key: Ключ записи.
+            default: Значение, если записи нет или она устарела.
+
+        Returns:
+            Значение из кэша или default.
+        """
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.pop(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        """
+        Сохраняет значение на ttl секунд (по умолчанию — на время, заданное для кэша).
+
+        Args:
+            key: Ключ записи.
+            value: Значение.
+            ttl: Время жизни записи в секундах (опционально).
+        """
+        super().set(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
@@ -0,0 +1,137 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor as BaseExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class Executor:
+    """
+    Общие пулы для работы, которую нельзя выполнять в цикле событий:
+    пул процессов для чисто вычислительных задач (перебор комбинаций) и пул потоков
+    для блокирующего ввода-вывода и крупных JSON. Пулы создаются при первом обращении.
+    Процессы пула запускаются через forkserver (spawn, где его нет), а не fork.
+    Сервер forkserver заранее импортирует только модули preload с функциями для пула процессов,
+    а не главный модуль приложения.
+
+    Задача, которую ждали дольше timeout, или корутина, ожидавшая её и отменённая, снимается
+    из очереди пула; уже начатая задача в процессе доработает сама, но её результат отбрасывается.
+    Поэтому долгие функции лучше ограничивать по времени изнутри.
+
+    Args:
+        processes: Размер пула процессов.
+        threads: Размер пула потоков.
+        preload: Модули, которые сервер forkserver импортирует до запуска процессов пула.
+    """
+    def __init__(self, processes: int = 2, threads: int = 4, preload: list[str] | None = None):
+        self.processes = processes
+        self.threads = threads
+        self.preload = preload or []
+        self._process_pool: ProcessPoolExecutor | None = None
+        self._thread_pool: ThreadPoolExecutor | None = None
+        self.submitted = {"cpu": 0, "io": 0}
+        self.timeouts = {"cpu": 0, "io": 0}
+
+    def configure(self, processes: int, threads: int, preload: list[str] | None = None) -> None:
+        """
+        Задаёт размеры пулов и модули для forkserver. Действует на пулы, которые ещё не созданы.
+        """
+        self.processes = processes
+        self.threads = threads
+        if preload is not None:
+            self.preload = preload
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # fork копировал бы в процессы пула цикл событий, потоки и открытые соединения бота
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            if method == "forkserver":
+                # По умолчанию forkserver импортирует __main__ целиком; процессам пула нужны только модули задач
+                context.set_forkserver_preload(self.preload)
+            self._process_pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="io")
+        return self._thread_pool
+
+    async def _run(self, kind: str, pool: BaseExecutor, func: Callable, args: tuple, kwargs: dict, timeout: float | None) -> Any:
+        self.submitted[kind] += 1
+        future = asyncio.get_running_loop().run_in_executor(pool, functools.partial(func, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts[kind] += 1
+            logger.warning("Задача %s в пуле %s не уложилась в %s с", getattr(func, "__name__", func), kind, timeout)
+            raise
+
+    async def run_cpu(self, func: Callable, *args, timeout: float | None = None, **kwargs) -> Any:
+        """
+        Выполняет вычислительную функцию в пуле процессов.
+        Функция и аргументы должны сериализоваться pickle (функция уровня модуля, простые данные).
+
+        Args:
+            func: Функция.
+            *args: Позиционные аргументы.
+            timeout: Максимальное время ожидания результата в секундах.
+            **kwargs: Именованные аргументы.
+
+        Returns:
+            Any: Результат функции.
+
+        Raises:
+            asyncio.TimeoutError: Если результат не получен за timeout.
+        """
+        try:
+            return await self._run("cpu", self._get_process_pool(), func, args, kwargs, timeout)
+        except BrokenProcessPool:
+            # Процесс пула упал (например, убит OOM) — пересоздаём пул для следующих задач
+            logger.error("Пул процессов сломан, пересоздаю")
+            self._process_pool = None
+            raise
+
+    async def run_io(self, func: Callable, *args, timeout: float | None = None, **kwargs) -> Any:
+        """
+        Выполняет блокирующую функцию в пуле потоков.
+
+        Args:
+            func: Функция.
+            *args: Позиционные аргументы.
+            timeout: Максимальное время ожидания результата в секундах.
+            **kwargs: Именованные аргументы.
+
+        Returns:
+            Any: Результат функции.
+
+        Raises:
+            asyncio.TimeoutError: Если результат не получен за timeout.
+        """
+        return await self._run("io", self._get_thread_pool(), func, args, kwargs, timeout)
+
+    def warm(self) -> None:
+        """
+        Создаёт пул процессов заранее, чтобы первая тяжёлая задача не ждала запуска процессов.
+        """
+        pool = self._get_process_pool()
+        for _ in range(self.processes):
+            pool.submit(int)
+
+    def shutdown(self) -> None:
+        """
+        Останавливает пулы, не дожидаясь задач в очереди.
+        """
+        for pool in (self._process_pool, self._thread_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._process_pool = None
+        self._thread_pool = None
+
+
+executor = Executor()
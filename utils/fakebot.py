@@ -0,0 +1,386 @@
+"""
+Имитация Bot API внутри процесса для офлайн-проверок и нагрузочных тестов.
+
+Пример:
+    telegram = FakeTelegram(seed=1, latency=0.05)
+    telegram.add_gift("1001", star_count=100, total_count=500)
+    telegram.deposit(user_id=42, amount=1000, username="user")
+    bot = Bot(token=FAKE_TOKEN, session=FakeSession(telegram))
+"""
+
+# --- Стандартные библиотеки ---
+import asyncio
+import json
+import random
+import time
+from collections import Counter, deque
+from typing import Any, AsyncGenerator, Dict, Optional
+
+# --- Сторонние библиотеки ---
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+FAKE_TOKEN = "42:FAKE-TOKEN"
+
+
+class FakeApiError(Exception):
+    """
+    Ошибка имитируемого API: превращается в ответ {"ok": false, ...} с кодом error_code.
+    """
+    def __init__(self, description: str, error_code: int = 400, retry_after: int | None = None):
+        super().__init__(description)
+        self.description = description
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+class FakeTelegram:
+    """
+    Состояние имитируемого Telegram: каталог подарков с убывающим остатком, журнал звёздных
+    транзакций, отправленные подарки и сообщения, счётчики вызовов методов.
+    Задержки и случайные ошибки берутся из генератора с фиксированным seed, поэтому прогоны воспроизводимы.
+
+    Args:
+        seed: Seed генератора случайных чисел.
+        latency: Базовая задержка ответа в секундах.
+        jitter: Случайная добавка к задержке (0..jitter секунд).
+        retry_after_rate: Доля запросов, получающих 429 Too Many Requests.
+        retry_after: Значение retry_after для таких ответов.
+        network_error_rate: Доля запросов, завершающихся сетевой ошибкой.
+        error_methods: Методы, к которым применяются случайные ошибки (None — ко всем).
+    """
+    def __init__(
+            self,
+            seed: int = 0,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            retry_after_rate: float = 0.0,
+            retry_after: int = 1,
+            network_error_rate: float = 0.0,
+            error_methods: set[str] | None = None,
+            bot_id: int = 42
+    ):
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.network_error_rate = network_error_rate
+        self.error_methods = error_methods
+        self.bot_user = {"id": bot_id, "is_bot": True, "first_name": "Fake Bot", "username": "fake_gifts_bot"}
+
+        self.gifts: dict[str, dict] = {}
+        self.transactions: list[dict] = []
+        self.users: dict[int, dict] = {}
+        self.chats: dict[str, dict] = {}
+        self.sent_gifts: list[dict] = []
+        self.messages: dict[tuple[int, int], dict] = {}
+        self.calls = Counter()
+        self.errors = Counter()  # (метод, описание ошибки) -> количество
+        self._scripted_errors: dict[str, deque] = {}
+        self._message_id = 0
+        self._charge_id = 0
+
+    # --- Наполнение ---
+
+    def add_gift(
+            self,
+            gift_id: str,
+            star_count: int,
+            total_count: int | None = None,
+            remaining_count: int | None = None
+    ) -> dict:
+        """
+        Добавляет подарок в каталог. Без total_count подарок безлимитный.
+        """
+        gift = {
+            "id": gift_id,
+            "star_count": star_count,
+            "sticker": {
+                "file_id": f"FAKE_STICKER_{gift_id}",
+                "file_unique_id": f"FAKE_UNIQUE_{gift_id}",
+                "type": "regular",
+                "width": 512,
+                "height": 512,
+                "is_animated": True,
+                "is_video": False,
+                "emoji": "🎁"
+            }
+        }
+        if total_count is not None:
+            gift["total_count"] = total_count
+            gift["remaining_count"] = total_count if remaining_count is None else remaining_count
+        self.gifts[gift_id] = gift
+        return gift
+
+    def add_user(self, user_id: int, username: str | None = None) -> dict:
+        user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+        if username:
+            user["username"] = username
+        self.users[user_id] = user
+        return user
+
+    def add_channel(self, chat_id: int, username: str) -> dict:
+        chat = {"id": chat_id, "type": "channel", "title": username, "username": username}
+        self.chats[username.lower()] = chat
+        return chat
+
+    def deposit(self, user_id: int, amount: int, username: str | None = None) -> str:
+        """
+        Добавляет в журнал входящий платёж звёздами от пользователя. Возвращает ID платежа.
+        """
+        user = self.users.get(user_id) or self.add_user(user_id, username)
+        self._charge_id += 1
+        charge_id = f"fake_charge_{self._charge_id}"
+        self.transactions.append({
+            "id": charge_id,
+            "amount": amount,
+            "date": int(time.time()),
+            "source": {"type": "user", "transaction_type": "invoice_payment", "user": user}
+        })
+        return charge_id
+
+    def fail_next(self, method: str, error: FakeApiError | str = "network", count: int = 1) -> None:
+        """
+        Заставляет следующие count вызовов метода завершиться ошибкой.
+
+        Args:
+            method: Метод API, например "sendGift".
+            error: FakeApiError или "network" для сетевой ошибки.
+            count: Число вызовов.
+        """
+        self._scripted_errors.setdefault(method, deque()).extend([error] * count)
+
+    # --- Состояние ---
+
+    @property
+    def star_balance(self) -> int:
+        balance = 0
+        for txn in self.transactions:
+            balance += txn["amount"] if "source" in txn else -txn["amount"]
+        return balance
+
+    def injected_error(self, method: str) -> FakeApiError | str | None:
+        """
+        Возвращает ошибку для очередного вызова метода: сначала заданные через fail_next, затем случайные.
+        """
+        scripted = self._scripted_errors.get(method)
+        if scripted:
+            return scripted.popleft()
+        if self.error_methods is not None and method not in self.error_methods:
+            return None
+        roll = self.random.random()
+        if roll < self.network_error_rate:
+            return "network"
+        if roll < self.network_error_rate + self.retry_after_rate:
+            return FakeApiError(
+                f"Too Many Requests: retry after {self.retry_after}",
+                error_code=429,
+                retry_after=self.retry_after
+            )
+        return None
+
+    def delay(self) -> float:
+        return self.latency + (self.random.random() * self.jitter if self.jitter else 0.0)
+
+    # --- Методы API ---
+
+    def call(self, method: str, params: dict) -> Any:
+        """
+        Выполняет метод API над состоянием и возвращает поле result ответа.
+        """
+        self.calls[method] += 1
+        handler = getattr(self, f"api_{method}", None)
+        if handler is None:
+            raise FakeApiError("Not Found", error_code=404)
+        return handler(**params)
+
+    def _user(self, user_id: int) -> dict:
+        return self.users.get(user_id) or self.add_user(user_id)
+
+    def _chat(self, chat_id: int | str) -> dict:
+        if isinstance(chat_id, str) and chat_id.startswith("@"):
+            chat = self.chats.get(chat_id[1:].lower())
+            if chat is None:
+                raise FakeApiError("Bad Request: chat not found")
+            return chat
+        chat_id = int(chat_id)
+        for chat in self.chats.values():
+            if chat["id"] == chat_id:
+                return chat
+        return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+
+    def _message(self, chat_id: int | str, text: str | None = None, reply_markup: dict | None = None, **extra) -> dict:
+        chat = self._chat(chat_id)
+        self._message_id += 1
+        message = {"message_id": self._message_id, "date": int(time.time()), "chat": chat, "from": self.bot_user}
+        if text is not None:
+            message["text"] = text
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        message.update(extra)
+        self.messages[(chat["id"], self._message_id)] = message
+        return message
+
+    def api_getMe(self, **_) -> dict:
+        return self.bot_user
+
+    def api_getUpdates(self, **_) -> list:
+        return []
+
+    def api_setWebhook(self, **_) -> bool:
+        return True
+
+    def api_deleteWebhook(self, **_) -> bool:
+        return True
+
+    def api_getChat(self, chat_id: int | str, **_) -> dict:
+        chat = self._chat(chat_id)
+        return dict(chat, accent_color_id=0, max_reaction_count=11, accepted_gift_types={
+            "unlimited_gifts": True,
+            "limited_gifts": True,
+            "unique_gifts": True,
+            "premium_subscription": True
+        })
+
+    def api_getAvailableGifts(self, **_) -> dict:
+        return {"gifts": [dict(gift) for gift in self.gifts.values()]}
+
+    def api_sendGift(self, gift_id: str, user_id: int | None = None, chat_id: int | str | None = None, **_) -> bool:
+        gift = self.gifts.get(gift_id)
+        if gift is None:
+            raise FakeApiError("Bad Request: STARGIFT_INVALID")
+        if gift.get("remaining_count") == 0:
+            raise FakeApiError("Bad Request: STARGIFT_USAGE_LIMITED")
+        if self.star_balance < gift["star_count"]:
+            raise FakeApiError("Bad Request: BALANCE_TOO_LOW")
+        receiver = self._chat(chat_id)["id"] if chat_id is not None else user_id
+        if "remaining_count" in gift:
+            gift["remaining_count"] -= 1
+        self.sent_gifts.append({"gift_id": gift_id, "receiver": receiver, "star_count": gift["star_count"], "time": time.monotonic()})
+        self.transactions.append({
+            "id": f"fake_gift_{len(self.sent_gifts)}",
+            "amount": gift["star_count"],
+            "date": int(time.time()),
+            "receiver": {"type": "user", "transaction_type": "gift_purchase", "user": self._user(receiver), "gift": gift}
+        })
+        return True
+
+    def api_getStarTransactions(self, offset: int = 0, limit: int = 100, **_) -> dict:
+        return {"transactions": self.transactions[offset:offset + limit]}
+
+    def api_refundStarPayment(self, user_id: int, telegram_payment_charge_id: str, **_) -> bool:
+        deposit = next((
+            txn for txn in self.transactions
+            if txn["id"] == telegram_payment_charge_id and "source" in txn and txn["source"]["user"]["id"] == user_id
+        ), None)
+        if deposit is None:
+            raise FakeApiError("Bad Request: CHARGE_NOT_FOUND")
+        if any(txn["id"] == telegram_payment_charge_id and "receiver" in txn for txn in self.transactions):
+            raise FakeApiError("Bad Request: CHARGE_ALREADY_REFUNDED")
+        self.transactions.append({
+            "id": telegram_payment_charge_id,
+            "amount": deposit["amount"],
+            "date": int(time.time()),
+            "receiver": {"type": "user", "transaction_type": "invoice_payment", "user": self._user(user_id)}
+        })
+        return True
+
+    def api_sendMessage(self, chat_id: int | str, text: str, reply_markup: dict | None = None, **_) -> dict:
+        return self._message(chat_id, text, reply_markup)
+
+    def api_sendInvoice(self, chat_id: int | str, title: str, description: str, payload: str, currency: str, prices: list, **_) -> dict:
+        return self._message(chat_id, invoice={
+            "title": title,
+            "description": description,
+            "start_parameter": payload,
+            "currency": currency,
+            "total_amount": sum(price["amount"] for price in prices)
+        })
+
+    def _edit(self, chat_id: int | str, message_id: int, **changes) -> dict:
+        key = (self._chat(chat_id)["id"], message_id)
+        message = self.messages.get(key)
+        if message is None:
+            raise FakeApiError("Bad Request: message to edit not found")
+        if all(message.get(field) == value for field, value in changes.items()):
+            raise FakeApiError(
+                "Bad Request: message is not modified: specified new message content and reply markup "
+                "are exactly the same as a current content and reply markup of the message"
+            )
+        message.update(changes)
+        message["edit_date"] = int(time.time())
+        return message
+
+    def api_editMessageText(self, text: str, chat_id: int | str, message_id: int, reply_markup: dict | None = None, **_) -> dict:
+        return self._edit(chat_id, message_id, text=text, reply_markup=reply_markup)
+
+    def api_editMessageReplyMarkup(self, chat_id: int | str, message_id: int, reply_markup: dict | None = None, **_) -> dict:
+        return self._edit(chat_id, message_id, reply_markup=reply_markup)
+
+    def api_deleteMessage(self, chat_id: int | str, message_id: int, **_) -> bool:
+        if self.messages.pop((self._chat(chat_id)["id"], message_id), None) is None:
+            raise FakeApiError("Bad Request: message to delete not found")
+        return True
+
+    def api_answerCallbackQuery(self, **_) -> bool:
+        return True
+
+    def api_answerPreCheckoutQuery(self, **_) -> bool:
+        return True
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия aiogram, которая вместо HTTP-запросов вызывает FakeTelegram.
+    Ответ проходит через стандартный check_response, поэтому ошибки превращаются в те же исключения
+    aiogram (TelegramBadRequest, TelegramRetryAfter, ...), а результаты — в те же объекты, что и с настоящим API.
+    Мидлвари сессии (bot.session.middleware) работают как обычно.
+    """
+    def __init__(self, telegram: FakeTelegram, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.telegram = telegram
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None) -> TelegramType:
+        api_method = method.__api_method__
+        params = self.prepare_value(method.model_dump(warnings=False), bot=bot, files={}, _dumps_json=False)
+        delay = self.telegram.delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+        error = self.telegram.injected_error(api_method)
+        if error == "network":
+            self.telegram.calls[api_method] += 1
+            self.telegram.errors[(api_method, "network")] += 1
+            raise TelegramNetworkError(method=method, message="ClientConnectionError: simulated network failure")
+        try:
+            if error is not None:
+                self.telegram.calls[api_method] += 1
+                raise error
+            payload = {"ok": True, "result": self.telegram.call(api_method, params)}
+            status_code = 200
+        except FakeApiError as e:
+            self.telegram.errors[(api_method, e.description)] += 1
+            payload = {"ok": False, "error_code": e.error_code, "description": e.description}
+            if e.retry_after is not None:
+                payload["parameters"] = {"retry_after": e.retry_after}
+            status_code = e.error_code
+
+        response = self.check_response(bot=bot, method=method, status_code=status_code, content=json.dumps(payload))
+        return response.result
+
+    async def stream_content(
+            self,
+            url: str,
+            headers: Optional[Dict[str, Any]] = None,
+            timeout: int = 30,
+            chunk_size: int = 65536,
+            raise_for_status: bool = True
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
@@ -1,16 +1,146 @@
 # --- Стандартные библиотеки ---
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import time
 
-def setup_logging(level=logging.INFO):
+TEXT_FORMAT = "[{asctime}] [{levelname}] {name}: {message}"
+DATE_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+# Логгеры журнала покупок: их записи не ограничиваются по частоте
+AUDIT_LOGGERS = ("services.buy", "services.worker")
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись лога в одну строку JSON.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Ограничивает частоту одинаковых сообщений: не больше burst записей с одним шаблоном
+    (логгер, уровень, msg до подстановки аргументов) за interval секунд.
+    Ограничиваются только DEBUG и INFO: предупреждения, ошибки и записи логгеров из exempt
+    (журнал покупок) проходят всегда.
+    Когда окно закрывается (следующая запись с тем же шаблоном или очистка старых окон
+    раз в interval), число подавленных в нём записей выводится отдельной строкой.
     """
-    Инициализация стандартного логирования для проекта.
+    def __init__(self, interval: float = 10.0, burst: int = 5, exempt: tuple[str, ...] = ()):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.exempt = frozenset(exempt)
+        self._windows: dict[tuple, list] = {}  # ключ -> [начало окна, записей в окне, подавлено]
+        self._next_sweep = time.monotonic() + interval
+        self._reporting = False
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or record.name in self.exempt or self._reporting:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        closed = []  # (ключ, подавлено) закрытых окон
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.interval
+            windows = {}
+            for k, w in self._windows.items():
+                if now - w[0] < self.interval:
+                    windows[k] = w
+                elif w[2]:
+                    closed.append((k, w[2]))
+            self._windows = windows
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if window and window[2]:
+                closed.append((key, window[2]))
+            self._windows[key] = [now, 1, 0]
+            passed = True
+        else:
+            window[1] += 1
+            passed = window[1] <= self.burst
+            if not passed:
+                window[2] += 1
+        if closed:
+            self._report(closed)
+        return passed
+
+    def _report(self, closed: list[tuple[tuple, int]]) -> None:
+        """
+        Выводит число подавленных записей закрытых окон. Эти строки сами не фильтруются.
+
+        Args:
+            closed: Пары (ключ окна, число подавленных записей).
+        """
+        self._reporting = True
+        try:
+            for (name, levelno, msg), suppressed in closed:
+                logging.getLogger(name).log(
+                    levelno, "Подавлено повторов за %g с: %s — %s", self.interval, suppressed, msg
+                )
+        finally:
+            self._reporting = False
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который в вызывающем потоке только подставляет аргументы в сообщение,
+    а форматирование (время, трейсбек, JSON) и вывод выполняет поток QueueListener.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level=logging.INFO, fmt: str = "text", repeat_interval: float = 10.0, repeat_burst: int = 5):
+    """
+    Инициализация логирования для проекта.
+    Записи попадают в очередь, а в stdout их пишет отдельный поток, поэтому вывод логов
+    не блокирует цикл событий. Повторяющиеся DEBUG и INFO сообщения ограничиваются по частоте,
+    кроме журнала покупок.
 
     Аргументы:
         level (int, optional): Уровень логирования (по умолчанию logging.INFO).
+        fmt (str, optional): Формат вывода: "text" или "json".
+        repeat_interval (float, optional): Окно ограничения повторов в секундах.
+        repeat_burst (int, optional): Сколько одинаковых сообщений пропускать за окно.
     """
-    logging.basicConfig(
-        level=level,
-        format="[{asctime}] [{levelname}] {name}: {message}",
-        style="{",
-        datefmt="%d.%m.%Y %H:%M:%S"
-    )
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT, style="{", datefmt=DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter(repeat_interval, repeat_burst, exempt=AUDIT_LOGGERS))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Дописываем оставшиеся записи при завершении процесса
+    atexit.register(_listener.stop)
@@ -0,0 +1,101 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+# --- Внутренние модули ---
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LAG_QUANTILES = (0.5, 0.95, 0.99, 1.0)
+
+LOOP_LAG = registry.histogram("event_loop_lag_seconds", "Задержка срабатывания таймера цикла событий", buckets=LAG_BUCKETS)
+LOOP_STALLS = registry.counter("event_loop_stalls_total", "Блокировки цикла событий дольше порога")
+
+
+class LoopLagMonitor:
+    """
+    Следит за задержкой цикла событий. Задача в цикле засыпает на interval и измеряет, насколько
+    позже она проснулась. Отдельный поток-сторож проверяет, что задача отметилась вовремя, и если
+    цикл заблокирован дольше threshold, снимает стек главного потока (sys._current_frames)
+    и пишет его в лог — так видно, какой вызов держит цикл.
+
+    Args:
+        interval: Период измерения в секундах.
+        threshold: Задержка, после которой цикл считается заблокированным.
+        window: Сколько последних измерений учитывать в процентилях.
+        keep: Сколько последних блокировок со стеками хранить в памяти.
+    """
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, window: int = 600, keep: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=window)
+        self.stalls = deque(maxlen=keep)
+        self._heartbeat = time.monotonic()
+        self._reported = None
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        registry.gauge(
+            "event_loop_lag_quantile_seconds", "Процентили задержки цикла событий за последнее окно", ("quantile",),
+            func=lambda: {(str(q),): lag for q, lag in self.percentiles().items()}
+        )
+
+    def percentiles(self) -> dict[float, float]:
+        """
+        Процентили задержки по последним измерениям.
+
+        Returns:
+            dict[float, float]: Квантиль -> задержка в секундах (1.0 — максимум).
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return {}
+        return {q: samples[min(int(q * len(samples)), len(samples) - 1)] for q in LAG_QUANTILES}
+
+    async def run(self) -> None:
+        """
+        Измеряет задержку цикла, пока задачу не отменят. Поток-сторож живёт столько же.
+        """
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                started = time.monotonic()
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(now - started - self.interval, 0.0)
+                self._heartbeat = now
+                self.samples.append(lag)
+                LOOP_LAG.observe(lag)
+                if lag >= self.threshold:
+                    LOOP_STALLS.inc()
+        finally:
+            self._stop.set()
+
+    def _watch(self) -> None:
+        """
+        Поток-сторож: раз в interval проверяет отметку цикла и снимает стек при блокировке.
+        Стек снимается один раз на каждую блокировку.
+        """
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or self._reported == heartbeat:
+                continue
+            self._reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.stalls.append({"time": time.time(), "blocked": blocked, "stack": stack})
+            logger.warning("Цикл событий заблокирован уже %.3f с, стек:\n%s", blocked, stack)
+
@@ -0,0 +1,179 @@
+# --- Стандартные библиотеки ---
+import bisect
+import logging
+from typing import Callable
+
+# --- Сторонние библиотеки ---
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм задержек по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        for name, value in zip(labelnames, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    Базовый класс метрики с набором меток.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += self.samples()
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Монотонно растущий счётчик.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """
+    Текущее значение. Может вычисляться при каждом запросе метрик функцией func,
+    которая возвращает число или словарь {кортеж значений меток: число}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), func: Callable | None = None):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> list[str]:
+        values = self._values
+        if self.func is not None:
+            try:
+                result = self.func()
+            except Exception as e:
+                logger.warning("Не удалось вычислить метрику %s: %s", self.name, e)
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с кумулятивными бакетами, суммой и числом наблюдений.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # метки -> [счётчики бакетов..., +Inf, сумма]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect.bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, data in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {data[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Реестр метрик процесса. Повторная регистрация с тем же именем возвращает уже созданную метрику.
+    """
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def _register(self, metric_type: type, name: str, *args, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = metric_type(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), func: Callable | None = None) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames, func=func)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """
+        Возвращает все метрики в текстовом формате Prometheus.
+        """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+
+async def start_metrics_server(host: str, port: int, path: str = "/metrics") -> web.AppRunner:
+    """
+    Запускает HTTP-сервер, отдающий метрики реестра по адресу path.
+
+    Args:
+        host: Адрес для прослушивания (обычно 127.0.0.1).
+        port: Порт.
+        path: Путь к метрикам.
+
+    Returns:
+        web.AppRunner: Запущенный сервер (для остановки через cleanup()).
+    """
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get(path, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Метрики доступны на http://%s:%s%s", host, port, path)
+    return runner
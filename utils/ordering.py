@@ -0,0 +1,76 @@
+# --- Стандартные библиотеки ---
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
+# --- Сторонние библиотеки ---
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+class UserOrderedIsolation(BaseEventIsolation):
+    """
+    Изоляция событий для Dispatcher: апдейты разных пользователей обрабатываются параллельно,
+    а апдейты одного пользователя — строго по очереди в порядке поступления.
+    Общее число одновременно обрабатываемых апдейтов ограничено max_in_flight.
+    Блокировка берётся до чтения состояния FSM, поэтому следующий апдейт пользователя видит
+    состояние, оставленное предыдущим. Апдейты должны запускаться задачами
+    (handle_as_tasks в polling, handle_in_background в webhook).
+    """
+    def __init__(self, max_in_flight: int = 64):
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._user_locks: dict[int, asyncio.Lock] = {}
+        self._user_depth: dict[int, int] = {}  # user_id -> апдейтов в очереди и в обработке
+        self.pending = 0  # апдейтов в очереди и в обработке
+        self.in_flight = 0
+        self.processed = 0
+        self.max_user_depth = 0
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        user_id = key.user_id
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        depth = self._user_depth.get(user_id, 0) + 1
+        self._user_depth[user_id] = depth
+        self.max_user_depth = max(self.max_user_depth, depth)
+        self.pending += 1
+        try:
+            # Сначала очередь пользователя, потом общий лимит: ожидающие апдейты
+            # одного пользователя не занимают слоты остальных
+            async with lock:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    try:
+                        yield
+                    finally:
+                        self.in_flight -= 1
+                        self.processed += 1
+        finally:
+            self.pending -= 1
+            depth = self._user_depth[user_id] - 1
+            if depth:
+                self._user_depth[user_id] = depth
+            else:
+                del self._user_depth[user_id]
+                del self._user_locks[user_id]
+
+    def stats(self) -> dict:
+        """
+        Возвращает метрики очередей.
+
+        Returns:
+            dict: in_flight — в обработке, queued — ждут очереди пользователя или общего лимита,
+                  active_users — пользователей с апдейтами в работе, max_user_depth — максимальная
+                  глубина очереди одного пользователя, processed — обработано всего.
+        """
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.pending - self.in_flight,
+            "active_users": len(self._user_depth),
+            "max_user_depth": self.max_user_depth,
+            "processed": self.processed,
+        }
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,94 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import cProfile
+import io
+import pstats
+import time
+import traceback
+
+_profiling = False
+
+
+def is_profiling() -> bool:
+    return _profiling
+
+
+async def profile_for(seconds: float, top: int = 50) -> str:
+    """
+    Профилирует работающий процесс cProfile в течение seconds секунд.
+    Профилировщик ставится на поток цикла событий, поэтому в отчёт попадают все задачи
+    бота (хендлеры, воркер, outbox), которые выполнялись за это время.
+
+    Args:
+        seconds: Длительность профилирования.
+        top: Сколько функций выводить.
+
+    Returns:
+        str: Топ функций по кумулятивному времени.
+
+    Raises:
+        RuntimeError: Если профилирование уже идёт.
+    """
+    global _profiling
+    if _profiling:
+        raise RuntimeError("Профилирование уже запущено")
+    _profiling = True
+    profiler = cProfile.Profile()
+    started = time.monotonic()
+    try:
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    finally:
+        _profiling = False
+
+    buf = io.StringIO()
+    buf.write(f"Профиль за {time.monotonic() - started:.1f} с, сортировка по cumulative\n\n")
+    stats = pstats.Stats(profiler, stream=buf)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    buf.write("\nСортировка по tottime (собственное время функции)\n\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return buf.getvalue()
+
+
+def _await_chain(task: asyncio.Task) -> list[str]:
+    """
+    Цепочка корутин задачи от внешней к внутренней и объект, которого ждёт самая внутренняя.
+    """
+    lines = []
+    obj = task.get_coro()
+    while obj is not None:
+        frame = getattr(obj, "cr_frame", None) or getattr(obj, "gi_frame", None) or getattr(obj, "ag_frame", None)
+        if frame is None:
+            # Дошли до awaitable без кадра: показываем future, на которой задача заблокирована
+            waiter = getattr(task, "_fut_waiter", None)
+            lines.append(f"  ждёт {waiter if waiter is not None else obj!r}"[:300])
+            break
+        code = frame.f_code
+        lines.append(f"  {code.co_qualname} ({code.co_filename}:{frame.f_lineno})")
+        obj = getattr(obj, "cr_await", None) or getattr(obj, "gi_yieldfrom", None) or getattr(obj, "ag_await", None)
+    return lines
+
+
+def dump_tasks() -> str:
+    """
+    Снимок всех задач asyncio: имя, состояние и цепочка await, на которой задача стоит.
+
+    Returns:
+        str: Текстовый отчёт.
+    """
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    current = asyncio.current_task()
+    buf = io.StringIO()
+    buf.write(f"Задач: {len(tasks)}\n\n")
+    for task in tasks:
+        state = "текущая" if task is current else ("отменяется" if task.cancelling() else "ожидает")
+        buf.write(f"{task.get_name()} [{state}]\n")
+        try:
+            buf.write("\n".join(_await_chain(task)) + "\n")
+        except Exception:
+            traceback.print_exc(file=buf)
+        buf.write("\n")
+    return buf.getvalue()
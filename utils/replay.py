@@ -0,0 +1,144 @@
+"""
+Воспроизведение записанных апдейтов на webhook-сервере бота с замером задержки.
+
+Бот обрабатывает воспроизведённые апдейты по-настоящему и ходит в Bot API со своим токеном,
+поэтому по умолчанию пропускаются апдейты, которые тратят или возвращают звёзды и меняют доступ:
+колбэки (в том числе подтверждение покупки), платежи и админские команды. Флаг --unsafe
+воспроизводит всё — только для бота с отдельным тестовым токеном.
+
+Пример:
+    python -m utils.replay updates.jsonl --url http://127.0.0.1:8080/webhook --secret SECRET --repeat 5
+"""
+
+# --- Стандартные библиотеки ---
+import argparse
+import asyncio
+import json
+import time
+
+# --- Сторонние библиотеки ---
+import aiohttp
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+UNSAFE_KINDS = {"callback_query", "pre_checkout_query", "successful_payment"}
+UNSAFE_COMMANDS = ("/withdraw_all", "/grant_access", "/revoke_access")
+
+def load_updates(path: str) -> list[dict]:
+    """
+    Загружает записанные апдейты из JSONL-файла.
+
+    Args:
+        path: Путь к файлу.
+
+    Returns:
+        list[dict]: Апдейты в формате Bot API.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def update_kind(update: dict) -> str:
+    """
+    Определяет тип апдейта для группировки замеров: колбэки и платежи считаются отдельно.
+
+    Args:
+        update: Апдейт в формате Bot API.
+
+    Returns:
+        str: Тип апдейта.
+    """
+    message = update.get("message")
+    if message is not None:
+        return "successful_payment" if "successful_payment" in message else "message"
+    for kind in update:
+        if kind != "update_id":
+            return kind
+    return "unknown"
+
+def is_safe(update: dict) -> bool:
+    """
+    Проверяет, что апдейт можно воспроизвести на живом токене: он не покупает подарки,
+    не проводит платежи и возвраты и не меняет список доступа.
+
+    Args:
+        update: Апдейт в формате Bot API.
+
+    Returns:
+        bool: True, если апдейт безопасен.
+    """
+    if update_kind(update) in UNSAFE_KINDS:
+        return False
+    words = ((update.get("message") or {}).get("text") or "").split()
+    return not words or words[0].split("@")[0] not in UNSAFE_COMMANDS
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Возвращает перцентиль p (0..100) отсортированного списка.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, round(p / 100 * (len(values) - 1)))
+    return values[index]
+
+async def replay(url: str, updates: list[dict], secret: str | None = None, repeat: int = 1) -> dict[str, list[float]]:
+    """
+    Отправляет апдейты на webhook по одному и замеряет время до ответа сервера.
+
+    Args:
+        url: Адрес webhook.
+        updates: Апдейты для отправки.
+        secret: Секретный токен webhook (опционально).
+        repeat: Сколько раз повторить весь набор.
+
+    Returns:
+        dict[str, list[float]]: Задержки в миллисекундах по типам апдейтов.
+    """
+    headers = {SECRET_HEADER: secret} if secret else {}
+    latencies = {}
+    update_id = max((u.get("update_id", 0) for u in updates), default=0)
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for _ in range(repeat):
+            for update in updates:
+                # Уникальный update_id, чтобы повторы не отличались от новых апдейтов
+                update_id += 1
+                payload = dict(update, update_id=update_id)
+                start = time.perf_counter()
+                async with session.post(url, json=payload) as response:
+                    await response.read()
+                    if response.status != 200:
+                        raise RuntimeError(f"Webhook ответил {response.status} на апдейт {update_id}")
+                latencies.setdefault(update_kind(update), []).append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def format_report(latencies: dict[str, list[float]]) -> str:
+    """
+    Формирует таблицу с перцентилями задержек по типам апдейтов.
+    """
+    lines = [f"{'тип':<22}{'n':>6}{'p50, мс':>10}{'p95, мс':>10}{'max, мс':>10}"]
+    for kind, values in sorted(latencies.items()):
+        values = sorted(values)
+        lines.append(
+            f"{kind:<22}{len(values):>6}{percentile(values, 50):>10.1f}"
+            f"{percentile(values, 95):>10.1f}{values[-1]:>10.1f}"
+        )
+    return "\n".join(lines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов на webhook бота")
+    parser.add_argument("path", help="JSONL-файл с апдейтами (UPDATES_RECORD_PATH)")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook", help="Адрес webhook")
+    parser.add_argument("--secret", default=None, help="Секретный токен webhook (WEBHOOK_SECRET)")
+    parser.add_argument("--repeat", type=int, default=1, help="Сколько раз повторить набор апдейтов")
+    parser.add_argument("--unsafe", action="store_true", help="Воспроизводить и колбэки, платежи, админские команды (только тестовый токен)")
+    args = parser.parse_args()
+
+    updates = load_updates(args.path)
+    if not args.unsafe:
+        safe = [update for update in updates if is_safe(update)]
+        if len(safe) < len(updates):
+            print(f"Пропущено апдейтов с побочными эффектами: {len(updates) - len(safe)} (--unsafe, чтобы воспроизвести все)")
+        updates = safe
+    latencies = asyncio.run(replay(args.url, updates, args.secret, args.repeat))
+    print(format_report(latencies))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+from typing import Any
+
+# --- Сторонние библиотеки ---
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import Bot, __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+
+logger = logging.getLogger(__name__)
+
+class PooledAiohttpSession(AiohttpSession):
+    """
+    HTTP-сессия бота с настраиваемым пулом соединений и статистикой их переиспользования.
+    Пул прогревается заранее (warm) и поддерживается открытым дешёвыми запросами (keep_alive),
+    чтобы покупка после простоя не ждала нового TLS-рукопожатия.
+    """
+    def __init__(
+            self,
+            limit: int = 100,
+            limit_per_host: int = 0,
+            keepalive_timeout: float = 75,
+            dns_ttl: int = 3600,
+            **kwargs: Any
+    ):
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_ttl
+        )
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self._trace_config = TraceConfig()
+        self._trace_config.on_request_start.append(self._on_request_start)
+        self._trace_config.on_connection_create_end.append(self._on_connection_create)
+        self._trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+
+    async def _on_request_start(self, session, context, params) -> None:
+        self.requests += 1
+
+    async def _on_connection_create(self, session, context, params) -> None:
+        self.connections_created += 1
+
+    async def _on_connection_reuse(self, session, context, params) -> None:
+        self.connections_reused += 1
+
+    async def create_session(self) -> ClientSession:
+        # То же, что AiohttpSession.create_session, но с трассировкой соединений
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={
+                    USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}",
+                },
+                trace_configs=[self._trace_config],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику пула соединений.
+
+        Returns:
+            dict: requests — запросов всего, created — открыто соединений, reused — запросов
+                  по уже открытому соединению, reuse_ratio — доля таких запросов,
+                  requests_per_connection — среднее число запросов на одно соединение.
+        """
+        return {
+            "requests": self.requests,
+            "created": self.connections_created,
+            "reused": self.connections_reused,
+            "reuse_ratio": self.connections_reused / self.requests if self.requests else 0.0,
+            "requests_per_connection": self.requests / self.connections_created if self.connections_created else 0.0,
+        }
+
+    async def warm(self, bot: Bot, connections: int) -> None:
+        """
+        Открывает (или обновляет) connections соединений параллельными запросами getMe.
+
+        Args:
+            bot: Экземпляр бота, использующий эту сессию.
+            connections: Сколько соединений держать тёплыми.
+        """
+        results = await asyncio.gather(*(bot.get_me() for _ in range(connections)), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logger.warning("Прогрев соединений: ошибок %s из %s: %s", len(errors), connections, errors[0])
+
+    async def keep_alive(self, bot: Bot, connections: int, interval: float) -> None:
+        """
+        Бесконечный цикл: каждые interval секунд прогоняет запросы по тёплым соединениям,
+        чтобы они не закрывались по простою. interval должен быть меньше keepalive_timeout.
+
+        Args:
+            bot: Экземпляр бота, использующий эту сессию.
+            connections: Сколько соединений держать тёплыми.
+            interval: Период в секундах.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.warm(bot, connections)
+            logger.debug("Пул соединений: %s", self.stats())
@@ -0,0 +1,52 @@
+# --- Стандартные библиотеки ---
+import bisect
+import hashlib
+from typing import Callable
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Консистентное хеширование пользователей по шардам. У каждого шарда replicas точек на кольце,
+    пользователь принадлежит шарду первой точки по часовой стрелке от хеша его ID.
+    При изменении числа шардов переезжает примерно 1/shards пользователей, а не все.
+
+    Args:
+        shards: Число шардов.
+        replicas: Точек на кольце на один шард (больше — равномернее распределение).
+    """
+    def __init__(self, shards: int, replicas: int = 160):
+        if shards < 1:
+            raise ValueError("Число шардов должно быть положительным")
+        self.shards = shards
+        points = sorted((_hash(f"shard-{shard}-{replica}"), shard) for shard in range(shards) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, user_id: int) -> int:
+        """
+        Возвращает номер шарда пользователя.
+
+        Args:
+            user_id: ID пользователя.
+
+        Returns:
+            int: Номер шарда от 0 до shards - 1.
+        """
+        i = bisect.bisect(self._hashes, _hash(str(user_id))) % len(self._hashes)
+        return self._shards[i]
+
+    def owns(self, shard: int) -> Callable[[int], bool]:
+        """
+        Фильтр пользователей одного шарда (для gift_purchase_worker).
+
+        Args:
+            shard: Номер шарда.
+
+        Returns:
+            Callable[[int], bool]: Функция, возвращающая True для пользователей шарда.
+        """
+        return lambda user_id: self.shard_for(user_id) == shard
@@ -0,0 +1,97 @@
+# --- Стандартные библиотеки ---
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+# --- Сторонние библиотеки ---
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+# --- Внутренние модули ---
+from database import load_fsm, save_fsm, delete_expired_fsm
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в базе SQLite бота с LRU-кэшем в памяти.
+    Запись сквозная: каждое изменение сразу сохраняется в базу, поэтому после перезапуска
+    незавершённые сценарии продолжаются. В памяти держатся только maxsize последних сессий,
+    а сессии, не менявшиеся дольше ttl секунд, считаются брошенными и удаляются.
+    """
+    def __init__(
+            self,
+            maxsize: int = 1024,
+            ttl: float = 24 * 3600,
+            cleanup_interval: float = 600,
+            key_builder: Optional[KeyBuilder] = None
+    ):
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache = LRUCache(maxsize)  # key -> (state, data, updated_at)
+        self._write_lock = asyncio.Lock()
+        self._next_cleanup = 0.0
+
+    async def _load(self, key: StorageKey) -> tuple[str | None, dict, float]:
+        """
+        Возвращает запись сессии из кэша или базы. Просроченная запись считается пустой.
+
+        Args:
+            key: Ключ хранилища aiogram.
+
+        Returns:
+            tuple: (состояние, данные, время изменения).
+        """
+        db_key = self.key_builder.build(key)
+        record = self._cache.get(db_key)
+        if record is None:
+            record = await load_fsm(db_key) or (None, {}, 0.0)
+            self._cache.set(db_key, record)
+        if record[2] and record[2] + self.ttl < time.time():
+            record = (None, {}, 0.0)
+            self._cache.set(db_key, record)
+        return record
+
+    async def _save(self, key: StorageKey, state: str | None, data: dict) -> None:
+        """
+        Обновляет запись в кэше и сохраняет её в базу.
+
+        Args:
+            key: Ключ хранилища aiogram.
+            state: Новое состояние.
+            data: Новые данные.
+        """
+        db_key = self.key_builder.build(key)
+        now = time.time()
+        self._cache.set(db_key, (state, data, now))
+        # Запись идёт под общей блокировкой: SQLite всё равно пишет последовательно,
+        # а порядок изменений одной сессии в базе совпадает с порядком вызовов
+        async with self._write_lock:
+            await save_fsm(db_key, state, data, now)
+            if now >= self._next_cleanup:
+                self._next_cleanup = now + self.cleanup_interval
+                removed = await delete_expired_fsm(now - self.ttl)
+                if removed:
+                    logger.info("Удалено брошенных FSM-сессий: %s", removed)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data, _ = await self._load(key)
+        await self._save(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _, _ = await self._load(key)
+        await self._save(key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data, _ = await self._load(key)
+        return data.copy()
+
+    async def close(self) -> None:
+        self._cache.clear()
@@ -0,0 +1,186 @@
+"""
+Трассировка горячего пути покупки: от обнаружения новых подарков до отправки уведомлений.
+
+Трасса открывается воркером, когда в каталоге появились новые подарки (дроп), и собирает спаны
+этапов poll, diff, match, reserve, send_gift, commit, notify с монотонными отметками времени
+относительно начала трассы. Готовые трассы пишутся в JSONL-файл (TRACE_PATH), а их сводки
+можно посмотреть позже:
+
+    python -m utils.tracing traces.jsonl
+    python -m utils.tracing traces.jsonl --drop 1760000000000
+"""
+
+# --- Стандартные библиотеки ---
+import argparse
+import json
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar["Trace | None"] = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """
+    Трасса одного дропа: набор спанов с временем начала и конца в секундах от начала трассы.
+    """
+    def __init__(self, trace_id: int, name: str, started: float, attrs: dict):
+        self.trace_id = trace_id
+        self.name = name
+        self.started = started
+        self.wall_time = time.time() - (time.monotonic() - started)
+        self.attrs = attrs
+        self.spans: list[dict] = []
+
+    def add_span(self, name: str, start: float, end: float, **attrs) -> None:
+        """
+        Добавляет спан по абсолютным отметкам time.monotonic().
+        """
+        span = {"name": name, "start": start - self.started, "end": end - self.started}
+        if attrs:
+            span["attrs"] = attrs
+        self.spans.append(span)
+
+    def summary(self) -> dict:
+        """
+        Сводка по трассе: длительность, суммарное и максимальное время каждого этапа,
+        время от начала трассы до первой успешной отправки подарка и число покупок.
+        """
+        stages = {}
+        for span in self.spans:
+            duration = span["end"] - span["start"]
+            stage = stages.setdefault(span["name"], {"count": 0, "total": 0.0, "max": 0.0})
+            stage["count"] += 1
+            stage["total"] += duration
+            stage["max"] = max(stage["max"], duration)
+        sent = [span for span in self.spans if span["name"] == "send_gift" and span.get("attrs", {}).get("ok")]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "wall_time": self.wall_time,
+            "attrs": self.attrs,
+            "duration": max((span["end"] for span in self.spans), default=0.0),
+            "first_purchase": min((span["end"] for span in sent), default=None),
+            "purchases": len(sent),
+            "stages": stages,
+        }
+
+    def to_dict(self) -> dict:
+        return {**self.summary(), "spans": self.spans}
+
+
+class Tracer:
+    """
+    Сборщик трасс. Пока трасса не открыта в текущем контексте, span() ничего не делает,
+    поэтому спаны можно оставлять в коде, который вызывается и вне дропа (ручные покупки).
+
+    Args:
+        path: JSONL-файл для готовых трасс (None — только в памяти).
+        keep: Сколько последних сводок хранить в памяти.
+    """
+    def __init__(self, path: str | None = None, keep: int = 100):
+        self.path = path
+        self.recent = deque(maxlen=keep)
+
+    def start(self, name: str, started: float | None = None, **attrs) -> Trace:
+        """
+        Открывает трассу и делает её текущей для контекста вызывающего кода.
+
+        Args:
+            name: Название трассы.
+            started: Время начала по time.monotonic() (по умолчанию — сейчас).
+            **attrs: Атрибуты трассы.
+
+        Returns:
+            Trace: Открытая трасса.
+        """
+        # ID — время открытия в миллисекундах: уникален и между перезапусками бота
+        trace = Trace(int(time.time() * 1000), name, time.monotonic() if started is None else started, attrs)
+        _current_trace.set(trace)
+        return trace
+
+    def finish(self, trace: Trace) -> dict:
+        """
+        Закрывает трассу, сохраняет её сводку и пишет трассу в файл.
+
+        Returns:
+            dict: Сводка трассы.
+        """
+        if _current_trace.get() is trace:
+            _current_trace.set(None)
+        summary = trace.summary()
+        self.recent.append(summary)
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.error("Не удалось записать трассу %s: %s", trace.trace_id, e)
+        return summary
+
+    @staticmethod
+    def current() -> Trace | None:
+        return _current_trace.get()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Замеряет этап внутри текущей трассы. Атрибуты можно дополнить внутри блока через
+        возвращаемый словарь.
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            yield attrs
+            return
+        start = time.monotonic()
+        try:
+            yield attrs
+        finally:
+            trace.add_span(name, start, time.monotonic(), **attrs)
+
+
+tracer = Tracer()
+
+
+def format_summary(summary: dict) -> str:
+    """
+    Форматирует сводку трассы для вывода в консоль.
+    """
+    started = time.strftime("%d.%m.%Y %H:%M:%S", time.localtime(summary["wall_time"]))
+    if summary["first_purchase"] is not None:
+        result = f"покупок {summary['purchases']}, первая через {summary['first_purchase'] * 1000:.1f} мс"
+    else:
+        result = "покупок нет"
+    lines = [
+        f"#{summary['trace_id']} {summary['name']} {started} {summary['attrs']}",
+        f"  длительность {summary['duration'] * 1000:.1f} мс, {result}",
+    ]
+    for name, stage in summary["stages"].items():
+        lines.append(
+            f"  {name:<10} ×{stage['count']:<4} всего {stage['total'] * 1000:8.1f} мс, макс {stage['max'] * 1000:8.1f} мс"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сводки трасс дропов")
+    parser.add_argument("path", help="JSONL-файл трасс (TRACE_PATH)")
+    parser.add_argument("--drop", type=int, default=None, help="ID трассы: вывести её спаны полностью")
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as f:
+        traces = [json.loads(line) for line in f if line.strip()]
+    if args.drop is not None:
+        traces = [trace for trace in traces if trace["trace_id"] == args.drop]
+        for trace in traces:
+            print(json.dumps(trace, ensure_ascii=False, indent=2))
+        return
+    for trace in traces:
+        print(format_summary(trace))
+
+if __name__ == "__main__":
+    main()